@@ -0,0 +1,353 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_aio.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: asyncio client for the Vision NPB Web API, used to send many requests to an NPB at once
+# without a thread per request. Requires python 3.5 or later
+# 1. Implements the part of the VisionWebApi interface the ZTP modules use, as coroutines
+# 2. Requests go over a pool of keep-alive HTTP/1.1 connections to the NPB. The number of requests in flight
+#    to a host is limited, requests over the limit wait for a connection to become free. With a limiter of the host,
+#    see ixvision_ztp_limiter.py, its adaptive read and write limits are used instead of a fixed one
+# 3. Authenticates once per client and reuses the token, authenticating again if the token expires
+# 4. Each client owns an event loop. Synchronous code hands it a list of coroutines to run together and gets
+#    a list of results back, see NtoAioClient.run_all(). Threads sharing a session, like parallel policy steps,
+#    take turns at running the loop, while each of them runs its coroutines together
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.  
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import asyncio
+import base64
+import json
+import ssl
+import threading
+import time
+from urllib.parse import quote
+
+from ixvision_ztp_metrics import *
+from ixvision_ztp_limiter import limiter_error_outcome, limiter_url_endpoint
+from ixvision_ztp_logging import log_request
+
+# DEFINE VARs HERE
+
+# Requests in flight to a single NPB host, at most, without a limiter
+aio_host_concurrency_default = 8
+
+# Seconds between checks of a limiter while waiting for it, in case the limit is freed by a request sent from another thread
+aio_limiter_poll_interval = 0.05
+
+# Seconds to wait for a connection, and for a response to a request
+aio_connect_timeout = 30
+aio_request_timeout = 120
+
+# Web API endpoints used by NtoAioClient methods, as (HTTP method, URL template). IDs and names are URL-quoted
+aio_auth_url = '/api/auth'
+aio_api_endpoints = {
+    'getSystem':        ('GET',  '/api/system'),
+    'searchPorts':      ('POST', '/api/ports/search'),
+    'getPort':          ('GET',  '/api/ports/%s'),
+    'getPortProperties':('GET',  '/api/ports/%s?properties=%s'),
+    'modifyPort':       ('PUT',  '/api/ports/%s'),
+    'searchPortGroups': ('POST', '/api/port_groups/search'),
+    'getPortGroup':     ('GET',  '/api/port_groups/%s'),
+    'modifyPortGroup':  ('PUT',  '/api/port_groups/%s'),
+    'searchFilters':    ('POST', '/api/filters/search'),
+    'getFilter':        ('GET',  '/api/filters/%s'),
+    'modifyFilter':     ('PUT',  '/api/filters/%s?allowTemporaryDataLoss=%s'),
+    'getAllNeighbors':  ('POST', '/api/neighbors/search'),
+}
+
+# DEFINE FUNCTIONS HERE
+
+class NtoAioError(Exception):
+    def __init__(self, status, reason, body):
+        Exception.__init__(self, "%d %s: %s" % (status, reason, body[:200].decode('utf-8', 'replace')))
+        self.status = status
+
+# A keep-alive HTTP/1.1 connection to an NPB
+class NtoAioConnection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+    
+    def close(self):
+        self.reusable = False
+        self.writer.close()
+    
+    # Send a request and read the response. Returns a tuple of (status, reason, headers, body)
+    async def request(self, method, url, headers, body):
+        request_lines = ['%s %s HTTP/1.1' % (method, url)] + ['%s: %s' % (name, headers[name]) for name in headers] + ['', '']
+        self.writer.write('\r\n'.join(request_lines).encode('latin-1') + body)
+        await self.writer.drain()
+        
+        status_line = await self.reader.readline()
+        if len(status_line) == 0:
+            raise ConnectionResetError("connection closed by the NPB")
+        status_parts = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        http_version, status, reason = status_parts[0], int(status_parts[1]), status_parts[2] if len(status_parts) > 2 else ''
+        response_headers = {}
+        while True:
+            header_line = await self.reader.readline()
+            if header_line in (b'\r\n', b'\n', b''):
+                break
+            name, value = header_line.decode('latin-1').split(':', 1)
+            response_headers[name.strip().lower()] = value.strip()
+        
+        if 'chunked' in response_headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                chunk_size = int((await self.reader.readline()).split(b';', 1)[0].strip(), 16)
+                if chunk_size == 0:
+                    # Skip trailers up to the empty line
+                    while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(chunk_size))
+                await self.reader.readexactly(2)
+            response_body = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers['content-length']))
+        elif status in (204, 304) or 100 <= status < 200:
+            response_body = b''
+        else:
+            # No length given, the response ends when the NPB closes the connection
+            response_body = await self.reader.read()
+            self.reusable = False
+        
+        if response_headers.get('connection', '').lower() == 'close' or http_version == 'HTTP/1.0':
+            self.reusable = False
+        return (status, reason, response_headers, response_body)
+
+# asyncio session to an NPB
+class NtoAioClient(object):
+    def __init__(self, host, username, password, port=8000, concurrency=aio_host_concurrency_default, use_ssl=True, limiter=None):
+        self.host = host
+        self.port = int(port)
+        self.basic_auth = 'Basic ' + base64.b64encode(('%s:%s' % (username, password)).encode('utf-8')).decode('ascii')
+        self.concurrency = concurrency
+        self.limiter = limiter
+        self.ssl_context = None
+        if use_ssl:
+            # NPBs come with self-signed certificates, same as with VisionWebApi they are not verified
+            self.ssl_context = ssl.create_default_context()
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.loop = asyncio.new_event_loop()
+        self.loop_lock = threading.Lock()   # An event loop can only be run by one thread at a time
+        self.semaphore = None           # Created in the client's event loop, on first use
+        self.limit_released = None
+        self.auth_lock = None
+        self.auth_headers = None
+        self.idle_connections = []
+    
+    # Run a coroutine in the client's event loop until it completes. Must not be called from a coroutine
+    def run(self, coroutine):
+        with self.loop_lock:
+            return self.loop.run_until_complete(coroutine)
+    
+    # Run coroutines together. Returns a list of (result, error) tuples in the same order as the coroutines,
+    # like nto_parallel_map() - exceptions are returned as error strings with result set to None
+    def run_all(self, coroutines):
+        async def gather_all():
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+        if len(coroutines) == 0:
+            return []
+        results = []
+        for result in self.run(gather_all()):
+            if isinstance(result, Exception):
+                results.append((None, "%s: %s" % (type(result).__name__, result)))
+            else:
+                results.append((result, None))
+        return results
+    
+    def close(self):
+        with self.loop_lock:
+            for connection in self.idle_connections:
+                connection.close()
+            self.idle_connections = []
+            if not self.loop.is_closed():
+                self.loop.run_until_complete(asyncio.sleep(0))
+                self.loop.close()
+    
+    async def open_connection(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl_context), aio_connect_timeout)
+        return NtoAioConnection(reader, writer)
+    
+    # Send a request within the limit of requests in flight
+    async def send(self, method, url, headers, body):
+        if self.limiter is None:
+            if self.semaphore is None:
+                self.semaphore = asyncio.Semaphore(self.concurrency)
+            async with self.semaphore:
+                return await self.send_over_connection(method, url, headers, body)
+        
+        if self.limit_released is None:
+            self.limit_released = asyncio.Condition()
+        limit = self.limiter.limit('read' if method == 'GET' or url.endswith('/search') else 'write')
+        async with self.limit_released:
+            while not limit.try_acquire():
+                try:
+                    await asyncio.wait_for(self.limit_released.wait(), aio_limiter_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        call_start = time.time()
+        outcome = 'ok'
+        try:
+            response = await self.send_over_connection(method, url, headers, body)
+            if response[0] == 429 or response[0] >= 500:
+                outcome = 'overload'
+            elif response[0] >= 400:
+                outcome = 'failed'
+            return response
+        except Exception as e:
+            outcome = limiter_error_outcome(e)
+            raise
+        finally:
+            limit.release(time.time() - call_start, outcome, limiter_url_endpoint(method, url))
+            async with self.limit_released:
+                self.limit_released.notify_all()
+    
+    # Send a request over a pooled connection. A reused connection may have been closed by the NPB while idle,
+    # in such case the request is sent once more over a new connection
+    async def send_over_connection(self, method, url, headers, body):
+        while True:
+            reused = len(self.idle_connections) > 0
+            connection = self.idle_connections.pop() if reused else await self.open_connection()
+            try:
+                response = await asyncio.wait_for(connection.request(method, url, headers, body), aio_request_timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if connection.reusable:
+                self.idle_connections.append(connection)
+            else:
+                connection.close()
+            return response
+    
+    # Get an authentication token, if the NPB provides one. Otherwise, every request carries the credentials
+    async def authenticate(self, stale_headers=None):
+        if self.auth_lock is None:
+            self.auth_lock = asyncio.Lock()
+        async with self.auth_lock:
+            # Another request may have authenticated while this one was waiting
+            if self.auth_headers is not None and self.auth_headers is not stale_headers:
+                return self.auth_headers
+            status, reason, headers, body = await self.send('GET', aio_auth_url, self.request_headers({'Authorization': self.basic_auth}), b'')
+            if status >= 400:
+                raise NtoAioError(status, reason, body)
+            if 'x-auth-token' in headers:
+                self.auth_headers = {'Authentication': headers['x-auth-token']}
+            else:
+                self.auth_headers = {'Authorization': self.basic_auth}
+            return self.auth_headers
+    
+    def request_headers(self, extra_headers):
+        headers = {'Host': '%s:%d' % (self.host, self.port), 'Connection': 'keep-alive', 'Accept': 'application/json', 'Content-Type': 'application/json'}
+        headers.update(extra_headers)
+        return headers
+    
+    # Send an authenticated API request, and decode the JSON response
+    async def request(self, name, url_args=(), args=None):
+        method, url_template = aio_api_endpoints[name]
+        url = url_template % tuple(quote(str(url_arg), safe=',') for url_arg in url_args) if len(url_args) > 0 else url_template
+        body = b'' if args is None else json.dumps(args).encode('utf-8')
+        call_start = time.time()
+        status = 'ok'
+        response_body = b''
+        result = None
+        try:
+            auth_headers = self.auth_headers
+            if auth_headers is None:
+                auth_headers = await self.authenticate()
+            headers = self.request_headers(auth_headers)
+            headers['Content-Length'] = str(len(body))
+            response_status, reason, response_headers, response_body = await self.send(method, url, headers, body)
+            if response_status == 401:
+                # The token has expired, authenticate again
+                headers.update(await self.authenticate(auth_headers))
+                response_status, reason, response_headers, response_body = await self.send(method, url, headers, body)
+            if response_status >= 400:
+                status = str(response_status)
+                raise NtoAioError(response_status, reason, response_body)
+            if len(response_body) > 0:
+                result = json.loads(response_body.decode('utf-8'))
+            return result
+        except NtoAioError:
+            raise
+        except Exception as e:
+            status = metrics_error_status(e)
+            raise
+        finally:
+            if nto_metrics.enabled:
+                nto_metrics.record(name, metrics_call_resource(name, ()), time.time() - call_start, status, len(body) + len(response_body))
+            log_request(self.host, name, url_args if args is None else tuple(url_args) + (args,), result, status, time.time() - call_start)
+    
+    # System
+    
+    async def getSystem(self):
+        return await self.request('getSystem')
+    
+    # Ports
+    
+    async def searchPorts(self, terms):
+        return await self.request('searchPorts', args=terms)
+    
+    async def getPort(self, port_id):
+        return await self.request('getPort', (port_id,))
+    
+    async def getPortProperties(self, port_id, properties):
+        return await self.request('getPortProperties', (port_id, properties))
+    
+    async def modifyPort(self, port_id, args):
+        return await self.request('modifyPort', (port_id,), args)
+    
+    async def getAllNeighbors(self):
+        return await self.request('getAllNeighbors', args={})
+    
+    # Port groups
+    
+    async def searchPortGroups(self, terms):
+        return await self.request('searchPortGroups', args=terms)
+    
+    async def getPortGroup(self, pg_id):
+        return await self.request('getPortGroup', (pg_id,))
+    
+    async def modifyPortGroup(self, pg_id, args):
+        return await self.request('modifyPortGroup', (pg_id,), args)
+    
+    # Filters
+    
+    async def searchFilters(self, terms):
+        return await self.request('searchFilters', args=terms)
+    
+    async def getFilter(self, df_id):
+        return await self.request('getFilter', (df_id,))
+    
+    async def modifyFilter(self, df_id, args, allowTemporaryDataLoss=False):
+        return await self.request('modifyFilter', (df_id, 'true' if allowTemporaryDataLoss else 'false'), args)
+    
+    # Modify an object, then read back its details. Returns the details read back
+    async def modify_and_read(self, object_type, object_id, properties):
+        if object_type == 'port':
+            await self.modifyPort(object_id, properties)
+            return await self.getPortProperties(object_id, ','.join(['id', 'name', 'default_name'] + list(properties.keys())))
+        elif object_type == 'port_group':
+            await self.modifyPortGroup(object_id, properties)
+            return await self.getPortGroup(object_id)
+        elif object_type == 'filter':
+            await self.modifyFilter(object_id, properties)
+            return await self.getFilter(object_id)
+        raise ValueError("unsupported object type %s" % object_type)
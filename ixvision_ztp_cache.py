@@ -0,0 +1,230 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_cache.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: On-disk cache of NPB API read responses, shared by ixvztp runs against the same NPB
+# 1. Responses of read requests are kept in <host>_api_cache.json in the current directory, for a time that depends
+#    on the resource: system, ports, port groups, filters or LLDP neighbors. Responses with port link status are never cached
+# 2. A write to an object drops cached responses for that object, and search results of its resource. Bulk property lists
+#    of the resource are updated with the written properties instead, and with properties read back from the object after that
+# 3. Creating or deleting objects, and writes through raw requests, drop all cached responses of the resource.
+#    Writes to any of ports, port groups and filters also drop cached responses of the other two, since they embed each other's
+#    state, like port group membership and filter connections of ports, or members and their modes in port groups
+# 4. The cache file is removed before the first write of a run and saved again at the end of it, so a run that didn't
+#    complete can't leave responses behind that its writes have made stale
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+
+from ixvision_ztp_constants import *
+from ixvision_ztp_metrics import metrics_call_resource
+
+# DEFINE VARs HERE
+
+cache_file_suffix = '_api_cache.json'
+
+# Client methods that read from the NPB, and resources they read. Methods that take an object ID as the first argument
+# read a single object, the others return search results
+cache_read_methods = {'getSystem': 'system', 'getAllNeighbors': 'neighbors',
+                      'searchPorts': 'ports', 'getPort': 'ports', 'getPortProperties': 'ports',
+                      'searchPortGroups': 'port_groups', 'getPortGroup': 'port_groups', 'getPortGroupProperty': 'port_groups',
+                      'searchFilters': 'filters', 'getFilter': 'filters', 'getFilterProperty': 'filters'}
+cache_object_read_methods = ['getPort', 'getPortProperties', 'getPortGroup', 'getPortGroupProperty', 'getFilter', 'getFilterProperty']
+
+# Client methods that modify a single object, taking its ID and properties as arguments
+cache_modify_methods = {'modifyPort': 'ports', 'modifyPortGroup': 'port_groups', 'modifyFilter': 'filters'}
+
+# Resources whose objects change when objects of another resource are written
+cache_dependent_resources = {'ports': ['port_groups', 'filters'], 'port_groups': ['ports', 'filters'], 'filters': ['ports', 'port_groups']}
+
+# Object types as used by NtoWriteBatch, and resources they belong to
+cache_object_type_resources = {'port': 'ports', 'port_group': 'port_groups', 'filter': 'filters'}
+
+# DEFINE FUNCTIONS HERE
+
+# Check if a response carries port link status, which changes too often to be cached
+def cache_has_link_status(value):
+    if isinstance(value, dict):
+        return 'link_status' in value
+    if isinstance(value, list):
+        return any(isinstance(item, dict) and 'link_status' in item for item in value)
+    return False
+
+# Cached read responses for a single NPB
+class NtoResponseCache(object):
+    def __init__(self, host_ip, ttls=cache_ttl_default, refresh=False):
+        self.cache_file = host_ip + cache_file_suffix
+        self.ttls = ttls
+        self.refresh = refresh      # Don't use cached responses, but cache new ones
+        self.lock = threading.Lock()
+        self.entries = {}           # Request key -> {'time', 'resource', 'kind': 'search', 'object' or 'collection', 'object_id', 'value'}
+        self.file_removed = False
+        if not refresh:
+            self.load()
+        atexit.register(self.save)
+
+    def load(self):
+        try:
+            with open(self.cache_file) as f:
+                entries = json.load(f)
+        except Exception:
+            return
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    # Save the responses that haven't expired yet, replacing the cache file only after it is completely written
+    def save(self):
+        with self.lock:
+            now = time.time()
+            entries = dict([(key, entry) for key, entry in self.entries.items() if now - entry['time'] < self.ttls.get(entry['resource'], 0)])
+            try:
+                with open(self.cache_file + '.tmp', 'w') as f:
+                    json.dump(entries, f)
+                os.rename(self.cache_file + '.tmp', self.cache_file)
+            except (IOError, OSError) as e:
+                print("Warning: can't save NPB API cache to %s: %s" % (self.cache_file, e))
+
+    # Return a copy of a cached response, or None if it is not cached or has expired
+    def get(self, key):
+        if self.refresh:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry['time'] >= self.ttls.get(entry['resource'], 0):
+                return None
+            return copy.deepcopy(entry['value'])
+
+    def store(self, key, resource, kind, object_id, value):
+        if self.ttls.get(resource, 0) <= 0 or value is None or cache_has_link_status(value):
+            return
+        with self.lock:
+            self.entries[key] = {'time': time.time(), 'resource': resource, 'kind': kind, 'object_id': object_id, 'value': copy.deepcopy(value)}
+
+    # Update objects in bulk property lists of a resource with properties of one object, only those the lists already include
+    def update_collections(self, resource, object_id, properties):
+        if not isinstance(properties, dict):
+            return
+        with self.lock:
+            for entry in self.entries.values():
+                if entry['resource'] != resource or entry['kind'] != 'collection':
+                    continue
+                for object_details in entry['value']:
+                    if isinstance(object_details, dict) and str(object_details.get('id')) == str(object_id):
+                        for property_name in properties:
+                            if property_name in object_details and property_name != 'link_status':
+                                object_details[property_name] = copy.deepcopy(properties[property_name])
+
+    # Drop responses made stale by a write. Without an object ID, the whole resource is dropped
+    def invalidate(self, resource, object_id=None, properties=None):
+        with self.lock:
+            if not self.file_removed:
+                # Until the run saves the cache at exit, the file on disk may have responses the writes have made stale
+                self.file_removed = True
+                if os.path.exists(self.cache_file):
+                    try:
+                        os.remove(self.cache_file)
+                    except OSError:
+                        pass
+            dropped_resources = cache_dependent_resources.get(resource, [])
+            for key in list(self.entries.keys()):
+                entry = self.entries[key]
+                if entry['resource'] in dropped_resources or resource not in cache_dependent_resources:
+                    del self.entries[key]
+                elif entry['resource'] == resource:
+                    if object_id is None or entry['kind'] == 'search' or entry['kind'] == 'object' and str(entry['object_id']) == str(object_id):
+                        del self.entries[key]
+        if object_id is not None:
+            self.update_collections(resource, object_id, properties)
+
+    def invalidate_object_type(self, object_type, object_id, properties):
+        self.invalidate(cache_object_type_resources[object_type], object_id, properties)
+
+# A client that serves read requests from a response cache and passes all the other requests to an NPB client,
+# invalidating cached responses they might have made stale
+class NtoCachingClient(object):
+    def __init__(self, client, cache):
+        self._client = client
+        self.response_cache = cache
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('__') or not callable(attribute):
+            return attribute
+        def cached_call(*args, **kwargs):
+            return self.call(name, attribute, args, kwargs)
+        return cached_call
+
+    def call(self, method, func, args, kwargs):
+        if method == '_sendRequest':
+            return self.send_request(func, args, kwargs)
+        if method in cache_read_methods:
+            resource = cache_read_methods[method]
+            object_id = None
+            kind = 'search'
+            if method in cache_object_read_methods and len(args) > 0:
+                object_id = str(args[0])
+                kind = 'object'
+            key = json.dumps([method, args, kwargs], sort_keys=True, default=str)
+            result = self.response_cache.get(key)
+            if result is not None:
+                return result
+            result = func(*args, **kwargs)
+            self.response_cache.store(key, resource, kind, object_id, result)
+            if object_id is not None:
+                # Properties read from an object are the most recent ones, bring bulk property lists up to date with them
+                self.response_cache.update_collections(resource, object_id, result)
+            return result
+        if method in cache_modify_methods and len(args) > 1:
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                # The write might have been partially applied, the written properties can't be trusted
+                self.response_cache.invalidate(cache_modify_methods[method], str(args[0]))
+                raise
+            self.response_cache.invalidate(cache_modify_methods[method], str(args[0]), args[1])
+            return result
+        if method.startswith('get') or method.startswith('search'):
+            # Reads of other resources are not cached
+            return func(*args, **kwargs)
+        # Creating and deleting objects, or any other request, changes the resource as a whole
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.response_cache.invalidate(metrics_call_resource(method, args))
+
+    # Raw requests: a GET of a collection is a bulk property list, a GET of an object is an object read, anything else is a write
+    def send_request(self, func, args, kwargs):
+        if len(args) < 2 or args[0] != 'GET':
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.response_cache.invalidate(metrics_call_resource('_sendRequest', args).split('/')[0])
+        resource = metrics_call_resource('_sendRequest', args)
+        object_id = None
+        kind = 'collection'
+        if '/' in resource:
+            resource, object_id = resource.split('/', 1)
+            kind = 'object'
+        key = json.dumps(['_sendRequest', args, kwargs], sort_keys=True, default=str)
+        result = self.response_cache.get(key)
+        if result is not None:
+            return result
+        result = func(*args, **kwargs)
+        if kind == 'collection' and not isinstance(result, list):
+            return result
+        self.response_cache.store(key, resource, kind, object_id, result)
+        return result
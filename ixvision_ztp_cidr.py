@@ -0,0 +1,140 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_cidr.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: IPv4 address list compaction for dynamic filter criteria
+# 1. Addresses and prefixes are parsed into ranges of 32-bit integers: 10.0.0.1, 10.0.0.0/24 and 10.0.0.0/255.255.255.0 are supported
+# 2. Overlapping and adjacent ranges are merged, then ranges of addresses to remove are cut out of them
+# 3. Each range is split back into the smallest number of CIDR prefixes covering exactly the same addresses
+# 4. Values that are not IPv4 addresses or prefixes are kept as they are, after the prefixes
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+# DEFINE VARs HERE
+
+cidr_address_max = 0xffffffff
+
+# DEFINE FUNCTIONS HERE
+
+# Parse an IPv4 address or prefix into a range of addresses, as a tuple of (first, last) integers.
+# Host bits of a prefix are ignored. Returns None if the value is not an IPv4 address or prefix
+def cidr_parse(value):
+    try:
+        address, _, prefix = value.strip().partition('/')
+    except AttributeError:
+        return None
+    address_int = cidr_parse_dotted(address)
+    if address_int is None:
+        return None
+    if prefix == '':
+        prefix_length = 32
+    elif prefix.isdigit() and int(prefix) <= 32:
+        prefix_length = int(prefix)
+    else:
+        # A netmask, like 255.255.255.0, is only valid if its ones are contiguous
+        host_bits = cidr_parse_dotted(prefix)
+        if host_bits is None:
+            return None
+        host_bits = ~host_bits & cidr_address_max
+        if host_bits & (host_bits + 1) != 0:
+            return None
+        prefix_length = 32 - host_bits.bit_length()
+    host_bits = cidr_address_max >> prefix_length
+    return (address_int & ~host_bits & cidr_address_max, address_int | host_bits)
+
+def cidr_parse_dotted(address):
+    octets = address.split('.')
+    if len(octets) != 4 or not all(octet.isdigit() and int(octet) <= 255 for octet in octets):
+        return None
+    address_int = 0
+    for octet in octets:
+        address_int = (address_int << 8) | int(octet)
+    return address_int
+
+def cidr_format_address(address_int):
+    return '%d.%d.%d.%d' % (address_int >> 24, (address_int >> 16) & 0xff, (address_int >> 8) & 0xff, address_int & 0xff)
+
+# Merge overlapping and adjacent ranges. Returns a sorted list of ranges that don't touch each other
+def cidr_merge_ranges(ranges):
+    merged_ranges = []
+    for first, last in sorted(ranges):
+        if len(merged_ranges) > 0 and first <= merged_ranges[-1][1] + 1:
+            if last > merged_ranges[-1][1]:
+                merged_ranges[-1] = (merged_ranges[-1][0], last)
+        else:
+            merged_ranges.append((first, last))
+    return merged_ranges
+
+# Cut ranges out of other ranges, both lists as returned by cidr_merge_ranges()
+def cidr_subtract_ranges(ranges, remove_ranges):
+    remaining_ranges = []
+    remove_index = 0
+    for first, last in ranges:
+        while remove_index < len(remove_ranges) and remove_ranges[remove_index][1] < first:
+            remove_index += 1
+        next_first = first
+        overlap_index = remove_index
+        while overlap_index < len(remove_ranges) and remove_ranges[overlap_index][0] <= last:
+            if remove_ranges[overlap_index][0] > next_first:
+                remaining_ranges.append((next_first, remove_ranges[overlap_index][0] - 1))
+            next_first = max(next_first, remove_ranges[overlap_index][1] + 1)
+            overlap_index += 1
+        if next_first <= last:
+            remaining_ranges.append((next_first, last))
+    return remaining_ranges
+
+# Split a range into the smallest list of CIDR prefixes. Single addresses are written without a prefix length
+def cidr_range_prefixes(first, last):
+    prefixes = []
+    while first <= last:
+        # The largest block that starts at the first address, aligned to its size, and doesn't go past the last one
+        block_size = first & -first if first > 0 else cidr_address_max + 1
+        while block_size > last - first + 1:
+            block_size >>= 1
+        prefix_length = 33 - block_size.bit_length()
+        if prefix_length == 32:
+            prefixes.append(cidr_format_address(first))
+        else:
+            prefixes.append('%s/%d' % (cidr_format_address(first), prefix_length))
+        first += block_size
+    return prefixes
+
+# Compact a list of IPv4 addresses and prefixes into the smallest equivalent list of CIDR prefixes, sorted by address
+# Input
+# - List of addresses and prefixes
+# - List of addresses and prefixes to exclude from the result, even if they are a part of a larger prefix in the first list
+# Returns the list of prefixes, followed by values that are not IPv4 addresses, in their original order without duplicates
+def cidr_compact(values, remove_values=[]):
+    ranges = []
+    other_values = []
+    for value in values:
+        value_range = cidr_parse(value)
+        if value_range is not None:
+            ranges.append(value_range)
+        else:
+            other_values.append(value)
+    remove_ranges = []
+    remove_other_values = set()
+    for value in remove_values:
+        value_range = cidr_parse(value)
+        if value_range is not None:
+            remove_ranges.append(value_range)
+        else:
+            remove_other_values.add(value)
+    prefixes = []
+    for first, last in cidr_subtract_ranges(cidr_merge_ranges(ranges), cidr_merge_ranges(remove_ranges)):
+        prefixes.extend(cidr_range_prefixes(first, last))
+    seen_other_values = set()
+    for value in other_values:
+        if value not in seen_other_values and value not in remove_other_values:
+            seen_other_values.add(value)
+            prefixes.append(value)
+    return prefixes
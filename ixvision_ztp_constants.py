@@ -0,0 +1,75 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_constants.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Supported modes and defaults shared by the launcher and the action modules
+# This module doesn't import anything, so the launcher can build its command line parser without loading
+# the action modules and the NPB API library, which are only imported by the action that runs
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.  
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+# DEFINE VARs HERE
+port_modes_supported = {'net': 'NETWORK', 'tool': 'TOOL'}
+df_connection_modes_supported = {'input': 'NETWORK', 'output': 'TOOL'}
+df_criteria_fields_supported = {'ip': 'ipv4_src_or_dst', 'ip-src': 'ipv4_src', 'ip-dst': 'ipv4_dst'}
+pg_modes_supported = {'net': 'INTERCONNECT', 'lb': 'LOAD_BALANCE'}
+
+# Criteria field values loaded from plain text files, one value per line, go under this key, like {'addr': ['10.0.0.1', ...]}
+df_criteria_text_values_key = 'addr'
+
+# NOTE - Priority-based filtering mode is not supported, but we don't check if the system is in such mode
+df_modes_supported = {'all': 'PASS_ALL', 'none': 'DISABLE', 'pbc': 'PASS_BY_CRITERIA', 'dbc': 'DENY_BY_CRITERIA', 'pbcu': 'PBC_UNMATCHED', 'dbcm': 'DBC_MATCHED'}
+
+# Default number of requests an action runs in parallel against an NPB, at most. How many of them are actually in flight
+# at a time is decided by the adaptive limiters of the NPB, see ixvision_ztp_limiter.py
+nto_workers_default = 16
+
+# Link state polling: how long to wait for a link to come up, and how often to poll a port that is still down.
+# Polling starts with the initial interval, which grows by the backoff factor after each poll up to the max interval
+link_wait_timeout_default = 15
+link_poll_interval_initial = 1.0
+link_poll_interval_max = 4.0
+link_poll_backoff = 1.5
+
+# How long NPB API read responses are kept in the on-disk cache, in seconds, per resource. Resources not listed are not cached
+cache_ttl_default = {'system': 600, 'ports': 120, 'port_groups': 120, 'filters': 120, 'neighbors': 30}
+
+# How long NPB capabilities, like the software version, are kept on disk, in seconds
+capability_ttl_default = 86400
+
+# Policy: default number of steps to run at the same time
+policy_jobs_default = 4
+
+# Fleet mode: default number of NPBs to run an action on in parallel
+fleet_jobs_default = 8
+
+# Environment variable with the NPB password, used when -p is not given. Fleet mode passes passwords to NPB runs this way,
+# so they don't show in the process list
+password_environment_variable = 'IXVZTP_PASSWORD'
+
+# Watch mode: default interval between polling cycles and random jitter added to it, in seconds
+watch_interval_default = 60
+watch_jitter_default = 5
+
+# Parts of the NPB state that each action reads and modifies. Actions not listed here can't be used in watch mode
+watch_action_dependencies = {
+    'lldptag':  {'reads': ['neighbors'],                           'modifies': ['ports']},
+    'portmode': {'reads': ['ports'],                               'modifies': ['ports']},
+    'pgform':   {'reads': ['ports', 'port_groups'],                'modifies': ['ports', 'port_groups']},
+    'dfform':   {'reads': ['ports', 'port_groups', 'filters'],     'modifies': ['ports', 'filters']},
+    'dfupdate': {'reads': ['filters'],                             'modifies': ['filters']},
+}
+
+# DEFINE FUNCTIONS HERE
+
+# Check if DF mode used requires a criteria
+def df_criteria_required(df_mode):
+    return df_mode in df_modes_supported and (df_mode == 'pbc' or df_mode == 'dbc')
@@ -13,6 +13,8 @@
 # 3. Update the DF criteria with provided rules
 # 4. Search for network port group with a specified name and, if found, connect it to the input of the DF
 # 5. Search for tool port group with a specified name and, if found, connect it to the output of the DF
+# 6. All the changes are planned first, and only those that differ from the current DF configuration are sent to the NPB,
+#    in a single write. With a dry run, the plan is printed without changing anything
 #
 # COPYRIGHT 2018 - 2019 Keysight Technologies.
 #
@@ -21,20 +23,22 @@
 #
 ###############################################################################
 
+import copy
+import itertools
+
 from ksvisionlib import *
 
 from ixvision_ztp_ntolib import *
 
+from ixvision_ztp_plan import *
+
+from ixvision_ztp_cidr import *
+
 # DEFINE VARs HERE
-# NOTE - Priority-based filtering mode is not supported, but we don't check if the system is in such mode
-df_modes_supported = {'all': 'PASS_ALL', 'none': 'DISABLE', 'pbc': 'PASS_BY_CRITERIA', 'dbc': 'DENY_BY_CRITERIA', 'pbcu': 'PBC_UNMATCHED', 'dbcm': 'DBC_MATCHED'}
+# Supported filter modes are listed in ixvision_ztp_constants.py
 
 # DEFINE FUNCTIONS HERE
 
-# Check if DF mode used requires a criteria
-def df_criteria_required(df_mode):
-    return df_mode in df_modes_supported and (df_mode == 'pbc' or df_mode == 'dbc')
-
 ## Search for port groups and return a list if IDs
 def search_port_group_id_list(nto, params):
     pg_id_list = []
@@ -52,6 +56,98 @@ def remove_empty_port_groups_from_id_list(nto, pg_id_list):
             non_empty_pg_id_list.append(pg_id)
     return non_empty_pg_id_list
 
+## Append IDs to a list, keeping the existing order and skipping IDs already in it
+def merge_id_list(id_list, new_id_list):
+    merged_id_list = list(id_list or [])
+    for new_id in new_id_list:
+        if new_id not in merged_id_list:
+            merged_id_list.append(new_id)
+    return merged_id_list
+
+## A hashable key to compare criteria values by. Values like IP addresses are used as they are, structured ones as their JSON form
+def criteria_value_key(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+## Merge values of a criteria field: current values followed by the appended ones, in their original order,
+## without duplicates and without the values to remove
+def merge_criteria_values(current_values, append_values, remove_values):
+    remove_value_keys = set(criteria_value_key(value) for value in remove_values)
+    merged_values = []
+    merged_value_keys = set()
+    for value in list(current_values) + list(append_values):
+        value_key = criteria_value_key(value)
+        if value_key in merged_value_keys or value_key in remove_value_keys:
+            continue
+        merged_value_keys.add(value_key)
+        merged_values.append(value)
+    return merged_values
+
+## Count values added to and removed from a criteria field, comparing its values before and after an update key by key
+## Returns a tuple of counts (added, removed)
+def criteria_value_changes(current_values, updated_values):
+    added_count = 0
+    removed_count = 0
+    for key in set(current_values.keys()) | set(updated_values.keys()):
+        if not isinstance(current_values.get(key, []), list) or not isinstance(updated_values.get(key, []), list):
+            continue
+        current_value_keys = set(criteria_value_key(value) for value in current_values.get(key, []))
+        updated_value_keys = set(criteria_value_key(value) for value in updated_values.get(key, []))
+        added_count += len(updated_value_keys - current_value_keys)
+        removed_count += len(current_value_keys - updated_value_keys)
+    return (added_count, removed_count)
+
+## Load criteria field values to append or remove from a file. A JSON file is a dict of criteria field keys to lists of values,
+## like {"addr": ["10.0.0.1", "10.0.0.2"]}, or just a list of values. Any other file is read line by line as plain text,
+## one value per line, where empty lines and everything after # are ignored. Values from a plain list go under the 'addr' key
+## Returns a dict of values, or None if the file can't be read or parsed
+def load_criteria_values(filename):
+    try:
+        with open(filename) as f:
+            first_line = f.readline()
+            while first_line != '' and first_line.strip() == '':
+                first_line = f.readline()
+            if first_line.lstrip().startswith(('{', '[')):
+                f.seek(0)
+                try:
+                    values = json.load(f)
+                except ValueError as e:
+                    print("Error: can't parse filter values from %s: %s" % (filename, e))
+                    return None
+            else:
+                values = []
+                for line in itertools.chain([first_line], f):
+                    value = line.split('#', 1)[0].strip()
+                    if value != '':
+                        values.append(value)
+    except (IOError, OSError) as e:
+        print("Error: can't read from %s: %s" % (filename, e))
+        return None
+    if isinstance(values, list):
+        return {df_criteria_text_values_key: values}
+    if not isinstance(values, dict):
+        print("Error: filter values in %s must be a list, or a dict of criteria field keys and values" % filename)
+        return None
+    return values
+
+## Compact IP addresses of all IP criteria fields into the smallest equivalent set of CIDR prefixes, in place.
+## With a capacity, warn about criteria fields that have more entries than that
+def compact_criteria_addresses(df_name, df_criteria, compact, capacity=None):
+    for df_criterion in sorted(set(df_criteria_fields_supported.values())):
+        criterion_values = df_criteria.get(df_criterion)
+        if not isinstance(criterion_values, dict) or not isinstance(criterion_values.get(df_criteria_text_values_key), list):
+            continue
+        if compact:
+            addresses = criterion_values[df_criteria_text_values_key]
+            criterion_values[df_criteria_text_values_key] = cidr_compact(addresses)
+            print("Compacted %s criteria field of filter %s from %d to %d entries" % (df_criterion, df_name, len(addresses), len(criterion_values[df_criteria_text_values_key])))
+        check_criteria_capacity(df_name, df_criterion, len(criterion_values[df_criteria_text_values_key]), capacity)
+
+def check_criteria_capacity(df_name, df_criterion, entry_count, capacity):
+    if capacity is not None and entry_count > capacity:
+        print("Warning: %s criteria field of filter %s has %d entries, over the capacity of %d" % (df_criterion, df_name, entry_count, capacity))
+
 ## Filter create/update
 
 # Input 
@@ -60,8 +156,10 @@ def remove_empty_port_groups_from_id_list(nto, pg_id_list):
 # - Network port group name
 # - Tool port group name
 # - DF mode - use keys from df_modes_supported global dict
+# - Compact IP criteria into CIDR prefixes, and the number of criteria entries to warn about
+# Returns False if the filter could not be formed
 
-def form_dynamic_filter(host_ip, port, username, password, df_name, df_input, df_output, df_mode, df_criteria = {}, use_tag_mode = False):
+def form_dynamic_filter(host_ip, port, username, password, df_name, df_input, df_output, df_mode, df_criteria = {}, use_tag_mode = False, dry_run = False, compact = False, capacity = None):
     
     df_params = {}
     df_mode_value = 'DISABLE'                           # Default DF mode value for a new filter to use, if not overridden
@@ -71,50 +169,30 @@ def form_dynamic_filter(host_ip, port, username, password, df_name, df_input, df
         
     if df_criteria_required(df_mode) and (isinstance(df_criteria, dict) and len(df_criteria) == 0 or not isinstance(df_criteria, dict)):
         print("Non-empty criteria are required for filter mode %s" % (df_mode))
-        return
+        return False
                 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_filter_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
+    plan = NtoPlan(nto)
 
-    # Search for existing DF, create a new one if not found
+    # Search for existing DF. Its current details are the state the plan is compared with, a new filter starts from scratch
     df_list = nto.searchFilters({'name': df_name})
-    ztp_df = None
-    ztp_df_source_port_group_id_list = []
-    ztp_df_dest_port_group_id_list = []
+    df_details = {}
     if len(df_list) == 0:
         # No existing filter with such name, will create a new one
+        print("No existing DF found, will create a new one")
         df_params.update({'name': df_name, 'keywords': ['ZTP'], 'mode': df_mode_value})
         if isinstance(df_criteria, dict) and len(df_criteria) > 0:
             df_params.update({'criteria': df_criteria})
-        new_df = nto.createFilter(df_params, True) # the last parameter is for allowTemporayDataLoss
-        if new_df is not None and len(new_df) > 0:
-            print("No existing DF found, created a new one with id %s" % (str(new_df['id'])))
-            ztp_df = new_df
-        else:
-            print("No existing DF found, failed to created a new one!")
-            return
     elif len(df_list) == 1:
         # An existing DF found
         df = df_list[0]
         df_details = nto.getFilter(str(df['id'])) # TODO handle 404 not found situation
-        ztp_df = df
-        ztp_df_source_port_group_id_list = df_details['source_port_group_list']
-        ztp_df_dest_port_group_id_list = df_details['dest_port_group_list']
         print("Found an existing DF %s in %s mode" % (df_details['default_name'], df_details['mode']))
-        df_needs_updating = False
         # TODO update keywords with ZTP
-        if df_mode_value != df_details['mode']:
-            print("Updating DF %s to a new mode %s" % (df_details['default_name'], df_mode_value))
-            df_params.update({'mode': df_mode_value})
-            df_needs_updating = True
+        df_params.update({'mode': df_mode_value})
         if isinstance(df_criteria, dict) and len(df_criteria) > 0:
             df_criteria.update(df_details['criteria'])
-            if df_criteria != df_details['criteria']:
-                print("Updating DF %s criteria" % (df_details['default_name']))
-                df_params.update({'criteria': df_criteria})
-                df_needs_updating = True
-        if df_needs_updating:
-            nto.modifyFilter(str(df['id']), df_params)
-        # TODO handle errors
+            df_params.update({'criteria': df_criteria})
     else:
         # This should never happen, but just in case, provide details to look into
         print("Found more than one DF named %s, can't continue:" % (df_name)),
@@ -123,65 +201,121 @@ def form_dynamic_filter(host_ip, port, username, password, df_name, df_input, df
             if df_details is not None:
                 print (" %s," % (df_details['default_name'])),
         print("")
-        return
+        return False
         
-    # TODO update DF criteria
-    
+    connected_port_id_list = []
     if not use_tag_mode:
         # Search for network and tool port groups matching given names. 
         # Make sure they are not empty before connecting to filters, since ports can't be added later to an empty but connected port group
-            
-        ztp_df_source_port_group_id_list.extend(remove_empty_port_groups_from_id_list(nto, search_port_group_id_list(nto, {'name': df_input})))
-        ztp_df_dest_port_group_id_list.extend  (remove_empty_port_groups_from_id_list(nto, search_port_group_id_list(nto, {'name': df_output})))
-    
-        # TODO update DF connections only if there is an actual change in list of PGs connected to it
-        df_params.update({'source_port_group_list': ztp_df_source_port_group_id_list, 'dest_port_group_list': ztp_df_dest_port_group_id_list})
-        nto.modifyFilter(str(ztp_df['id']), df_params)
+        for df_property, pg_name in [('source_port_group_list', df_input), ('dest_port_group_list', df_output)]:
+            pg_id_list = search_port_group_id_list(nto, {'name': pg_name})
+            if len(pg_id_list) == 0:
+                print("Error: can't find port group %s to connect to filter %s" % (pg_name, df_name))
+                return False
+            df_params.update({df_property: merge_id_list(df_details.get(df_property), remove_empty_port_groups_from_id_list(nto, pg_id_list))})
+    else:
+        # Connect input and output ports using tags
+        for df_property, df_tags, connection_mode in [('source_port_list', df_input, 'input'), ('dest_port_list', df_output, 'output')]:
+            matching_port_id_list = df_tag_connection_candidates(nto, [df_tags], connection_mode)
+            if matching_port_id_list is None:
+                return False
+            df_params.update({df_property: merge_id_list(df_details.get(df_property), matching_port_id_list)})
+            connected_port_id_list.extend(matching_port_id_list)
+
+    if 'criteria' in df_params:
+        compact_criteria_addresses(df_name, df_params['criteria'], compact, capacity)
+
+    # Mode, criteria and connections go to the NPB as a single write, and only if they differ from the current ones
+    if len(df_list) == 0:
+        plan.create('filter', df_name, df_params)
     else:
-        # Connect input ports using tags
-        df_connect_via_tags(nto, str(ztp_df['id']), [df_input], 'input')
-        # Connect output ports using tags
-        df_connect_via_tags(nto, str(ztp_df['id']), [df_output], 'output')
+        plan.modify('filter', df_details['id'], df_details['default_name'], df_details, df_params)
+    
+    plan.show()
+    if dry_run or len(plan) == 0:
+        return True
+    if plan.apply() is None:
+        return False
+    # Connected ports now have the filter in their filter lists
+    port_inventory = nto_port_inventory(nto)
+    for port_id in connected_port_id_list:
+        port_inventory.invalidate(port_id)
+    return True
+
+# Input
+# - Connection to an NPB
+# - Dynamic filter name
+# - Criteria field to update, a key of df_criteria_fields_supported
+# - Values to append to and to remove from the criteria field
+# - Compact IP criteria into CIDR prefixes, and the number of criteria entries to warn about
+# Returns False if the filter could not be updated
 
-def update_dynamic_filter(host_ip, port, username, password, df_name, df_criteria_field, df_append_values, df_remove_values):
+def update_dynamic_filter(host_ip, port, username, password, df_name, df_criteria_field, df_append_values, df_remove_values, compact = False, capacity = None):
     df_criterion = None
     if isinstance(df_criteria_fields_supported, dict) and df_criteria_field in df_criteria_fields_supported.keys():
         df_criterion = df_criteria_fields_supported[df_criteria_field]
     else:
         print("Error: unsupported filter criteria %s" % df_criteria_field)
-        return
+        return False
         
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_filter_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
 
     # Search for the DF
     df_list = nto.searchFilters({'name': df_name})
     if len(df_list) == 0:
         # No existing filter with such name
         print("Error: can't find a dynamic filter with name %s" % df_name)
-        return
+        return False
     elif len(df_list) == 1:
         # An existing DF found
         df = df_list[0]
-        df_criteria = nto.getFilterProperty(str(df['id']), 'criteria') # TODO handle 404 not found situation
+        df_criteria = copy.deepcopy(nto.getFilterProperty(str(df['id']), 'criteria')) # TODO handle 404 not found situation
         if df_criterion not in df_criteria.keys():
             print("Criteria field %s is not in use by filter %s" % (df_criterion, df_name))
-            return
+            return False
+        
+        # Keys of the criteria field already in use come first, followed by the new ones from the values to append
+        criterion_values = df_criteria[df_criterion]
+        updated_values = {}
+        for key in list(criterion_values.keys()) + sorted([key for key in df_append_values.keys() if key not in criterion_values]):
+            current_values = criterion_values.get(key)
+            append_values = df_append_values.get(key, [])
+            if isinstance(current_values, list) or current_values is None and isinstance(append_values, list):
+                merged_values = merge_criteria_values(current_values or [], append_values, df_remove_values.get(key, []))
+                if key == df_criteria_text_values_key:
+                    if compact:
+                        # Addresses to remove are cut out of prefixes that include them
+                        compacted_values = cidr_compact(list(current_values or []) + list(append_values), df_remove_values.get(key, []))
+                        print("Compacted %s criteria field of filter %s from %d to %d entries" % (df_criterion, df_name, len(merged_values), len(compacted_values)))
+                        merged_values = compacted_values
+                    check_criteria_capacity(df_name, df_criterion, len(merged_values), capacity)
+            elif key in df_append_values.keys():
+                merged_values = append_values
+            else:
+                continue
+            if merged_values != current_values:
+                updated_values[key] = merged_values
+        
+        if len(updated_values) == 0:
+            print("Filter %s already has all the values for %s criteria field, no update needed" % (df_name, df_criterion))
+            return True
         
-        for key in df_criteria[df_criterion]:
-            if key in df_append_values.keys():
-                if isinstance(df_criteria[df_criterion][key], list):
-                    df_criteria[df_criterion][key].extend(df_append_values[key])
-                else:
-                    df_criteria[df_criterion][key] = df_append_values[key]
-            if key in df_remove_values.keys():
-                if isinstance(df_criteria[df_criterion][key], list):
-                    for value in df_remove_values[key]:
-                        if value in df_criteria[df_criterion][key]:
-                            df_criteria[df_criterion][key].remove(value)
-                    
-        nto.modifyFilter(str(df['id']), {'criteria': df_criteria})
-        # TODO validate the update was successful
-        print("Updated filter %s with new values for %s criteria field" % (df_name, df_criterion))
+        # Criteria are replaced as a whole by the NPB, the other fields go back as they were. The filter is read back to verify the update
+        df_criteria[df_criterion] = dict(criterion_values, **updated_values)
+        df_batch = NtoWriteBatch(nto, 'filter')
+        df_batch.stage(df['id'], {'criteria': df_criteria})
+        with nto_metrics.phase('write'):
+            df_result = df_batch.flush()[df['id']]
+        if not df_result['verified']:
+            if df_result['error'] is not None:
+                print("Updating filter %s failed: %s" % (df_name, df_result['error']))
+            else:
+                print("Updating filter %s failed!" % df_name)
+            return False
+        # Counts are of the values now in the filter, after compaction
+        added_count, removed_count = criteria_value_changes(criterion_values, df_result['details']['criteria'].get(df_criterion, {}))
+        print("Updated filter %s with new values for %s criteria field: %d added, %d removed" % (df_name, df_criterion, added_count, removed_count))
+        return True
         
     else:
         # This should never happen, but just in case, provide details to look into
@@ -191,4 +325,4 @@ def update_dynamic_filter(host_ip, port, username, password, df_name, df_criteri
             if df_details is not None:
                 print (" %s," % (df_details['default_name'])),
         print("")
-        return
+        return False
@@ -0,0 +1,114 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_fleet.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Run the same action against a fleet of NPBs
+# 1. Starting point is an inventory of NPBs - a JSON list of hosts with optional port and credentials
+# 2. Each NPB is handled by a separate ixvztp process, up to a configured number of them in parallel
+# 3. Output of each process is printed as a single block as soon as the process finishes
+# 4. Summary table with results for all NPBs is printed at the end
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.  
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import subprocess
+import time
+from multiprocessing.pool import ThreadPool
+
+from ixvision_ztp_constants import *
+
+# DEFINE VARs HERE
+
+# DEFINE FUNCTIONS HERE
+
+# Validate inventory entries and fill in missing port and credentials with defaults
+# Input
+# - Inventory: a list of dicts with 'hostname' and optional 'port', 'username', 'password'
+# - Default port and credentials
+# Returns a list of complete host entries, or None if the inventory is not valid
+def fleet_hosts_from_inventory(inventory, port, username, password):
+    if not isinstance(inventory, list) or len(inventory) == 0:
+        print("Error: inventory must be a non-empty list of hosts")
+        return None
+    fleet_hosts = []
+    for entry in inventory:
+        if not isinstance(entry, dict) or 'hostname' not in entry:
+            print("Error: inventory entry %s doesn't have a hostname" % entry)
+            return None
+        fleet_host = {'hostname': entry['hostname'], 'port': str(entry.get('port', port)), \
+                      'username': entry.get('username', username), 'password': entry.get('password', password)}
+        if fleet_host['username'] is None or fleet_host['password'] is None:
+            print("Error: no credentials for %s in the inventory or on the command line" % fleet_host['hostname'])
+            return None
+        fleet_hosts.append(fleet_host)
+    return fleet_hosts
+
+# Run an action against a single NPB in a separate ixvztp process, capturing its output.
+# The password goes to the process in its environment rather than on its command line
+def fleet_run_host(launcher, fleet_host, action_argv):
+    command = [sys.executable, launcher, '-u', fleet_host['username'], \
+               '-d', fleet_host['hostname'], '-r', fleet_host['port']] + action_argv
+    environment = dict(os.environ)
+    environment[password_environment_variable] = fleet_host['password']
+    start_time = time.time()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=environment)
+        output = process.communicate()[0]
+        if not isinstance(output, str):
+            output = output.decode('utf-8', 'replace')
+        returncode = process.returncode
+    except Exception as e:
+        output = "Error: can't start ixvztp: %s\n" % e
+        returncode = -1
+    return {'hostname': fleet_host['hostname'], 'returncode': returncode, 'output': output, 'elapsed': time.time() - start_time}
+
+# Run an action against all NPBs from the inventory
+# Input
+# - Path to the ixvztp launcher
+# - List of hosts, as returned by fleet_hosts_from_inventory()
+# - Action and its arguments, as they would be given on the ixvztp command line
+# - Number of NPBs to work on in parallel
+# Returns True if the action succeeded on all NPBs
+def run_fleet(launcher, fleet_hosts, action_argv, jobs=fleet_jobs_default):
+    print("Starting %s for %d hosts, %d at a time" % (" ".join(action_argv), len(fleet_hosts), jobs))
+    start_time = time.time()
+    fleet_results = {}  # Inventory index -> result, the same host might be listed more than once
+    pool = ThreadPool(max(1, min(jobs, len(fleet_hosts))))
+    try:
+        for host_index, result in pool.imap_unordered(lambda host_entry: (host_entry[0], fleet_run_host(launcher, host_entry[1], action_argv)), enumerate(fleet_hosts)):
+            fleet_results[host_index] = result
+            print('')
+            print("===== %s: %s in %.1f seconds (%d of %d done)" % (result['hostname'], fleet_result_status(result), result['elapsed'], len(fleet_results), len(fleet_hosts)))
+            sys.stdout.write(result['output'])
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+    
+    # Summary table, in the inventory order
+    hostname_width = max([len('Host')] + [len(fleet_host['hostname']) for fleet_host in fleet_hosts])
+    print('')
+    print("%s  %-6s  %5s  %8s" % ('Host'.ljust(hostname_width), 'Result', 'Exit', 'Time, s'))
+    failed_count = 0
+    for host_index, fleet_host in enumerate(fleet_hosts):
+        result = fleet_results[host_index]
+        if result['returncode'] != 0:
+            failed_count += 1
+        print("%s  %-6s  %5d  %8.1f" % (fleet_host['hostname'].ljust(hostname_width), fleet_result_status(result), result['returncode'], result['elapsed']))
+    print('')
+    print("Completed on %d of %d hosts in %.1f seconds" % (len(fleet_hosts) - failed_count, len(fleet_hosts), time.time() - start_time))
+    return failed_count == 0
+
+def fleet_result_status(result):
+    if result['returncode'] == 0:
+        return 'OK'
+    return 'FAILED'
@@ -0,0 +1,193 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_limiter.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Adaptive limit of NPB API requests in flight, to keep the management plane of an NPB responsive
+# 1. Each NPB host has two limits, for read and for write requests. A request over the limit waits for another one to complete
+# 2. Limits follow AIMD: while requests complete in time, a limit in use grows by one request per limit's worth of completed requests.
+#    An overload - HTTP 429 or 5xx, a timeout, or latency of an endpoint growing well above the lowest one seen for the same
+#    endpoint - cuts the limit by a factor, at most once per round trip. Latency is tracked per endpoint, since a bulk read
+#    or a write that commits configuration takes much longer than a read of a single port, even on an idle NPB.
+#    Other errors, like 404 or a request that couldn't be sent, say nothing about the load of the NPB
+# 3. Worker counts given to actions become an upper bound, the limiters decide how many of the workers send requests at a time
+# 4. State of the limiters of every NPB is included in the run report
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import re
+import threading
+import time
+
+from ixvision_ztp_metrics import metrics_error_status
+
+# DEFINE VARs HERE
+
+# Limit of requests in flight, per kind of request: initial, lowest and highest values
+limiter_limits_default = {
+    'read':  {'initial': 8, 'minimum': 1, 'maximum': 16},
+    'write': {'initial': 4, 'minimum': 1, 'maximum': 8},
+}
+
+# Multiplicative decrease of a limit on overload
+limiter_decrease_factor = 0.5
+
+# Latency is an overload when its moving average exceeds the lowest latency seen times the tolerance, plus the slack in seconds
+limiter_latency_tolerance = 4.0
+limiter_latency_slack = 0.05
+limiter_latency_smoothing = 0.2
+
+# Errors without an HTTP status that are timeouts, by exception type name or message
+limiter_timeout_pattern = re.compile(r'timeout|timed out', re.IGNORECASE)
+
+# DEFINE FUNCTIONS HERE
+
+# Kind of an NPB API request by client method: 'read' or 'write'. Raw requests are reads only if they GET
+def limiter_request_kind(method, args):
+    if method == '_sendRequest':
+        return 'read' if len(args) > 0 and args[0] == 'GET' else 'write'
+    if method.startswith('get') or method.startswith('search'):
+        return 'read'
+    return 'write'
+
+# Endpoint of a raw HTTP request whose latency is tracked separately, like 'GET /api/ports' for a bulk read,
+# or 'PUT /api/ports/{id}' for a write to any port
+def limiter_url_endpoint(http_method, url):
+    path_parts = url.split('?', 1)[0].strip('/').split('/')
+    if len(path_parts) > 2 and path_parts[2] != 'search':
+        path_parts[2] = '{id}'
+    return "%s /%s" % (http_method, '/'.join(path_parts))
+
+# Endpoint of an NPB API request by client method: the method itself, or the HTTP method and path of raw requests
+def limiter_endpoint(method, args):
+    if method == '_sendRequest' and len(args) > 1:
+        return limiter_url_endpoint(args[0], args[1])
+    return method
+
+# Outcome of a request that failed: 'overload' if the NPB is struggling to keep up - HTTP 429, 5xx or a timeout, 'failed' for any other error
+def limiter_error_outcome(error):
+    status = metrics_error_status(error)
+    if status == '429' or status.startswith('5'):
+        return 'overload'
+    if status == 'error' and (limiter_timeout_pattern.search(type(error).__name__) is not None or limiter_timeout_pattern.search(str(error)) is not None):
+        return 'overload'
+    return 'failed'
+
+# AIMD limit of requests in flight. Shared by threads, and by an asyncio client through try_acquire()
+class NtoConcurrencyLimit(object):
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.overloads = 0
+        self.decreases = 0
+        self.waits = 0
+        self.latency_average = None     # Of all requests, to tell how long a round trip takes
+        self.endpoint_latencies = {}    # Endpoint -> {'min', 'average'} latency of its requests
+        self.last_decrease = 0.0
+
+    def try_acquire(self):
+        with self.condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return True
+
+    # Wait until a request can be sent
+    def acquire(self):
+        with self.condition:
+            if self.in_flight >= int(self.limit):
+                self.waits += 1
+                while self.in_flight >= int(self.limit):
+                    self.condition.wait()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    # Adjust the limit after a request has completed
+    # Input
+    # - Seconds the request took
+    # - Outcome: 'ok', 'overload' or 'failed'. Failed requests, like 404, say nothing about the load of the NPB
+    # - Endpoint of the request, see limiter_endpoint()
+    def release(self, latency, outcome, endpoint=None):
+        with self.condition:
+            limit_used = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            self.requests += 1
+            if outcome == 'ok':
+                self.latency_average = latency if self.latency_average is None else \
+                    self.latency_average + limiter_latency_smoothing * (latency - self.latency_average)
+                endpoint_latency = self.endpoint_latencies.get(endpoint)
+                if endpoint_latency is None:
+                    self.endpoint_latencies[endpoint] = {'min': latency, 'average': latency}
+                else:
+                    endpoint_latency['min'] = min(endpoint_latency['min'], latency)
+                    endpoint_latency['average'] += limiter_latency_smoothing * (latency - endpoint_latency['average'])
+                    if endpoint_latency['average'] > endpoint_latency['min'] * limiter_latency_tolerance + limiter_latency_slack:
+                        outcome = 'overload'
+            if outcome == 'overload':
+                self.overloads += 1
+                # Requests already in flight when the limit was cut complete with the same overload, the limit is cut once per round trip
+                now = time.time()
+                if now - self.last_decrease >= (self.latency_average or 0.0):
+                    self.limit = max(float(self.minimum), self.limit * limiter_decrease_factor)
+                    self.decreases += 1
+                    self.last_decrease = now
+            elif outcome == 'ok' and limit_used:
+                # Only a limit that was reached is known to be safe to grow
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def state(self):
+        with self.condition:
+            return {'limit': int(self.limit), 'minimum': self.minimum, 'maximum': self.maximum, 'in_flight': self.in_flight,
+                    'max_in_flight': self.max_in_flight, 'requests': self.requests, 'waits': self.waits, 'overloads': self.overloads,
+                    'decreases': self.decreases, 'latency_average': round(self.latency_average or 0.0, 6),
+                    'endpoints': dict([(str(endpoint), {'min': round(self.endpoint_latencies[endpoint]['min'], 6), 'average': round(self.endpoint_latencies[endpoint]['average'], 6)})
+                                       for endpoint in self.endpoint_latencies])}
+
+# Read and write limits of a single NPB host
+class NtoHostLimiter(object):
+    def __init__(self, limits=limiter_limits_default):
+        self.limits = dict([(kind, NtoConcurrencyLimit(limits[kind]['initial'], limits[kind]['minimum'], limits[kind]['maximum'])) for kind in limits])
+
+    def limit(self, kind):
+        return self.limits[kind]
+
+    def state(self):
+        return dict([(kind, self.limits[kind].state()) for kind in self.limits])
+
+# Wrapper of an NPB session that sends a request only when the limiter of its host allows it
+class NtoLimitedClient(object):
+    def __init__(self, client, limiter):
+        self._client = client
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('__') or not callable(attribute):
+            return attribute
+        def limited_call(*args, **kwargs):
+            limit = self.limiter.limit(limiter_request_kind(name, args))
+            limit.acquire()
+            call_start = time.time()
+            outcome = 'ok'
+            try:
+                return attribute(*args, **kwargs)
+            except Exception as e:
+                outcome = limiter_error_outcome(e)
+                raise
+            finally:
+                limit.release(time.time() - call_start, outcome, limiter_endpoint(name, args))
+        return limited_call
@@ -10,8 +10,9 @@
 # 1. Starting point is an Ixia Vision NPB with all required ports enabled and receiving LLDP info from neighbors
 # 2. Input parameters to this script enumerate which keywords to look in LLDP Port Description field
 # 3. Connect to an NPB and collect LLDP Neighbors info
-# 4. Compare LLDP Port Description info with supplied keywords, identify matches
-# 5. Tag indentified ports with the matching keywords
+# 4. Compare LLDP neighbors with a snapshot saved by the previous run for the same NPB, identify ports with changed neighbors
+# 5. Compare LLDP Port Description info of the changed ports with supplied keywords, identify matches
+# 6. Tag indentified ports with the matching keywords, remove tags that were matched by the previous run but don't match anymore
 #
 # COPYRIGHT 2018 - 2019 Keysight Technologies.
 #
@@ -21,8 +22,17 @@
 ###############################################################################
 
 
+import os
+
 from ksvisionlib import *
 
+from ixvision_ztp_ntolib import *
+
+# DEFINE VARs HERE
+
+# LLDP neighbor snapshot left by the last run of tag_ports() for an NPB
+lldp_snapshot_file_suffix = '_lldp_snapshot.json'
+
 # DEFINE FUNCTIONS HERE
 
 # Input 
@@ -38,27 +48,212 @@ from ksvisionlib import *
 # |_Keywords[Names]
 # |_NeighborList[PortNum,NeighborPortDescription]
 
-# TODO remove keywords from ports that no longer have matching LLDP neighbors
+# Multi-pattern matcher that finds all tags present in a text in a single pass over it (Aho-Corasick automaton).
+# Optionally ignores case, and can require a tag to be a whole word - not preceded or followed by a letter, digit or underscore
+class LldpTagMatcher(object):
+    def __init__(self, tags, ignore_case=False, whole_word=False):
+        self.tags = []
+        self.ignore_case = ignore_case
+        self.whole_word = whole_word
+        self.transitions = [{}]     # Node -> {character: next node}
+        self.fallbacks = [0]        # Node -> node for the longest proper suffix that is also a prefix of some tag
+        self.outputs = [[]]         # Node -> list of tag indexes ending at this node
+        for tag in tags:
+            if tag == '' or tag in self.tags:
+                continue
+            self.tags.append(tag)
+            node = 0
+            for character in self.normalize(tag):
+                if character not in self.transitions[node]:
+                    self.transitions.append({})
+                    self.fallbacks.append(0)
+                    self.outputs.append([])
+                    self.transitions[node][character] = len(self.transitions) - 1
+                node = self.transitions[node][character]
+            self.outputs[node].append(len(self.tags) - 1)
+        
+        # Breadth-first pass to link every node to its fallback
+        node_queue = list(self.transitions[0].values())
+        while len(node_queue) > 0:
+            node = node_queue.pop(0)
+            for character, next_node in self.transitions[node].items():
+                node_queue.append(next_node)
+                fallback = self.fallbacks[node]
+                while fallback != 0 and character not in self.transitions[fallback]:
+                    fallback = self.fallbacks[fallback]
+                if character in self.transitions[fallback] and self.transitions[fallback][character] != next_node:
+                    self.fallbacks[next_node] = self.transitions[fallback][character]
+                self.outputs[next_node] = self.outputs[next_node] + self.outputs[self.fallbacks[next_node]]
+    
+    def normalize(self, text):
+        if self.ignore_case:
+            return text.lower()
+        return text
+    
+    def is_word_character(self, text, position):
+        return 0 <= position < len(text) and (text[position].isalnum() or text[position] == '_')
+    
+    # Return a list of tags found in the text, in the order the tags were supplied
+    def match(self, text):
+        if text is None:
+            return []
+        matched_tag_indexes = set()
+        node = 0
+        for position, character in enumerate(self.normalize(text)):
+            while node != 0 and character not in self.transitions[node]:
+                node = self.fallbacks[node]
+            node = self.transitions[node].get(character, 0)
+            for tag_index in self.outputs[node]:
+                if self.whole_word:
+                    tag_start = position - len(self.tags[tag_index]) + 1
+                    if self.is_word_character(text, tag_start - 1) or self.is_word_character(text, position + 1):
+                        continue
+                matched_tag_indexes.add(tag_index)
+        return [self.tags[tag_index] for tag_index in sorted(matched_tag_indexes)]
+
+# Merge new tags into a list of port keywords, keeping the existing order and skipping duplicates regardless of case
+def merge_port_keywords(port_keywords, tags):
+    merged_keywords = list(port_keywords or [])
+    merged_keywords_upper = set(keyword.upper() for keyword in merged_keywords)
+    for tag in tags:
+        if tag.upper() not in merged_keywords_upper:
+            merged_keywords.append(tag)
+            merged_keywords_upper.add(tag.upper())
+    return merged_keywords
 
-def tag_ports(host_ip, port, username, password, tags):
+# Neighbor attributes that are compared between runs, in a form that doesn't depend on the order of neighbors
+def lldp_neighbor_fingerprint(neighbors):
+    return sorted([[neighbor.get('system_name'), neighbor.get('port_id'), neighbor.get('port_description')] for neighbor in neighbors or []])
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_lldp_tag_debug.log")
+# Load the LLDP neighbor snapshot saved for an NPB by a previous run, or None if there is no usable one
+def load_lldp_snapshot(snapshot_file):
+    try:
+        with open(snapshot_file) as f:
+            snapshot = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(snapshot, dict) or not isinstance(snapshot.get('ports'), dict):
+        return None
+    return snapshot
+
+# Save the LLDP neighbor snapshot, replacing the previous one only after the new one is completely written
+def save_lldp_snapshot(snapshot_file, snapshot):
+    with open(snapshot_file + '.tmp', 'w') as f:
+        json.dump(snapshot, f, indent=1, sort_keys=True)
+    os.rename(snapshot_file + '.tmp', snapshot_file)
+
+# Tag ports with the tags found in port descriptions of their LLDP neighbors
+# Returns False if tagging of any port failed
+def tag_ports(host_ip, port, username, password, tags, ignore_case=False, whole_word=False, full_scan=False):
+
+    nto = nto_connect(host_ip, port, username, password)
 
     neighbor_list = {}
 
     neighbor_list = nto.getAllNeighbors()
-    if len(neighbor_list) == 0:
-        return
-
-    for port_name in neighbor_list.keys():
-        port = nto.getPortProperties(port_name,'id,keywords')
-        for neighbor in neighbor_list[port_name]:
-            for tag in tags:
-                if tag in neighbor['port_description']:
-                    print("Matched port %s with neighbor %s:%s description %s" % (port_name, neighbor['system_name'], neighbor['port_id'], neighbor['port_description']))
-                    port_keywords = port['keywords']
-                    if port_keywords is None:
-                        port_keywords = [tag]
-                    else:
-                        port_keywords = port_keywords + [tag]
-                    nto.modifyPort(str(port['id']), {'keywords': port_keywords})
+    if neighbor_list is None:
+        neighbor_list = {}
+
+    # Ports whose neighbors haven't changed since the last run keep their tags. Neighbors of the last run are only comparable
+    # if it used the same tags. Tags it applied that don't match anymore are removed, but after a run with different tag settings
+    # only those still in the tag list are, the others were asked for by that run and are left in place
+    snapshot_file = host_ip + lldp_snapshot_file_suffix
+    tag_settings = {'tags': tags, 'ignore_case': ignore_case, 'whole_word': whole_word}
+    previous_snapshot = load_lldp_snapshot(snapshot_file)
+    reuse_neighbors = previous_snapshot is not None and not full_scan
+    if reuse_neighbors and previous_snapshot.get('tag_settings') != tag_settings:
+        print("Tags differ from the previous run, checking all ports")
+        reuse_neighbors = False
+    if previous_snapshot is None:
+        previous_ports = {}
+    else:
+        previous_ports = previous_snapshot['ports']
+    same_tag_settings = previous_snapshot is not None and previous_snapshot.get('tag_settings') == tag_settings
+    tags_upper = set(tag.upper() for tag in tags)
+    
+    # Tags the previous run applied to a port, that this run can remove when they don't match anymore
+    def previous_port_tags(port_name):
+        return [tag for tag in previous_ports.get(port_name, {}).get('tags', []) if same_tag_settings or tag.upper() in tags_upper]
+    
+    snapshot_ports = {}
+    changed_port_names = []
+    for port_name in sorted(set(neighbor_list.keys()) | set(previous_ports.keys())):
+        neighbor_fingerprint = lldp_neighbor_fingerprint(neighbor_list.get(port_name))
+        if port_name in neighbor_list:
+            snapshot_ports[port_name] = {'neighbors': neighbor_fingerprint, 'tags': []}
+        if reuse_neighbors and port_name in previous_ports and port_name in neighbor_list \
+            and previous_ports[port_name].get('neighbors') == neighbor_fingerprint:
+            snapshot_ports[port_name]['tags'] = previous_ports[port_name].get('tags', [])
+        else:
+            changed_port_names.append(port_name)
+    
+    if reuse_neighbors:
+        print("Found %d ports with changed LLDP neighbors since the previous run" % len(changed_port_names))
+
+    tag_matcher = LldpTagMatcher(tags, ignore_case, whole_word)
+    port_by_name = None
+    port_names = {}     # Port ID -> port name as listed in the neighbor table
+    port_batch = NtoWriteBatch(nto, 'port')
+    for port_name in changed_port_names:
+        port_tags = []
+        for neighbor in neighbor_list.get(port_name, []):
+            neighbor_tags = tag_matcher.match(neighbor['port_description'])
+            if len(neighbor_tags) > 0:
+                print("Matched port %s with neighbor %s:%s description %s, tags %s" % (port_name, neighbor['system_name'], neighbor['port_id'], neighbor['port_description'], ", ".join(neighbor_tags)))
+                port_tags = merge_port_keywords(port_tags, neighbor_tags)
+        if port_name in snapshot_ports:
+            snapshot_ports[port_name]['tags'] = port_tags
+        
+        # Tags matched by the previous run, that don't match anymore, are stale
+        port_tags_upper = set(tag.upper() for tag in port_tags)
+        stale_tags_upper = set(tag.upper() for tag in previous_port_tags(port_name)) - port_tags_upper
+        if len(port_tags) == 0 and len(stale_tags_upper) == 0:
+            continue
+        
+        # Neighbors are listed by port names, look them up in the port inventory, loaded only when there is something to update
+        if port_by_name is None:
+            port_by_name = {}
+            for port_details in nto_port_inventory(nto).get_ports():
+                port_by_name[port_details.get('default_name')] = port_details
+                port_by_name[port_details.get('name')] = port_details
+        port = port_by_name.get(port_name)
+        if port is None:
+            try:
+                port = nto.getPortProperties(port_name,'id,keywords')
+            except Exception:
+                port = None
+        if port is None or 'id' not in port:
+            # The port is gone since neighbors were collected. The next run retries it, including removal of stale tags
+            print("Port %s not found, skipping" % port_name)
+            snapshot_ports[port_name] = {'neighbors': None, 'tags': merge_port_keywords(previous_port_tags(port_name), port_tags)}
+            continue
+        
+        # All the tags matched by all neighbors of a port go into a single keywords update, skipped if the port already has them
+        port_keywords = merge_port_keywords([keyword for keyword in port.get('keywords') or [] if keyword.upper() not in stale_tags_upper], port_tags)
+        if len(nto_properties_diff(port, {'keywords': port_keywords})) > 0:
+            if len(stale_tags_upper) > 0:
+                print("Removing stale tags %s from port %s" % (", ".join(sorted(stale_tags_upper)), port_name))
+            port_names[port['id']] = port_name
+            port_batch.stage(port['id'], {'keywords': port_keywords})
+        elif len(port_tags) > 0:
+            print("Port %s already has keywords %s" % (port_name, ", ".join(port_tags)))
+    
+    with nto_metrics.phase('write'):
+        batch_results = port_batch.flush()
+    tagging_failed = False
+    for port_id in sorted(batch_results.keys()):
+        if batch_results[port_id]['verified']:
+            print("Tagged port %s with keywords %s" % (port_names[port_id], ", ".join(batch_results[port_id]['details']['keywords'])))
+        else:
+            tagging_failed = True
+            if batch_results[port_id]['error'] is not None:
+                print("Tagging port %s failed: %s" % (port_names[port_id], batch_results[port_id]['error']))
+            else:
+                print("Tagging port %s failed!" % port_names[port_id])
+            # Make the next run retry this port, including removal of stale tags
+            port_name = port_names[port_id]
+            snapshot_ports[port_name] = {'neighbors': None, \
+                'tags': merge_port_keywords(previous_port_tags(port_name), snapshot_ports.get(port_name, {}).get('tags', []))}
+    
+    save_lldp_snapshot(snapshot_file, {'tag_settings': tag_settings, 'ports': snapshot_ports})
+    return not tagging_failed
@@ -0,0 +1,189 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_logging.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Central log of an ixvztp run, replacing debug log files of each action
+# 1. All modules log to the ixvztp logger, which is off until log_setup() is called with a level
+# 2. Log records are put on a queue and written by a background thread, so a request never waits for the disk.
+#    If the queue is full, records are dropped and their number is logged once the queue has room again
+# 3. The log file is rotated by size, keeping a number of older files
+# 4. NPB API requests are logged one line each: at debug level, with request and response bodies truncated,
+#    and only one in every N requests if sampling is set. Failed requests are always logged, at warning level
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from ixvision_ztp_metrics import metrics_call_resource, metrics_error_status
+
+# DEFINE VARs HERE
+
+# Log levels, as given on the command line
+log_levels = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+log_file_suffix = '_ixvztp.log'
+log_max_bytes_default = 10 * 1024 * 1024
+log_backup_count_default = 5
+log_format = '%(asctime)s %(threadName)s %(levelname)s %(message)s'
+
+# Records waiting to be written, at most. Records over the limit are dropped, so logging never blocks
+log_queue_size = 10000
+
+# Request and response bodies in request lines: lists are cut to the first items, then the body is cut to a number of characters
+log_body_items_max = 3
+log_body_chars_max = 512
+
+nto_logger = logging.getLogger('ixvztp')
+nto_logger.setLevel(logging.CRITICAL + 1)
+nto_logger.propagate = False
+
+# Log one in every this many successful requests, see log_setup()
+log_request_sample = 1
+log_request_counter = itertools.count()
+
+# DEFINE FUNCTIONS HERE
+
+# Default log file of a run against an NPB host, or of a run without a host, like in fleet mode
+def log_file_name(host_ip):
+    if host_ip is None:
+        return log_file_suffix.lstrip('_')
+    return host_ip + log_file_suffix
+
+# Start logging
+# Input
+# - Level name, one of log_levels
+# - Log file path
+# - Log only one in every this many successful requests, at debug level
+# - Size of the log file to rotate it at, in bytes, and number of rotated files to keep
+def log_setup(level_name, log_file, request_sample=1, max_bytes=log_max_bytes_default, backup_count=log_backup_count_default):
+    global log_request_sample
+    log_request_sample = max(1, request_sample)
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    file_handler.setFormatter(logging.Formatter(log_format))
+    queue_handler = LogQueueHandler(file_handler)
+    nto_logger.addHandler(queue_handler)
+    nto_logger.setLevel(log_levels[level_name])
+    atexit.register(queue_handler.close)
+
+# Check if NPB API requests are logged at all
+def log_requests_enabled():
+    return nto_logger.isEnabledFor(logging.WARNING)
+
+# Request or response body for a request line, cut to a size that keeps the log readable
+def log_body(payload):
+    if payload is None:
+        return '-'
+    omitted_items = ''
+    if isinstance(payload, list) and len(payload) > log_body_items_max:
+        omitted_items = ' +%d items' % (len(payload) - log_body_items_max)
+        payload = payload[:log_body_items_max]
+    try:
+        body = json.dumps(payload, sort_keys=True, default=str)
+    except Exception:
+        body = str(payload)
+    if len(body) > log_body_chars_max:
+        body = body[:log_body_chars_max] + '... %d chars' % len(body)
+    return body + omitted_items
+
+# Log an NPB API request, once it has completed
+# Input
+# - NPB host, client method and its arguments
+# - Response, or None if the request failed
+# - Status, as in the run report: 'ok', an HTTP status code or 'error'
+# - Seconds the request took
+def log_request(host_ip, method, args, result, status, seconds):
+    log_level = logging.DEBUG if status == 'ok' else logging.WARNING
+    if not nto_logger.isEnabledFor(log_level):
+        return
+    if log_level == logging.DEBUG and next(log_request_counter) % log_request_sample != 0:
+        return
+    # Bodies are formatted here rather than by the writer thread, since callers may change them afterwards
+    nto_logger.log(log_level, '%s %s %s %s %.3fs request=%s response=%s', host_ip, method if method != '_sendRequest' or len(args) == 0 else args[0],
+                   metrics_call_resource(method, args), status, seconds,
+                   log_body(list(args) or None), log_body(result))
+
+# Handler that passes records to another handler through a queue, written by a background thread
+class LogQueueHandler(logging.Handler):
+    def __init__(self, target_handler):
+        logging.Handler.__init__(self)
+        self.target_handler = target_handler
+        self.records = queue.Queue(log_queue_size)
+        self.dropped = 0
+        self.writer = threading.Thread(target=self.write_records, name='ixvztp-log')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def emit(self, record):
+        try:
+            # Arguments are merged into the message now, so the record doesn't keep references to objects that might change
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info is not None:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def write_records(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                break
+            if self.dropped > 0:
+                dropped, self.dropped = self.dropped, 0
+                self.target_handler.handle(logging.makeLogRecord({'name': nto_logger.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': '%d log records dropped, the log queue was full' % dropped}))
+            self.target_handler.handle(record)
+
+    # Write the records still in the queue and stop the writer thread
+    def close(self):
+        if self.writer.is_alive():
+            self.records.put(None)
+            self.writer.join()
+            self.target_handler.close()
+        logging.Handler.close(self)
+
+# Wrapper of an NPB session that logs every request
+class NtoLoggedClient(object):
+    def __init__(self, client, host_ip):
+        self._client = client
+        self.host_ip = host_ip
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('__') or not callable(attribute):
+            return attribute
+        def logged_call(*args, **kwargs):
+            call_start = time.time()
+            status = 'ok'
+            result = None
+            try:
+                result = attribute(*args, **kwargs)
+                return result
+            except Exception as e:
+                status = metrics_error_status(e)
+                raise
+            finally:
+                log_request(self.host_ip, name, args, result, status, time.time() - call_start)
+        return logged_call
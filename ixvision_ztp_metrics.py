@@ -0,0 +1,276 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_metrics.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Instrumentation of NPB API calls and a run report
+# 1. NPB sessions are wrapped to record every API call: client method, resource, latency, status and payload size
+# 2. Actions mark phases of their work, like the discovery or finalization of ports, calls are accounted to the current phase.
+#    Each thread has its own phases, worker threads inherit the phases of the thread that started them
+# 3. At the end of a run, a report with call counts per endpoint, latency percentiles and time per phase is written
+#    as JSON, and/or in Prometheus text format for the node exporter textfile collector
+# 4. Other modules can add sections to the report, like the state of request limiters
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.  
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# DEFINE VARs HERE
+
+# Latency percentiles included in the report
+metrics_latency_quantiles = [0.5, 0.9, 0.99]
+
+# Latency samples kept per endpoint. Counts and totals are exact, percentiles are computed over the most recent samples,
+# so a long watch run doesn't grow without limits
+metrics_latency_samples_max = 10000
+
+# NPB resources, looked up by a part of the client method name, in this order
+metrics_method_resources = [('PortGroup', 'port_groups'), ('Filter', 'filters'), ('Neighbor', 'neighbors'), ('Port', 'ports'),
+                            ('System', 'system'), ('Login', 'auth'), ('login', 'auth')]
+
+metrics_prometheus_prefix = 'ixvztp'
+
+# DEFINE FUNCTIONS HERE
+
+# Resource an API call works with, like 'ports' for modifyPort(), or the path of a raw request, like 'port_groups' for GET /api/port_groups
+def metrics_call_resource(method, args):
+    if method == '_sendRequest' and len(args) > 1:
+        return args[1].split('?', 1)[0].replace('/api/', '', 1).strip('/')
+    for method_part, resource in metrics_method_resources:
+        if method_part in method:
+            return resource
+    return 'other'
+
+# Status of an API call: 'ok', an HTTP status code if the error mentions one, or 'error'
+def metrics_error_status(error):
+    status_match = re.search(r'\b([45][0-9][0-9])\b', str(error))
+    if status_match is not None:
+        return status_match.group(1)
+    return 'error'
+
+# Approximate size of a request or response payload, as serialized JSON
+def metrics_payload_bytes(payload):
+    if payload is None:
+        return 0
+    try:
+        return len(json.dumps(payload, default=str))
+    except Exception:
+        return 0
+
+# Value of a quantile from a sorted list of samples, using the nearest rank
+def metrics_quantile(sorted_samples, quantile):
+    if len(sorted_samples) == 0:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, max(0, int(quantile * len(sorted_samples) + 0.5) - 1))]
+
+def metrics_prometheus_labels(labels):
+    return '{' + ','.join('%s="%s"' % (key, str(labels[key]).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key in sorted(labels)) + '}'
+
+# Write a file so that readers never see it partially written
+def metrics_write_file(filename, content):
+    with open(filename + '.tmp', 'w') as f:
+        f.write(content)
+    os.rename(filename + '.tmp', filename)
+
+# Collector of API call metrics and phase timings for a run. Disabled until start() is called, so sessions are only
+# wrapped when a report has been requested
+class NtoMetrics(object):
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.labels = {}                # Labels added to every Prometheus metric, like the NPB host
+        self.json_file = None
+        self.prometheus_file = None
+        self.report_sections = {}       # Section name -> function returning its content, added to every report
+        self.reset()
+    
+    def reset(self):
+        self.start_time = time.time()
+        self.endpoints = {}             # (method, resource) -> {'count', 'errors', 'statuses', 'bytes', 'seconds', 'latencies'}
+        self.phases = {}                # Phase name -> {'count', 'seconds', 'calls'}
+        self.phase_order = []
+        self.local = threading.local()  # Phases of each thread, see current_phases()
+        self.call_count = 0
+    
+    def start(self, labels=None, json_file=None, prometheus_file=None):
+        self.reset()
+        self.enabled = True
+        self.labels = dict(labels or {})
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+    
+    def add_report_section(self, name, func):
+        self.report_sections[name] = func
+    
+    # Call a client method and record the call
+    def record_call(self, method, func, args, kwargs):
+        call_start = time.time()
+        status = 'ok'
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception as e:
+            status = metrics_error_status(e)
+            raise
+        finally:
+            self.record(method if method != '_sendRequest' or len(args) == 0 else args[0], metrics_call_resource(method, args), time.time() - call_start, status,
+                        metrics_payload_bytes(result) + metrics_payload_bytes([arg for arg in args if isinstance(arg, (dict, list))]))
+    
+    # Record an API call made by any client
+    def record(self, method, resource, call_seconds, status, payload_bytes):
+        with self.lock:
+            endpoint = self.endpoints.get((method, resource))
+            if endpoint is None:
+                endpoint = {'count': 0, 'errors': 0, 'statuses': {}, 'bytes': 0, 'seconds': 0.0, 'latencies': deque(maxlen=metrics_latency_samples_max)}
+                self.endpoints[(method, resource)] = endpoint
+            endpoint['count'] += 1
+            if status != 'ok':
+                endpoint['errors'] += 1
+            endpoint['statuses'][status] = endpoint['statuses'].get(status, 0) + 1
+            endpoint['bytes'] += payload_bytes
+            endpoint['seconds'] += call_seconds
+            endpoint['latencies'].append(call_seconds)
+            self.call_count += 1
+            for phase_name in self.current_phases():
+                self.phases[phase_name]['calls'] += 1
+    
+    # Phases the calling thread is in, the innermost last
+    def current_phases(self):
+        if not hasattr(self.local, 'phase_stack'):
+            self.local.phase_stack = []
+        return self.local.phase_stack
+    
+    # Account API calls of the calling thread to the phases of another thread, like the one that has started it
+    @contextmanager
+    def inherit_phases(self, phase_stack):
+        saved_phase_stack = self.current_phases()
+        self.local.phase_stack = list(phase_stack)
+        try:
+            yield
+        finally:
+            self.local.phase_stack = saved_phase_stack
+    
+    # Account time and API calls to a phase. Phases can be nested, the name of a nested phase includes names of the outer ones,
+    # like portup/finalize, and its time and calls are included in the outer ones too. Time and calls of a phase entered several times are added up
+    @contextmanager
+    def phase(self, name):
+        phase_stack = self.current_phases()
+        with self.lock:
+            if len(phase_stack) > 0:
+                name = phase_stack[-1] + '/' + name
+            if name not in self.phases:
+                self.phases[name] = {'count': 0, 'seconds': 0.0, 'calls': 0}
+                self.phase_order.append(name)
+            self.phases[name]['count'] += 1
+            phase_stack.append(name)
+        phase_start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name]['seconds'] += time.time() - phase_start
+                phase_stack.pop()
+    
+    def report(self):
+        with self.lock:
+            endpoint_list = []
+            for (method, resource) in sorted(self.endpoints):
+                endpoint = self.endpoints[(method, resource)]
+                latencies = sorted(endpoint['latencies'])
+                latency = {'total': round(endpoint['seconds'], 6), 'max': round(latencies[-1] if len(latencies) > 0 else 0.0, 6)}
+                for quantile in metrics_latency_quantiles:
+                    latency['p%g' % (quantile * 100)] = round(metrics_quantile(latencies, quantile), 6)
+                endpoint_list.append({'method': method, 'resource': resource, 'count': endpoint['count'], 'errors': endpoint['errors'],
+                                      'statuses': dict(endpoint['statuses']), 'bytes': endpoint['bytes'], 'latency': latency})
+            phase_list = [{'name': name, 'count': self.phases[name]['count'], 'seconds': round(self.phases[name]['seconds'], 6),
+                           'calls': self.phases[name]['calls']} for name in self.phase_order]
+            report = {'labels': dict(self.labels), 'started': self.start_time, 'seconds': round(time.time() - self.start_time, 6),
+                      'calls': self.call_count, 'errors': sum(endpoint['errors'] for endpoint in endpoint_list),
+                      'bytes': sum(endpoint['bytes'] for endpoint in endpoint_list), 'endpoints': endpoint_list, 'phases': phase_list}
+        for name in self.report_sections:
+            report[name] = self.report_sections[name]()
+        return report
+    
+    def prometheus_text(self, report=None):
+        if report is None:
+            report = self.report()
+        labels = report['labels']
+        lines = []
+        def metric(name, metric_type, help_text, samples):
+            lines.append('# HELP %s_%s %s' % (metrics_prometheus_prefix, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (metrics_prometheus_prefix, name, metric_type))
+            for sample_suffix, sample_labels, value in samples:
+                sample_labels = dict(labels, **sample_labels)
+                lines.append('%s_%s%s%s %s' % (metrics_prometheus_prefix, name, sample_suffix, metrics_prometheus_labels(sample_labels), repr(float(value))))
+        
+        metric('run_start_time_seconds', 'gauge', 'Start time of the run since unix epoch in seconds', [('', {}, report['started'])])
+        metric('run_duration_seconds', 'gauge', 'Duration of the run in seconds', [('', {}, report['seconds'])])
+        metric('api_requests_total', 'counter', 'NPB API requests by client method, resource and status',
+               [('', {'method': endpoint['method'], 'resource': endpoint['resource'], 'status': status}, endpoint['statuses'][status])
+                for endpoint in report['endpoints'] for status in sorted(endpoint['statuses'])])
+        request_seconds_samples = []
+        for endpoint in report['endpoints']:
+            endpoint_labels = {'method': endpoint['method'], 'resource': endpoint['resource']}
+            for quantile in metrics_latency_quantiles:
+                request_seconds_samples.append(('', dict(endpoint_labels, quantile=str(quantile)), endpoint['latency']['p%g' % (quantile * 100)]))
+            request_seconds_samples.append(('_sum', endpoint_labels, endpoint['latency']['total']))
+            request_seconds_samples.append(('_count', endpoint_labels, endpoint['count']))
+        metric('api_request_duration_seconds', 'summary', 'NPB API request latency', request_seconds_samples)
+        metric('api_payload_bytes_total', 'counter', 'Approximate size of NPB API request and response payloads',
+               [('', {'method': endpoint['method'], 'resource': endpoint['resource']}, endpoint['bytes']) for endpoint in report['endpoints']])
+        metric('phase_duration_seconds', 'gauge', 'Time spent in a phase of the run', [('', {'phase': phase['name']}, phase['seconds']) for phase in report['phases']])
+        metric('phase_api_requests', 'gauge', 'NPB API requests made in a phase of the run', [('', {'phase': phase['name']}, phase['calls']) for phase in report['phases']])
+        if len(report.get('limiters', {})) > 0:
+            limiters = report['limiters']
+            limit_labels = [(npb, kind, {'npb': npb, 'kind': kind}) for npb in sorted(limiters) for kind in sorted(limiters[npb])]
+            metric('concurrency_limit', 'gauge', 'Limit of NPB API requests in flight at the end of the run',
+                   [('', labels, limiters[npb][kind]['limit']) for npb, kind, labels in limit_labels])
+            metric('concurrency_max_in_flight', 'gauge', 'Most NPB API requests in flight at the same time',
+                   [('', labels, limiters[npb][kind]['max_in_flight']) for npb, kind, labels in limit_labels])
+            metric('concurrency_limit_decreases_total', 'counter', 'Times the limit of NPB API requests in flight was cut on overload',
+                   [('', labels, limiters[npb][kind]['decreases']) for npb, kind, labels in limit_labels])
+        if 'watch' in report:
+            metric('watch_cycles_total', 'counter', 'Watch mode cycles run', [('', {}, report['watch']['cycles'])])
+            metric('watch_cycle_failures_total', 'counter', 'Watch mode cycles that failed with an error', [('', {}, report['watch']['failed_cycles'])])
+        return '\n'.join(lines) + '\n'
+    
+    # Write the report to the files requested at start(). Can be called more than once, each time with the metrics collected so far
+    def write_reports(self):
+        if not self.enabled:
+            return
+        report = self.report()
+        if self.json_file is not None:
+            metrics_write_file(self.json_file, json.dumps(report, indent=4, sort_keys=True) + '\n')
+        if self.prometheus_file is not None:
+            metrics_write_file(self.prometheus_file, self.prometheus_text(report))
+
+# Wrapper of an NPB session that records every method call to the metrics
+class NtoInstrumentedClient(object):
+    def __init__(self, client, metrics):
+        self._client = client
+        self._metrics = metrics
+    
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('__') or not callable(attribute):
+            return attribute
+        def instrumented_call(*args, **kwargs):
+            return self._metrics.record_call(name, attribute, args, kwargs)
+        return instrumented_call
+
+# Metrics of this run
+nto_metrics = NtoMetrics()
@@ -0,0 +1,348 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_mock.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: A local stand-in for the Vision NPB Web API, used to measure ixvztp actions without a real chassis
+# 1. Implements the part of the VisionWebApi interface used by ixvztp, serving requests from in-memory NPB state
+# 2. NPB state is generated from fixtures: system info, a configurable number of ports with a mix of media types,
+#    cabled to link partners that expect certain link settings, LLDP neighbors advertised over the links that are up,
+#    and port groups and filters that already exist on the NPB before any action runs
+# 3. Ports come up only when configured with the settings their link partner expects, and neighbors only show up
+#    on enabled ports with LLDP receive enabled, so port discovery and LLDP tagging follow the same paths as on an NPB
+# 4. Every request is counted per method and delayed by a configurable latency, outside of the state lock,
+#    so requests sent in parallel overlap as they would on a real NPB
+# 5. State is kept per host, so a new session to the same host sees the changes made by the previous ones
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.  
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import copy
+import threading
+import time
+
+# DEFINE VARs HERE
+
+# Fixtures used to generate the state of a new mock NPB. Port count and latency (in seconds, per request) can be overridden
+mock_fixtures_default = {
+    'port_count': 48,
+    'latency': 0.0,
+    'system': {'software_version': '5.3.0',
+               'system_info': {'name': 'mock-npb', 'location': 'lab', 'contact_info': 'noc@example.com'},
+               'ip_config': {'ipv4_address': '192.0.2.10', 'ipv6_address': '2001:db8::10'}},
+    'hardware_info': {'system_id': 'MOCK0001', 'mac_address': '00005e005301', 'board_type': 'MOCK_MAIN'},
+    # Existing port groups get enabled ports whose pattern entry names them, existing filters are connected to port groups by name
+    'port_groups': [{'name': 'Legacy', 'mode': 'NETWORK', 'type': 'INTERCONNECT', 'keywords': ['LEGACY']}],
+    'filters': [{'name': 'Legacy', 'mode': 'PASS_ALL', 'keywords': ['LEGACY'], 'source_port_group_names': ['Legacy'], 'dest_port_group_names': []}],
+}
+
+# Ports are generated by repeating this pattern. Each entry defines media type of a port, and, if the port is cabled, settings
+# its link partner expects and the description of the link partner port advertised over LLDP. Ports of an entry with a port group
+# are enabled members of that existing group
+mock_port_pattern = [
+    {'media_type': 'QSFP28',         'partner': {'forward_error_correction_settings': {'enabled': True}},   'description': 'TAP core-sw%d Eth1/%d'},
+    {'media_type': 'QSFP28',         'partner': {'forward_error_correction_settings': {'enabled': False}},  'description': 'SPAN dist-sw%d Eth1/%d'},
+    {'media_type': 'QSFP_PLUS_40G',  'partner': {},                                                         'description': 'probe analyzer%d nic%d'},
+    {'media_type': 'SFP_PLUS_10G',   'partner': {'media_type': 'SFP_PLUS_10G', 'link_settings': '10G_FULL'}, 'description': 'TAP edge-sw%d Te1/%d'},
+    {'media_type': 'SFP_PLUS_10G',   'partner': {'media_type': 'SFP_1G'},                                   'description': 'probe recorder%d eth%d'},
+    {'media_type': 'SFP_PLUS_10G',   'partner': None,                                                       'description': None},
+    {'media_type': 'QSFP_PLUS_40G',  'partner': None,                                                       'description': None, 'port_group': 'Legacy'},
+    {'media_type': 'SFP_PLUS_10G',   'partner': {'media_type': 'SFP_PLUS_10G', 'link_settings': '10G_FULL'}, 'description': 'uplink mgmt-sw%d Gi0/%d'},
+]
+
+# Mock NPB states, keyed by host
+mock_devices = {}
+mock_devices_lock = threading.Lock()
+
+# DEFINE FUNCTIONS HERE
+
+# State of a mock NPB: objects, the lock that serializes changes to them, and counters of requests served
+class MockVisionDevice(object):
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+        self.lock = threading.Lock()
+        self.api_calls = {}     # Method name -> number of requests
+        self.ports = {}
+        self.port_partners = {} # Port ID -> {'partner': expected settings, 'description': LLDP port description}
+        self.port_groups = {}
+        self.filters = {}
+        self.next_object_id = 1000
+        for port_index in range(fixtures['port_count']):
+            port_id = port_index + 1
+            pattern = mock_port_pattern[port_index % len(mock_port_pattern)]
+            port_name = 'P%02d' % port_id
+            self.ports[port_id] = {'id': port_id, 'name': port_name, 'default_name': port_name, 'enabled': False, 'mode': 'NETWORK',
+                                   'keywords': [], 'port_group_id': None, 'dest_filter_list': [], 'source_filter_list': [],
+                                   'media_type': pattern['media_type'], 'link_settings': 'AUTO',
+                                   'forward_error_correction_settings': {'enabled': False, 'fec_type': 'RS_FEC'},
+                                   'lldp_receive_enabled': False, 'misc': {'board_type': fixtures['hardware_info']['board_type']}}
+            description = None
+            if pattern['description'] is not None:
+                description = pattern['description'] % (port_index // len(mock_port_pattern) + 1, port_index % len(mock_port_pattern) + 1)
+            self.port_partners[port_id] = {'partner': pattern['partner'], 'description': description}
+        
+        for port_group in fixtures['port_groups']:
+            port_id_list = [port_id for port_id in sorted(self.ports) if mock_port_pattern[(port_id - 1) % len(mock_port_pattern)].get('port_group') == port_group['name']]
+            for port_id in port_id_list:
+                self.ports[port_id]['enabled'] = True
+                self.ports[port_id]['mode'] = port_group['mode']
+            self.add_port_group(dict(port_group, port_list=port_id_list))
+        for df in fixtures['filters']:
+            df_params = dict((key, df[key]) for key in df if not key.endswith('_port_group_names'))
+            for connection_list in ['source_port_group_list', 'dest_port_group_list']:
+                df_params[connection_list] = [pg_id for pg_id in sorted(self.port_groups) if self.port_groups[pg_id]['name'] in df[connection_list.replace('_list', '_names')]]
+            self.add_filter(df_params)
+    
+    def count_call(self, method):
+        with self.lock:
+            self.api_calls[method] = self.api_calls.get(method, 0) + 1
+    
+    def reset_api_calls(self):
+        with self.lock:
+            self.api_calls = {}
+    
+    def link_up(self, port_id):
+        port = self.ports[port_id]
+        partner = self.port_partners[port_id]['partner']
+        if partner is None or not port['enabled']:
+            return False
+        for key in partner:
+            if isinstance(partner[key], dict):
+                if any(port[key].get(nested_key) != partner[key][nested_key] for nested_key in partner[key]):
+                    return False
+            elif port[key] != partner[key]:
+                return False
+        return True
+    
+    def port_details(self, port_id):
+        port_details = copy.deepcopy(self.ports[port_id])
+        port_details['link_status'] = {'link_up': self.link_up(port_id)}
+        return port_details
+    
+    def allocate_id(self):
+        self.next_object_id += 1
+        return self.next_object_id
+    
+    def set_port_group_members(self, pg_id, port_id_list):
+        for port_id in self.ports:
+            if self.ports[port_id]['port_group_id'] == pg_id and port_id not in port_id_list:
+                self.ports[port_id]['port_group_id'] = None
+        for port_id in port_id_list:
+            self.ports[port_id]['port_group_id'] = pg_id
+    
+    # Create a port group, with members given by port IDs
+    def add_port_group(self, args):
+        pg_id = self.allocate_id()
+        self.port_groups[pg_id] = {'id': pg_id, 'name': args.get('name'), 'default_name': 'PG%d' % pg_id, 'keywords': [keyword.upper() for keyword in args.get('keywords', [])],
+                                   'mode': args.get('mode', 'NETWORK'), 'type': args.get('type', args.get('port_group_type', 'INTERCONNECT')), 'port_list': list(args.get('port_list', []))}
+        self.set_port_group_members(pg_id, self.port_groups[pg_id]['port_list'])
+        return pg_id
+    
+    def set_filter_connections(self, df_id):
+        for port_id in self.ports:
+            port = self.ports[port_id]
+            for connection_list, filter_list in [('source_port_list', 'dest_filter_list'), ('dest_port_list', 'source_filter_list')]:
+                if port_id in self.filters[df_id][connection_list]:
+                    if df_id not in port[filter_list]:
+                        port[filter_list].append(df_id)
+                elif df_id in port[filter_list]:
+                    port[filter_list].remove(df_id)
+    
+    def add_filter(self, args):
+        df_id = self.allocate_id()
+        self.filters[df_id] = {'id': df_id, 'name': args.get('name'), 'default_name': 'F%d' % df_id, 'keywords': [keyword.upper() for keyword in args.get('keywords', [])],
+                               'mode': args.get('mode', 'DISABLE'), 'criteria': copy.deepcopy(args.get('criteria', {})),
+                               'source_port_group_list': list(args.get('source_port_group_list', [])), 'dest_port_group_list': list(args.get('dest_port_group_list', [])),
+                               'source_port_list': list(args.get('source_port_list', [])), 'dest_port_list': list(args.get('dest_port_list', []))}
+        self.set_filter_connections(df_id)
+        return df_id
+
+# Return the mock NPB state for a host, generating it from fixtures on first use
+def mock_device(host, fixtures=None):
+    with mock_devices_lock:
+        if host not in mock_devices:
+            device_fixtures = copy.deepcopy(mock_fixtures_default)
+            device_fixtures.update(fixtures or {})
+            mock_devices[host] = MockVisionDevice(device_fixtures)
+        return mock_devices[host]
+
+# Drop all mock NPB states, the next session to any host starts with a fresh one
+def mock_reset_devices():
+    with mock_devices_lock:
+        mock_devices.clear()
+
+def mock_match(object_details, terms):
+    for key in terms:
+        if key == 'keywords':
+            if not set(keyword.upper() for keyword in terms[key]) <= set(keyword.upper() for keyword in object_details.get(key) or []):
+                return False
+        elif object_details.get(key) != terms[key]:
+            return False
+    return True
+
+def mock_select_properties(object_details, properties):
+    return dict((key, object_details[key]) for key in properties.split(',') if key in object_details)
+
+# Mock session to an NPB, a drop-in replacement for VisionWebApi. Objects are looked up by ID or by name, as VisionWebApi allows
+class MockVisionWebApi(object):
+    def __init__(self, host, username, password, port=8000, debug=False, logFile=None):
+        self.host = host
+        self.device = mock_device(host)
+        self.request('login', lambda: None)
+    
+    # Serve a request: count it, wait for the simulated latency and run the handler while holding the state lock
+    def request(self, method, handler):
+        self.device.count_call(method)
+        if self.device.fixtures['latency'] > 0:
+            time.sleep(self.device.fixtures['latency'])
+        with self.device.lock:
+            return copy.deepcopy(handler())
+    
+    def find_id(self, objects, object_key):
+        for object_id in objects:
+            if str(object_id) == str(object_key) or objects[object_id].get('name') == object_key:
+                return object_id
+        raise Exception("404 Not Found: %s" % object_key)
+    
+    def _sendRequest(self, method, url, args=None, decode=True):
+        def handler():
+            resource, query = (url.split('?', 1) + [''])[:2]
+            if method != 'GET' or not query.startswith('properties='):
+                raise Exception("400 Bad Request: %s %s" % (method, url))
+            properties = query[len('properties='):]
+            if resource == '/api/ports':
+                return [mock_select_properties(self.device.port_details(port_id), properties) for port_id in sorted(self.device.ports)]
+            elif resource == '/api/port_groups':
+                return [mock_select_properties(self.device.port_groups[pg_id], properties) for pg_id in sorted(self.device.port_groups)]
+            elif resource == '/api/filters':
+                return [mock_select_properties(self.device.filters[df_id], properties) for df_id in sorted(self.device.filters)]
+            raise Exception("404 Not Found: %s" % url)
+        return self.request('_sendRequest', handler)
+    
+    # System
+    
+    def getSystem(self):
+        return self.request('getSystem', lambda: self.device.fixtures['system'])
+    
+    def getLoginInfo(self):
+        return self.request('getLoginInfo', lambda: {'hardware_info': self.device.fixtures['hardware_info']})
+    
+    # Ports
+    
+    def searchPorts(self, terms):
+        return self.request('searchPorts', lambda: [{'id': port_id, 'name': self.device.ports[port_id]['name']}
+                                                    for port_id in sorted(self.device.ports) if mock_match(self.device.port_details(port_id), terms)])
+    
+    def getPort(self, port_key):
+        return self.request('getPort', lambda: self.device.port_details(self.find_id(self.device.ports, port_key)))
+    
+    def getPortProperties(self, port_key, properties):
+        return self.request('getPortProperties', lambda: mock_select_properties(self.device.port_details(self.find_id(self.device.ports, port_key)), properties))
+    
+    def modifyPort(self, port_key, args):
+        def handler():
+            port = self.device.ports[self.find_id(self.device.ports, port_key)]
+            if port['port_group_id'] is not None and args.get('mode', port['mode']) != port['mode']:
+                raise Exception("409 Conflict: mode of port %s can't be changed while it is in a port group" % port_key)
+            for key in args:
+                if isinstance(args[key], dict) and isinstance(port.get(key), dict):
+                    port[key].update(args[key])
+                elif key == 'keywords':
+                    port[key] = [keyword.upper() for keyword in args[key]]
+                else:
+                    port[key] = copy.deepcopy(args[key])
+        return self.request('modifyPort', handler)
+    
+    def getAllNeighbors(self):
+        def handler():
+            neighbors = {}
+            for port_id in sorted(self.device.ports):
+                port = self.device.ports[port_id]
+                description = self.device.port_partners[port_id]['description']
+                if description is not None and port['lldp_receive_enabled'] and self.device.link_up(port_id):
+                    neighbors[port['default_name']] = [{'system_name': description.split(' ')[1], 'port_id': description.split(' ')[-1], 'port_description': description}]
+            return neighbors
+        return self.request('getAllNeighbors', handler)
+    
+    # Port groups
+    
+    def searchPortGroups(self, terms):
+        return self.request('searchPortGroups', lambda: [{'id': pg_id, 'name': self.device.port_groups[pg_id]['name']}
+                                                         for pg_id in sorted(self.device.port_groups) if mock_match(self.device.port_groups[pg_id], terms)])
+    
+    def getPortGroup(self, pg_key):
+        return self.request('getPortGroup', lambda: self.device.port_groups[self.find_id(self.device.port_groups, pg_key)])
+    
+    def getPortGroupProperty(self, pg_key, property_name):
+        return self.request('getPortGroupProperty', lambda: self.device.port_groups[self.find_id(self.device.port_groups, pg_key)][property_name])
+    
+    def createPortGroup(self, args):
+        def handler():
+            return {'id': self.device.add_port_group(dict(args, port_list=[self.find_id(self.device.ports, port_id) for port_id in args.get('port_list', [])]))}
+        return self.request('createPortGroup', handler)
+    
+    def modifyPortGroup(self, pg_key, args):
+        def handler():
+            pg_id = self.find_id(self.device.port_groups, pg_key)
+            for key in args:
+                if key == 'keywords':
+                    self.device.port_groups[pg_id][key] = [keyword.upper() for keyword in args[key]]
+                elif key == 'port_group_type':
+                    self.device.port_groups[pg_id]['type'] = args[key]
+                elif key == 'port_list':
+                    self.device.port_groups[pg_id][key] = [self.find_id(self.device.ports, port_id) for port_id in args[key]]
+                else:
+                    self.device.port_groups[pg_id][key] = copy.deepcopy(args[key])
+            self.device.set_port_group_members(pg_id, self.device.port_groups[pg_id]['port_list'])
+        return self.request('modifyPortGroup', handler)
+    
+    def deletePortGroup(self, pg_key):
+        def handler():
+            pg_id = self.find_id(self.device.port_groups, pg_key)
+            if any(pg_id in df['source_port_group_list'] or pg_id in df['dest_port_group_list'] for df in self.device.filters.values()):
+                raise Exception("409 Conflict: port group %s is connected to a filter" % pg_key)
+            self.device.set_port_group_members(pg_id, [])
+            del self.device.port_groups[pg_id]
+        return self.request('deletePortGroup', handler)
+    
+    # Filters
+    
+    def searchFilters(self, terms):
+        return self.request('searchFilters', lambda: [{'id': df_id, 'name': self.device.filters[df_id]['name']}
+                                                      for df_id in sorted(self.device.filters) if mock_match(self.device.filters[df_id], terms)])
+    
+    def getFilter(self, df_key):
+        return self.request('getFilter', lambda: self.device.filters[self.find_id(self.device.filters, df_key)])
+    
+    def getFilterProperty(self, df_key, property_name):
+        return self.request('getFilterProperty', lambda: self.device.filters[self.find_id(self.device.filters, df_key)][property_name])
+    
+    def createFilter(self, args, allowTemporaryDataLoss=False):
+        def handler():
+            return {'id': self.device.add_filter(args)}
+        return self.request('createFilter', handler)
+    
+    def modifyFilter(self, df_key, args, allowTemporaryDataLoss=False):
+        def handler():
+            df_id = self.find_id(self.device.filters, df_key)
+            for key in args:
+                if key == 'keywords':
+                    self.device.filters[df_id][key] = [keyword.upper() for keyword in args[key]]
+                else:
+                    self.device.filters[df_id][key] = copy.deepcopy(args[key])
+            self.device.set_filter_connections(df_id)
+        return self.request('modifyFilter', handler)
+    
+    def deleteFilter(self, df_key):
+        def handler():
+            df_id = self.find_id(self.device.filters, df_key)
+            self.device.filters[df_id].update({'source_port_list': [], 'dest_port_list': []})
+            self.device.set_filter_connections(df_id)
+            del self.device.filters[df_id]
+        return self.request('deleteFilter', handler)
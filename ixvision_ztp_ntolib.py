@@ -16,58 +16,581 @@
 
 from ksvisionlib import *
 
+from ixvision_ztp_constants import *
+from ixvision_ztp_metrics import *
+
+from ixvision_ztp_cache import NtoCachingClient, NtoResponseCache
+from ixvision_ztp_limiter import NtoHostLimiter, NtoLimitedClient
+from ixvision_ztp_logging import NtoLoggedClient, log_requests_enabled, nto_logger
+
+import copy
+import json
+import os
+import re
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
 # DEFINE VARs HERE
-port_modes_supported = {'net': 'NETWORK', 'tool': 'TOOL'}
-df_connection_modes_supported = {'input': 'NETWORK', 'output': 'TOOL'}
-df_criteria_fields_supported = {'ip': 'ipv4_src_or_dst', 'ip-src': 'ipv4_src', 'ip-dst': 'ipv4_dst'}
+
+# Open NPB sessions, keyed by (host, port, username). Actions executed by the same process, like the steps of a playbook,
+# reuse an already authenticated session instead of logging in again
+nto_sessions = {}
+
+# Class used to open new NPB sessions. Anything with the VisionWebApi interface can be plugged in, like the mock API used for benchmarks
+nto_client_factory = VisionWebApi
+
+# Debug log of the NPB API library itself. It is written synchronously with every request, so it is off unless asked for,
+# requests are logged by the ixvztp log instead, see ixvision_ztp_logging.py
+nto_client_debug = False
+nto_client_log_file = 'ixvision_ztp_client_debug.log'
+
+# Class of asyncio clients, see ixvision_ztp_aio.py. When set, every new NPB session gets an asyncio client too, and requests
+# that actions send to many ports or objects at once go over it, instead of a pool of threads
+nto_aio_client_factory = None
+
+# asyncio clients, one per NPB session
+nto_aio_clients = {}
+
+# Limiters of requests in flight, one per NPB host, see ixvision_ztp_limiter.py. They are shared by all sessions
+# to the host, and kept when sessions are closed, so the following actions start from the limits already learned
+nto_limiters = {}
+
+# On-disk cache of read responses for new NPB sessions, see ixvision_ztp_cache.py: None - not used,
+# 'use' - serve read requests from the cache, 'refresh' - read everything from the NPB, and cache the new responses
+nto_cache_mode = None
+
+# Port properties that the port inventory retrieves for every port in one bulk request
+port_inventory_properties = 'id,name,default_name,enabled,mode,keywords,port_group_id,dest_filter_list,source_filter_list'
+
+# Port inventories, one per NPB session, see nto_port_inventory()
+nto_port_inventories = {}
+
+# Capabilities of NPBs, one per NPB session, see nto_capabilities(). When the response cache is used, probed capabilities
+# are also kept in a file per NPB, for the following runs
+nto_session_capabilities = {}
+capability_file_suffix = '_capabilities.json'
+
+# Names of object attributes that differ between NPB software versions: name used by this tool -> name used by the NPB API
+capability_attribute_names = {
+    'port_group_type': lambda version: 'port_group_type' if version[:1] == (4,) else 'type',
+}
+
+# Properties that list IDs of other objects, like members of a port group. NPBs may return them in any order
+nto_id_list_properties = ['port_list', 'source_port_list', 'dest_port_list', 'source_port_group_list', 'dest_port_group_list',
+                          'source_filter_list', 'dest_filter_list']
+
+# Tag expressions: a list of terms, any of which can match (OR). Each term may combine several tags with
+# tag_expression_and_separator, all of which must match (AND). For example, ['tap+10g', 'span'] matches ports tagged
+# with both TAP and 10G, as well as ports tagged with SPAN
+tag_expression_and_separator = '+'
 
 # DEFINE FUNCTIONS HERE
 
-# Connect an existing dynamic filter to a set of ports via keyword search
+# Return a session to an NPB, reusing an existing one if this process has already connected to it
+# Input
+# - NPB host, port and credentials
+def nto_connect(host_ip, port, username, password):
+    session_key = (host_ip, str(port), username)
+    if session_key not in nto_sessions:
+        if nto_metrics.enabled:
+            # Record the login, and every call made over the session after it
+            nto_sessions[session_key] = NtoInstrumentedClient(nto_metrics.record_call('login', nto_client_factory, (),
+                {'host': host_ip, 'username': username, 'password': password, 'port': port, 'debug': nto_client_debug, 'logFile': nto_client_log_file}), nto_metrics)
+        else:
+            nto_sessions[session_key] = nto_client_factory(host=host_ip, username=username, password=password, port=port,
+                                                           debug=nto_client_debug, logFile=nto_client_log_file)
+        nto_logger.info("Opened a session to %s:%s as %s", host_ip, port, username)
+        if log_requests_enabled():
+            nto_sessions[session_key] = NtoLoggedClient(nto_sessions[session_key], host_ip)
+        nto_sessions[session_key] = NtoLimitedClient(nto_sessions[session_key], nto_limiter(host_ip))
+        if nto_cache_mode is not None:
+            nto_sessions[session_key] = NtoCachingClient(nto_sessions[session_key], NtoResponseCache(host_ip, refresh=(nto_cache_mode == 'refresh')))
+        if nto_aio_client_factory is not None:
+            nto_aio_clients[nto_sessions[session_key]] = nto_aio_client_factory(host=host_ip, username=username, password=password, port=port,
+                                                                                limiter=nto_limiter(host_ip))
+    return nto_sessions[session_key]
+
+# Return the limiter of requests in flight to an NPB host, creating it if needed
+def nto_limiter(host_ip):
+    if host_ip not in nto_limiters:
+        nto_limiters[host_ip] = NtoHostLimiter()
+    return nto_limiters[host_ip]
+
+# State of the limiters of all NPB hosts, for the run report
+def nto_limiters_state():
+    return dict([(host_ip, nto_limiters[host_ip].state()) for host_ip in nto_limiters])
+
+nto_metrics.add_report_section('limiters', nto_limiters_state)
+
+# Return the asyncio client for an NPB session, or None if requests are sent from a pool of threads
+def nto_aio_client(nto):
+    return nto_aio_clients.get(nto)
+
+# Close all NPB sessions of this process, the next action connecting to an NPB logs in again and reloads its port inventory
+def nto_reset_sessions():
+    for aio_client in nto_aio_clients.values():
+        aio_client.close()
+    nto_aio_clients.clear()
+    nto_sessions.clear()
+    nto_port_inventories.clear()
+    nto_session_capabilities.clear()
+
+# Call a function for each item using a bounded pool of worker threads
+# Returns a list of (result, error) tuples in the same order as the items. Exceptions raised by the function
+# don't stop the other items from being processed, they are returned as error strings with result set to None
+def nto_parallel_map(func, items, workers=nto_workers_default):
+    phase_stack = list(nto_metrics.current_phases())
+    def call_func(item):
+        try:
+            with nto_metrics.inherit_phases(phase_stack):
+                return (func(item), None)
+        except Exception as e:
+            return (None, "%s: %s" % (type(e).__name__, e))
+    
+    items = list(items)
+    if len(items) == 0:
+        return []
+    if workers is None or workers <= 1 or len(items) == 1:
+        return [call_func(item) for item in items]
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(call_func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+# Retrieve a list of properties for all objects of a kind - ports, port groups or filters
+# Input
+# - NTO object as a connection to an NPB
+# - Resource name as used in the API: 'ports', 'port_groups' or 'filters'
+# - Comma-separated list of properties
+def nto_get_all_properties(nto, resource, properties):
+    # A collection GET with a list of properties returns all the objects in a single round trip
+    try:
+        object_list = nto._sendRequest('GET', '/api/' + resource + '?properties=' + properties)
+    except Exception:
+        object_list = None
+    if isinstance(object_list, list) and all(isinstance(object_details, dict) and 'id' in object_details for object_details in object_list):
+        return object_list
+    
+    # Fall back to a request per object for API versions that don't support properties on collections
+    object_list = []
+    if resource == 'ports':
+        for port in nto.searchPorts({}):
+            port_details = nto.getPortProperties(str(port['id']), properties)
+            if port_details is not None:
+                object_list.append(port_details)
+        return object_list
+    elif resource == 'port_groups':
+        search_objects, get_object = nto.searchPortGroups, nto.getPortGroup
+    elif resource == 'filters':
+        search_objects, get_object = nto.searchFilters, nto.getFilter
+    else:
+        raise ValueError("unsupported resource %s" % resource)
+    for found_object in search_objects({}):
+        object_details = get_object(str(found_object['id']))
+        if object_details is not None:
+            object_list.append(dict((key, object_details.get(key)) for key in properties.split(',')))
+    return object_list
+
+# Retrieve a list of properties for all ports of an NPB
+# Input
+# - NTO object as a connection to an NPB
+# - Comma-separated list of port properties
+def nto_get_all_ports_properties(nto, properties):
+    return nto_get_all_properties(nto, 'ports', properties)
+
+# In-memory snapshot of NPB ports with properties listed in port_inventory_properties.
+# The snapshot is loaded with a bulk request on first use, and all lookups are served from memory after that.
+# Any code that modifies ports must invalidate them, so they are re-read on the next lookup.
+class NtoPortInventory(object):
+    def __init__(self, nto):
+        self.nto = nto
+        self.lock = threading.RLock()   # Actions of a policy share the inventory from several threads
+        self.ports = None           # Port ID -> port properties
+        self.stale_port_ids = set() # Ports invalidated since the last load
+        self.port_index = None      # Keyword index over the ports, rebuilt after any change
+
+    def load(self):
+        with self.lock:
+            self.ports = {}
+            for port_details in nto_get_all_ports_properties(self.nto, port_inventory_properties):
+                self.ports[port_details['id']] = port_details
+            self.stale_port_ids = set()
+            self.port_index = None
+    
+    def refresh(self):
+        with self.lock:
+            if self.ports is None:
+                self.load()
+            for port_id in self.stale_port_ids:
+                port_details = self.nto.getPortProperties(str(port_id), port_inventory_properties)
+                if port_details is not None:
+                    self.ports[port_id] = port_details
+                else:
+                    self.ports.pop(port_id, None)
+                self.port_index = None
+            self.stale_port_ids = set()
+
+    # Mark ports as changed on the NPB. Without a port ID, the whole inventory is dropped
+    def invalidate(self, port_id=None):
+        with self.lock:
+            if port_id is None:
+                self.ports = None
+                self.stale_port_ids = set()
+            elif self.ports is not None:
+                self.stale_port_ids.add(int(port_id))
+    
+    def get_port(self, port_id):
+        with self.lock:
+            self.refresh()
+            return self.ports.get(int(port_id))
+    
+    def get_ports(self):
+        with self.lock:
+            self.refresh()
+            return [self.ports[port_id] for port_id in sorted(self.ports.keys())]
+    
+    # Search ports the same way as nto.searchPorts() does: all search terms must match,
+    # 'keywords' match if the port has all of the listed keywords
+    def search(self, search_terms):
+        port_list = []
+        for port_details in self.get_ports():
+            port_matches = True
+            for term in search_terms:
+                if term == 'keywords':
+                    port_keywords = port_details.get('keywords') or []
+                    port_matches = all(keyword.upper() in port_keywords for keyword in search_terms[term])
+                else:
+                    port_matches = port_details.get(term) == search_terms[term]
+                if not port_matches:
+                    break
+            if port_matches:
+                port_list.append(port_details)
+        return port_list
+    
+    # Return a keyword index over the current port snapshot
+    def index(self):
+        with self.lock:
+            self.refresh()
+            if self.port_index is None:
+                self.port_index = NtoPortIndex(self.ports.values())
+            return self.port_index
+
+# Split tag expressions into terms, each term being a list of upper-case tags that must all be present on a port
+def parse_tag_expression(tags):
+    tag_terms = []
+    for tag_term in tags:
+        term_tags = [tag.strip().upper() for tag in tag_term.split(tag_expression_and_separator) if tag.strip() != '']
+        if len(term_tags) > 0:
+            tag_terms.append(term_tags)
+    return tag_terms
+
+# Inverted index over a set of ports: keyword -> port IDs, with mode, port group and connection facets,
+# so that tag searches are set operations instead of scans over all ports and all their keywords
+class NtoPortIndex(object):
+    def __init__(self, port_list):
+        self.keyword_index = {}     # Keyword -> set of port IDs
+        self.mode_index = {}        # Port mode -> set of port IDs
+        self.group_index = {}       # Port group ID, None for ports outside of any group -> set of port IDs
+        self.enabled_ids = set()    # Enabled ports
+        self.unconnected_ids = set()# Ports without any filters connected to them
+        self.all_ids = set()
+        for port_details in port_list:
+            port_id = port_details['id']
+            self.all_ids.add(port_id)
+            for keyword in port_details.get('keywords') or []:
+                self.keyword_index.setdefault(keyword.upper(), set()).add(port_id)
+            self.mode_index.setdefault(port_details.get('mode'), set()).add(port_id)
+            self.group_index.setdefault(port_details.get('port_group_id'), set()).add(port_id)
+            if port_details.get('enabled'):
+                self.enabled_ids.add(port_id)
+            if not port_details.get('dest_filter_list') and not port_details.get('source_filter_list'):
+                self.unconnected_ids.add(port_id)
+    
+    # Port IDs having the keyword
+    def with_keyword(self, keyword):
+        return self.keyword_index.get(keyword.upper(), set())
+    
+    # Port IDs in the mode
+    def with_mode(self, mode):
+        return self.mode_index.get(mode, set())
+    
+    # Port IDs that are members of a port group, or are not in any port group if the ID is None
+    def in_group(self, port_group_id):
+        return self.group_index.get(port_group_id, set())
+    
+    # Match ports against a tag expression, optionally within a set of candidate port IDs
+    # Returns a dict of matching port ID -> the first term that matched, like 'TAP+10G'
+    def match(self, tags, candidate_ids=None):
+        matching_ports = {}
+        for term_tags in parse_tag_expression(tags):
+            term_ids = set(self.all_ids) if candidate_ids is None else set(candidate_ids)
+            for tag in term_tags:
+                term_ids &= self.with_keyword(tag)
+            for port_id in term_ids:
+                if port_id not in matching_ports:
+                    matching_ports[port_id] = tag_expression_and_separator.join(term_tags)
+        return matching_ports
+
+# Return the port inventory for an NPB session, creating an empty one if needed
+def nto_port_inventory(nto):
+    if nto not in nto_port_inventories:
+        nto_port_inventories[nto] = NtoPortInventory(nto)
+    return nto_port_inventories[nto]
+
+# Parse a software version, like 5.3.0 or 10.1.2-b123, into a tuple of numbers to compare, like (5, 3, 0)
+def nto_parse_version(software_version):
+    return tuple(int(version_part) for version_part in re.findall(r'[0-9]+', software_version or ''))
+
+# Capabilities of an NPB: software version and names of attributes that depend on it, board types, media types
+# and FEC support of their ports. Capabilities are probed in sections, each with a single request on first use:
+# 'system' - software version, 'hardware' - board type of the system. The 'ports' section is learned from port
+# details that actions have read anyway. Actions that read system or port details anyway pass them here too,
+# to save the following actions a round trip
+class NtoCapabilities(object):
+    def __init__(self, nto, host_ip):
+        self.nto = nto
+        self.lock = threading.RLock()   # A section is probed once, even if several policy steps ask for it at the same time
+        self.sections = {}      # Section name -> {'time': when it was probed, ...}
+        self.capability_file = None
+        if nto_cache_mode is not None:
+            self.capability_file = host_ip + capability_file_suffix
+            if nto_cache_mode != 'refresh':
+                self.load()
+    
+    def load(self):
+        try:
+            with open(self.capability_file) as f:
+                sections = json.load(f)
+        except Exception:
+            return
+        if isinstance(sections, dict):
+            now = time.time()
+            self.sections = dict([(name, section) for name, section in sections.items() \
+                                  if isinstance(section, dict) and now - section.get('time', 0) < capability_ttl_default])
+    
+    # Save the capabilities, replacing the previous file only after the new one is completely written
+    def save(self):
+        if self.capability_file is None:
+            return
+        try:
+            with open(self.capability_file + '.tmp', 'w') as f:
+                json.dump(self.sections, f, indent=1, sort_keys=True)
+            os.rename(self.capability_file + '.tmp', self.capability_file)
+        except (IOError, OSError) as e:
+            print("Warning: can't save NPB capabilities to %s: %s" % (self.capability_file, e))
+    
+    def update_section(self, name, section):
+        with self.lock:
+            section['time'] = time.time()
+            self.sections[name] = section
+            self.save()
+    
+    def section(self, name):
+        with self.lock:
+            if name not in self.sections:
+                if name == 'system':
+                    self.learn_system(self.nto.getSystem())
+                elif name == 'hardware':
+                    self.learn_hardware(self.nto.getLoginInfo())
+                else:
+                    return {}
+            return self.sections[name]
+    
+    # Learn capabilities from system properties, as returned by getSystem()
+    def learn_system(self, system_properties):
+        software_version = system_properties.get('software_version')
+        version = nto_parse_version(software_version)
+        self.update_section('system', {'software_version': software_version, 'version': list(version),
+            'attribute_names': dict([(name, attribute_name(version)) for name, attribute_name in capability_attribute_names.items()])})
+    
+    # Learn capabilities from login info, as returned by getLoginInfo()
+    def learn_hardware(self, login_info):
+        self.update_section('hardware', {'board_type': login_info.get('hardware_info', {}).get('board_type')})
+    
+    # Learn board types, media types and FEC support from a list of port details
+    def learn_ports(self, port_list):
+        with self.lock:
+            ports_section = copy.deepcopy(self.sections.get('ports', {'board_types': {}, 'port_board_types': {}}))
+            for port_details in port_list:
+                board_type = port_details.get('misc', {}).get('board_type')
+                if board_type is None:
+                    continue
+                ports_section['port_board_types'][str(port_details['id'])] = board_type
+                board_capabilities = ports_section['board_types'].setdefault(board_type, {'media_types': [], 'fec': False})
+                if port_details.get('media_type') is not None and port_details['media_type'] not in board_capabilities['media_types']:
+                    board_capabilities['media_types'] = sorted(board_capabilities['media_types'] + [port_details['media_type']])
+                if 'forward_error_correction_settings' in port_details:
+                    board_capabilities['fec'] = True
+            if ports_section != self.sections.get('ports'):
+                self.update_section('ports', ports_section)
+    
+    def software_version(self):
+        return self.section('system')['software_version']
+    
+    def version(self):
+        return tuple(self.section('system')['version'])
+    
+    # Name of an attribute used by the NPB API, for an attribute listed in capability_attribute_names
+    def attribute_name(self, name):
+        return self.section('system')['attribute_names'].get(name, name)
+    
+    # Board type of a port: from its details, if they include it, as learned from earlier port details, or the board type of the system
+    def port_board_type(self, port_details):
+        board_type = port_details.get('misc', {}).get('board_type')
+        if board_type is None:
+            board_type = self.sections.get('ports', {}).get('port_board_types', {}).get(str(port_details.get('id')))
+        if board_type is None:
+            board_type = self.section('hardware')['board_type']
+        return board_type
+
+# Return capabilities of an NPB for a session, probing them as needed
+def nto_capabilities(nto, host_ip):
+    if nto not in nto_session_capabilities:
+        nto_session_capabilities[nto] = NtoCapabilities(nto, host_ip)
+    return nto_session_capabilities[nto]
+
+# Return the part of object properties that differ from the current object details. Nested properties, like FEC settings,
+# are compared key by key. Lists of IDs and keywords are compared as sets, since NPBs may return them in a different order,
+# keywords regardless of case, since NPBs store them in upper case
+def nto_properties_diff(object_details, properties):
+    properties_diff = {}
+    for key in properties:
+        if isinstance(properties[key], dict) and isinstance(object_details.get(key), dict):
+            if any(object_details[key].get(nested_key) != properties[key][nested_key] for nested_key in properties[key]):
+                properties_diff[key] = properties[key]
+        elif key == 'keywords' and isinstance(properties[key], list) and isinstance(object_details.get(key), list):
+            if set(keyword.upper() for keyword in object_details[key]) != set(keyword.upper() for keyword in properties[key]):
+                properties_diff[key] = properties[key]
+        elif key in nto_id_list_properties and isinstance(properties[key], list) and isinstance(object_details.get(key), list):
+            if set(object_details[key]) != set(properties[key]):
+                properties_diff[key] = properties[key]
+        elif object_details.get(key) != properties[key]:
+            properties_diff[key] = properties[key]
+    return properties_diff
+
+# Merge properties into pending changes of an object. Nested properties are merged key by key, later values win
+def nto_properties_merge(pending_properties, properties):
+    for key in properties:
+        if isinstance(properties[key], dict) and isinstance(pending_properties.get(key), dict):
+            pending_properties[key] = dict(pending_properties[key])
+            pending_properties[key].update(properties[key])
+        else:
+            pending_properties[key] = properties[key]
+    return pending_properties
+
+# Modify an NPB object with a single request, then read back the modified properties to verify they took effect
+# Input
+# - NTO object as a connection to an NPB
+# - Object type: 'port', 'port_group' or 'filter'
+# - Object ID
+# - Properties to modify
+# Returns a tuple of (True if all the properties have the requested values, object details read back after the update)
+def nto_modify_and_verify(nto, object_type, object_id, properties):
+    if object_type == 'port':
+        nto.modifyPort(str(object_id), properties)
+        object_details = nto.getPortProperties(str(object_id), ','.join(['id', 'name', 'default_name'] + list(properties.keys())))
+    elif object_type == 'port_group':
+        nto.modifyPortGroup(str(object_id), properties)
+        object_details = nto.getPortGroup(str(object_id))
+    elif object_type == 'filter':
+        nto.modifyFilter(str(object_id), properties)
+        object_details = nto.getFilter(str(object_id))
+    else:
+        raise ValueError("unsupported object type %s" % object_type)
+    if object_details is None:
+        return (False, None)
+    return (len(nto_properties_diff(object_details, properties)) == 0, object_details)
+
+# Retrieve details of several ports at once
+# Returns a list of (port details, error) tuples in the same order as port IDs, like nto_parallel_map()
+def nto_get_ports(nto, port_id_list, workers=nto_workers_default):
+    aio_client = nto_aio_client(nto)
+    if aio_client is not None:
+        return aio_client.run_all([aio_client.getPort(str(port_id)) for port_id in port_id_list])
+    return nto_parallel_map(lambda port_id: nto.getPort(str(port_id)), port_id_list, workers)
+
+# Modify several objects of the same type at once, and verify the changes, see nto_modify_and_verify()
+# Input
+# - NTO object as a connection to an NPB
+# - Object type: 'port', 'port_group' or 'filter'
+# - Dict of object ID -> properties to modify
+# Returns a list of ((verified, object details), error) tuples in the order of sorted object IDs, like nto_parallel_map()
+def nto_modify_and_verify_all(nto, object_type, pending, workers=nto_workers_default):
+    object_id_list = sorted(pending.keys())
+    aio_client = nto_aio_client(nto)
+    if aio_client is None:
+        return nto_parallel_map(lambda object_id: nto_modify_and_verify(nto, object_type, object_id, pending[object_id]), object_id_list, workers)
+    modify_results = []
+    for object_id, (object_details, modify_error) in zip(object_id_list, aio_client.run_all([aio_client.modify_and_read(object_type, str(object_id), pending[object_id]) for object_id in object_id_list])):
+        # Writes over the asyncio client bypass the session, so cached responses they make stale are dropped here
+        if isinstance(nto, NtoCachingClient):
+            nto.response_cache.invalidate_object_type(object_type, object_id, object_details if object_details is not None else pending[object_id])
+        if modify_error is not None:
+            modify_results.append((None, modify_error))
+        elif object_details is None:
+            modify_results.append(((False, None), None))
+        else:
+            modify_results.append(((len(nto_properties_diff(object_details, pending[object_id])) == 0, object_details), None))
+    return modify_results
+
+# Pending changes to NPB objects of one type. Properties staged for the same object, one call after another,
+# are merged and sent to the NPB as a single modify request per object when the batch is flushed
+class NtoWriteBatch(object):
+    def __init__(self, nto, object_type='port'):
+        self.nto = nto
+        self.object_type = object_type
+        self.pending = {}       # Object ID -> merged properties
+    
+    def stage(self, object_id, properties):
+        nto_properties_merge(self.pending.setdefault(object_id, {}), properties)
+    
+    def __len__(self):
+        return len(self.pending)
+    
+    # Send all pending changes in parallel and verify them
+    # Returns a dict of object ID -> {'verified': True if the changes took effect, 'details': object details read back, 'error': error string or None}
+    def flush(self, workers=nto_workers_default):
+        object_id_list = sorted(self.pending.keys())
+        pending = self.pending
+        self.pending = {}
+        flush_results = nto_modify_and_verify_all(self.nto, self.object_type, pending, workers)
+        batch_results = {}
+        for object_id, (modify_result, modify_error) in zip(object_id_list, flush_results):
+            if modify_error is not None:
+                batch_results[object_id] = {'verified': False, 'details': None, 'error': modify_error}
+            else:
+                batch_results[object_id] = {'verified': modify_result[0], 'details': modify_result[1], 'error': None}
+            if self.object_type == 'port':
+                nto_port_inventory(self.nto).invalidate(object_id)
+        return batch_results
+
+# Search for ports that can be connected to a dynamic filter via keyword search
 # Input 
 # - NTO object as a connection to an NPB
-# - Dynamic filter ID
 # - Ports keywords to search for
 # - Direction of the connection - input or output
-def df_connect_via_tags(nto, df_id, tags, connection_mode):
+# Returns a sorted list of matching port IDs, or None if the connection mode is not supported
+def df_tag_connection_candidates(nto, tags, connection_mode):
     # Check the connection mode is supported
     if connection_mode not in df_connection_modes_supported.keys():
         print("Error: connection mode %s is not supported" % connection_mode)
-        return
+        return None
     
     # Search for ports to be connected - can't be a part of port group. Must already be in the required mode
-    port_list = nto.searchPorts({'enabled': True, 'port_group_id': None, 'mode': df_connection_modes_supported[connection_mode]})
-    matching_port_id_list = []
-    for port in port_list:
-        port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-        if port_details is not None:
-            for keyword in tags:
-                if keyword in port_details['keywords'] and port['id'] not in matching_port_id_list:
-                    matching_port_id_list.append(port['id'])
-                    print("Found port %s with ID %d, matching mode and keyword %s" % (port['name'], port['id'], keyword))
+    port_inventory = nto_port_inventory(nto)
+    port_index = port_inventory.index()
+    candidate_ids = port_index.enabled_ids & port_index.in_group(None) & port_index.with_mode(df_connection_modes_supported[connection_mode])
+    matching_ports = port_index.match(tags, candidate_ids)
+    matching_port_id_list = sorted(matching_ports.keys())
+    for port_id in matching_port_id_list:
+        port = port_inventory.get_port(port_id)
+        print("Found port %s with ID %d, matching mode and keyword %s" % (port['name'], port['id'], matching_ports[port_id]))
                 
     if len(matching_port_id_list) == 0:
         print("No matching ports found with keywords %s" % " ".join(tags))
-        return
     else:
         print("Found %d matching ports" % (len(matching_port_id_list)))
-
-    # Retrieve a list of existing ports connected to the DF
-    if connection_mode == 'input':
-        df_property = 'source_port_list'
-    else:
-        df_property = 'dest_port_list'
-        
-    connect_list = nto.getFilterProperty(df_id, df_property) # TODO handle 404 not found situation
-    connect_count_current = len(connect_list)
-    for port_id in matching_port_id_list:
-        if port_id not in connect_list:
-            connect_list.extend([port_id])
-    
-    # Update the filter connections if there is a change needed
-    if len(connect_list) != connect_count_current:
-        print("Updating %s filter connections with port IDs: %s" % (connection_mode, " ".join(str(i) for i in matching_port_id_list)))
-        nto.modifyFilter(df_id, {df_property: connect_list})
-    else:
-        print("No changes to %s filter connections are needed" % connection_mode)
-    
\ No newline at end of file
+    return matching_port_id_list
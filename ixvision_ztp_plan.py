@@ -0,0 +1,153 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_plan.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Plan NPB configuration changes before making them
+# 1. An action reads the current state of the NPB once and describes the state it wants to get to as a plan
+# 2. Each planned modification is compared with the current state of the object, and only properties that actually
+#    need to change are kept. Modifications that don't change anything are dropped from the plan
+# 3. The plan can be printed without touching the NPB (dry run), or applied. Consecutive modifications of the same
+#    type of objects are sent in parallel, one request per object. Applying stops at the first failed step
+# 4. Objects can also be planned for deletion, like those a rollback removes. Deletions are made one at a time, in the planned order
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.  
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import json
+
+from ksvisionlib import *
+
+from ixvision_ztp_ntolib import *
+
+# DEFINE VARs HERE
+plan_object_type_names = {'port': 'port', 'port_group': 'port group', 'filter': 'filter'}
+
+# DEFINE FUNCTIONS HERE
+
+# Ordered list of writes needed to bring NPB objects to the desired state
+class NtoPlan(object):
+    def __init__(self, nto):
+        self.nto = nto
+        self.steps = []         # List of {'action': 'create', 'modify' or 'delete', 'object_type', 'object_id', 'object_name', 'properties'}
+        self.skipped_count = 0  # Modifications dropped from the plan since they wouldn't change anything
+    
+    def __len__(self):
+        return len(self.steps)
+    
+    # Plan creation of a new object
+    def create(self, object_type, object_name, properties):
+        self.steps.append({'action': 'create', 'object_type': object_type, 'object_id': None, 'object_name': object_name, 'properties': properties})
+    
+    # Plan modification of an existing object, keeping only the properties that differ from its current details
+    # Returns True if the modification is needed
+    def modify(self, object_type, object_id, object_name, current_details, properties):
+        properties_diff = nto_properties_diff(current_details, properties)
+        if len(properties_diff) == 0:
+            self.skipped_count += 1
+            return False
+        # Several modifications of the same object are merged into one
+        for step in self.steps:
+            if step['action'] == 'modify' and step['object_type'] == object_type and step['object_id'] == object_id:
+                nto_properties_merge(step['properties'], properties_diff)
+                return True
+        self.steps.append({'action': 'modify', 'object_type': object_type, 'object_id': object_id, 'object_name': object_name, 'properties': properties_diff})
+        return True
+    
+    # Plan deletion of an existing object
+    def delete(self, object_type, object_id, object_name):
+        self.steps.append({'action': 'delete', 'object_type': object_type, 'object_id': object_id, 'object_name': object_name, 'properties': None})
+    
+    def describe_step(self, step):
+        if step['object_id'] is None:
+            object_description = "%s %s" % (plan_object_type_names[step['object_type']], step['object_name'])
+        else:
+            object_description = "%s %s (ID %s)" % (plan_object_type_names[step['object_type']], step['object_name'], step['object_id'])
+        if step['properties'] is None:
+            return "%s %s" % (step['action'], object_description)
+        return "%s %s: %s" % (step['action'], object_description, json.dumps(step['properties'], sort_keys=True))
+    
+    def show(self):
+        print("Plan: %d writes, %d writes skipped as not changing anything" % (len(self.steps), self.skipped_count))
+        for step_num, step in enumerate(self.steps, 1):
+            print("  %d. %s" % (step_num, self.describe_step(step)))
+    
+    def create_object(self, step):
+        if step['object_type'] == 'port_group':
+            return self.nto.createPortGroup(step['properties'])
+        elif step['object_type'] == 'filter':
+            return self.nto.createFilter(step['properties'], True) # the last parameter is for allowTemporayDataLoss
+        raise ValueError("can't create objects of type %s" % step['object_type'])
+    
+    def delete_object(self, step):
+        if step['object_type'] == 'port_group':
+            return self.nto.deletePortGroup(str(step['object_id']))
+        elif step['object_type'] == 'filter':
+            return self.nto.deleteFilter(str(step['object_id']))
+        raise ValueError("can't delete objects of type %s" % step['object_type'])
+    
+    # Apply the plan. Consecutive modifications of objects of the same type are sent in parallel
+    # Returns a list of objects created by the plan, in the order of steps, or None if a step failed
+    def apply(self, workers=nto_workers_default):
+        with nto_metrics.phase('apply'):
+            return self.apply_steps(workers)
+    
+    def apply_steps(self, workers):
+        created_objects = []
+        step_index = 0
+        while step_index < len(self.steps):
+            step = self.steps[step_index]
+            if step['action'] == 'create':
+                try:
+                    new_object = self.create_object(step)
+                except Exception as e:
+                    print("Failed to %s: %s" % (self.describe_step(step), e))
+                    return self.abort(step_index)
+                if new_object is None or len(new_object) == 0:
+                    print("Failed to %s" % self.describe_step(step))
+                    return self.abort(step_index)
+                step['object_id'] = new_object['id']
+                created_objects.append(new_object)
+                print("Created %s %s with id %s" % (plan_object_type_names[step['object_type']], step['object_name'], new_object['id']))
+                step_index += 1
+                continue
+            if step['action'] == 'delete':
+                try:
+                    self.delete_object(step)
+                except Exception as e:
+                    print("Failed to %s: %s" % (self.describe_step(step), e))
+                    return self.abort(step_index)
+                print("Deleted %s %s" % (plan_object_type_names[step['object_type']], step['object_name']))
+                step_index += 1
+                continue
+            
+            # Collect consecutive modifications of the same object type into a batch
+            batch_steps = []
+            batch = NtoWriteBatch(self.nto, step['object_type'])
+            while step_index < len(self.steps) and self.steps[step_index]['action'] == 'modify' and self.steps[step_index]['object_type'] == step['object_type']:
+                batch_steps.append(self.steps[step_index])
+                batch.stage(self.steps[step_index]['object_id'], self.steps[step_index]['properties'])
+                step_index += 1
+            batch_results = batch.flush(workers)
+            batch_failed = False
+            for batch_step in batch_steps:
+                batch_result = batch_results[batch_step['object_id']]
+                if batch_result['verified']:
+                    print("Updated %s %s: %s" % (plan_object_type_names[batch_step['object_type']], batch_step['object_name'], ", ".join(sorted(batch_step['properties'].keys()))))
+                else:
+                    print("Failed to %s%s" % (self.describe_step(batch_step), ": " + batch_result['error'] if batch_result['error'] is not None else ", the change didn't take effect"))
+                    batch_failed = True
+            if batch_failed:
+                return self.abort(step_index)
+        return created_objects
+    
+    def abort(self, step_index):
+        if step_index < len(self.steps):
+            print("Stopped applying the plan, %d remaining writes were not made" % (len(self.steps) - step_index))
+        return None
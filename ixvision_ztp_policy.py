@@ -0,0 +1,371 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_policy.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Apply a declarative policy - ports to tag, port modes, port groups and filters - as a graph of steps run in parallel
+# 1. A policy is a JSON file listing LLDP tags, port modes, port groups and dynamic filters, see README.md for the format
+# 2. The policy is compiled into steps: tag_ports, set_port_mode, form_port_groups and form_dynamic_filter. Each step
+#    reads and writes parts of the NPB: keywords of ports with a tag, a port group, a filter, and settings of ports it selects by tags
+# 3. A step depends on the steps listed before it in the policy that write what it reads or writes, or read what it writes.
+#    A port may carry more than one tag, so steps that write settings of ports are also ordered by the ports themselves:
+#    once a step is ready to run, its tags are matched against the port inventory, and it waits for the steps listed before
+#    it that write any of the same ports. Steps over different ports, like two unrelated port groups, run at the same time
+# 4. Steps run over a single NPB session as soon as all the steps they depend on have completed, up to a number of steps at a time.
+#    Output of each step is printed as a whole when it completes. A step fails if its action raises an error or returns False,
+#    like when a port group can't be created, and steps depending on a failed step are skipped
+# 5. When all steps are done, time of each step and the critical path - the chain of dependent steps that took the longest - are reported
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import sys
+import json
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from ksvisionlib import *
+
+from ixvision_ztp_ntolib import *
+from ixvision_ztp_lldp_tag import tag_ports
+from ixvision_ztp_port_mode import set_port_mode
+from ixvision_ztp_port_group import form_port_groups
+from ixvision_ztp_filter import form_dynamic_filter
+
+# DEFINE VARs HERE
+
+# Sections of a policy file, in the order their steps are listed
+policy_sections = ['tags', 'port_modes', 'port_groups', 'filters']
+
+# Report of the last policy run, included in the run report
+policy_report = {}
+
+# DEFINE FUNCTIONS HERE
+
+# Tags of a policy entry, given as a list or as a comma-separated string
+def policy_tag_list(tags):
+    if isinstance(tags, list):
+        return [str(tag).strip() for tag in tags if str(tag).strip() != '']
+    if tags is None:
+        return []
+    return [tag.strip() for tag in str(tags).split(',') if tag.strip() != '']
+
+# Parts of the NPB that steps selecting ports by tags read: 'tag:X' - keywords of ports tagged X
+def policy_tag_resources(kind, tags):
+    return set([kind + ':' + tag for tag_term in parse_tag_expression(tags) for tag in tag_term])
+
+# A step of a policy. Steps that change settings of ports, like mode or port group, list tags the ports are selected by
+def policy_step(name, action, kwargs, reads, writes, port_tags=None):
+    return {'name': name, 'action': action, 'kwargs': kwargs, 'reads': reads, 'writes': writes, 'port_tags': port_tags, 'depends': [], 'after': []}
+
+# Load a policy from a JSON file. Returns None if it can't be read
+def load_policy(filename):
+    try:
+        with open(filename) as f:
+            policy = json.load(f)
+    except Exception as e:
+        print("Error: can't read policy from %s: %s" % (filename, e))
+        return None
+    if not isinstance(policy, dict):
+        print("Error: policy in %s is not a JSON object" % filename)
+        return None
+    return policy
+
+# Compile a policy into a list of steps, each with a list of indexes of the steps it depends on
+# Returns None if the policy is not valid
+def compile_policy(policy):
+    unknown_sections = [section for section in policy if section not in policy_sections]
+    if len(unknown_sections) > 0:
+        print("Error: unknown policy sections %s, use: %s" % (", ".join(sorted(unknown_sections)), ", ".join(policy_sections)))
+        return None
+    steps = []
+
+    policy_tags = policy.get('tags')
+    if policy_tags is not None:
+        if not isinstance(policy_tags, dict):
+            policy_tags = {'tags': policy_tags}
+        tags = policy_tag_list(policy_tags.get('tags'))
+        if len(tags) == 0:
+            print("Error: no tags to search for in LLDP neighbor port descriptions in the policy")
+            return None
+        steps.append(policy_step('tag_ports', tag_ports,
+            {'tags': tags, 'ignore_case': policy_tags.get('ignore_case', False), 'whole_word': policy_tags.get('word', False), 'full_scan': policy_tags.get('full', False)},
+            set(), policy_tag_resources('tag', tags)))
+
+    for entry in policy.get('port_modes', []):
+        tags = policy_tag_list(entry.get('tags'))
+        if len(tags) == 0 or entry.get('mode') not in port_modes_supported:
+            print("Error: a port mode in the policy needs tags and a mode, one of: %s" % ", ".join(sorted(port_modes_supported.keys())))
+            return None
+        steps.append(policy_step('set_port_mode:%s:%s' % (entry['mode'], ','.join(tags)), set_port_mode, {'tags': tags, 'mode': entry['mode']},
+                                 policy_tag_resources('tag', tags), set(), tags))
+
+    for entry in policy.get('port_groups', []):
+        tags = [tag.upper() for tag in policy_tag_list(entry.get('tags'))]
+        if entry.get('name') is None or len(tags) == 0 or entry.get('mode') not in pg_modes_supported:
+            print("Error: a port group in the policy needs a name, tags and a mode, one of: %s" % ", ".join(sorted(pg_modes_supported.keys())))
+            return None
+        steps.append(policy_step('form_port_groups:%s' % entry['name'], form_port_groups, {'tags': tags, 'pg_name': entry['name'], 'pg_mode_key': entry['mode']},
+                                 policy_tag_resources('tag', tags), set(['group:' + entry['name']]), tags))
+
+    for entry in policy.get('filters', []):
+        if entry.get('name') is None or entry.get('input') is None or entry.get('output') is None or entry.get('mode') not in df_modes_supported:
+            print("Error: a filter in the policy needs a name, input, output and a mode, one of: %s" % ", ".join(sorted(df_modes_supported.keys())))
+            return None
+        df_criteria = entry.get('criteria')
+        if df_criteria is None and entry.get('criteria_file') is not None:
+            try:
+                with open(entry['criteria_file']) as f:
+                    df_criteria = json.load(f)
+            except Exception as e:
+                print("Error: can't parse filter criteria from %s: %s" % (entry['criteria_file'], e))
+                return None
+        if df_criteria_required(entry['mode']) and df_criteria is None:
+            print("Error: criteria or criteria_file is required for filter %s in mode %s" % (entry['name'], entry['mode']))
+            return None
+        tag_mode = entry.get('tag_mode', False)
+        if tag_mode:
+            port_tags = policy_tag_list(entry['input']) + policy_tag_list(entry['output'])
+            reads = policy_tag_resources('tag', port_tags)
+        else:
+            port_tags = None
+            reads = set(['group:' + entry['input'], 'group:' + entry['output']])
+        steps.append(policy_step('form_dynamic_filter:%s' % entry['name'], form_dynamic_filter,
+            {'df_name': entry['name'], 'df_input': entry['input'], 'df_output': entry['output'], 'df_mode': entry['mode'], 'df_criteria': df_criteria,
+             'use_tag_mode': tag_mode, 'compact': entry.get('compact', False), 'capacity': entry.get('capacity')},
+            reads, set(['filter:' + entry['name']]), port_tags))
+
+    step_names = [step['name'] for step in steps]
+    duplicate_names = sorted(set([name for name in step_names if step_names.count(name) > 1]))
+    if len(duplicate_names) > 0:
+        print("Error: the policy lists the same step more than once: %s" % ", ".join(duplicate_names))
+        return None
+
+    # A step depends on an earlier one if either of them writes what the other one reads or writes
+    for step_index, step in enumerate(steps):
+        for earlier_index in range(step_index):
+            earlier_step = steps[earlier_index]
+            if earlier_step['writes'] & (step['reads'] | step['writes']) or earlier_step['reads'] & step['writes']:
+                step['depends'].append(earlier_index)
+    # Drop dependencies that follow from other ones, like a filter on a port group depending on tagging through that group
+    for step in steps:
+        indirect_depends = set()
+        for depend_index in step['depends']:
+            indirect_depends |= policy_step_ancestors(steps, depend_index)
+        step['depends'] = [depend_index for depend_index in step['depends'] if depend_index not in indirect_depends]
+    return steps
+
+# Indexes of all the steps a step depends on, directly or not
+def policy_step_ancestors(steps, step_index):
+    ancestors = set()
+    pending = list(steps[step_index]['depends'])
+    while len(pending) > 0:
+        depend_index = pending.pop()
+        if depend_index not in ancestors:
+            ancestors.add(depend_index)
+            pending.extend(steps[depend_index]['depends'])
+    return ancestors
+
+def print_policy_steps(steps):
+    print("Policy compiled into %d steps:" % len(steps))
+    for step in steps:
+        print("  %-40s after: %s" % (step['name'], ", ".join([steps[depend_index]['name'] for depend_index in step['depends']]) or '-'))
+    if len([step for step in steps if step['port_tags'] is not None]) > 1:
+        print("Steps that write settings of the same ports also run in the order of the policy, ports are matched when the steps are ready to run")
+
+# Ports a step writes settings of: the ports its tags match in the current port inventory
+def policy_step_port_ids(nto, step):
+    return set(nto_port_inventory(nto).index().match(step['port_tags']).keys())
+
+# Stream that collects output of each policy step separately, written by the thread running the step.
+# Output of other threads goes to the original stream
+class PolicyStepOutput(object):
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.lines = []
+
+    def release(self):
+        captured_output = ''.join(self.local.lines)
+        self.local.lines = None
+        return captured_output
+
+    def write(self, text):
+        lines = getattr(self.local, 'lines', None)
+        if lines is None:
+            self.stream.write(text)
+        else:
+            lines.append(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+# The chain of dependent steps that took the longest, as a list of step indexes, and its duration
+def policy_critical_path(steps, step_results):
+    path_seconds = {}
+    path_previous = {}
+    for step_index, step in enumerate(steps):
+        # Dependencies are always listed before the step, so their paths are already known
+        path_previous[step_index] = None
+        longest_seconds = 0.0
+        for depend_index in step['depends'] + step['after']:
+            if path_seconds[depend_index] > longest_seconds:
+                longest_seconds = path_seconds[depend_index]
+                path_previous[step_index] = depend_index
+        path_seconds[step_index] = longest_seconds + step_results[step_index]['seconds']
+    if len(steps) == 0:
+        return ([], 0.0)
+    step_index = max(path_seconds, key=lambda index: path_seconds[index])
+    critical_seconds = path_seconds[step_index]
+    critical_path = []
+    while step_index is not None:
+        critical_path.insert(0, step_index)
+        step_index = path_previous[step_index]
+    return (critical_path, critical_seconds)
+
+# Apply a policy to an NPB
+# Input
+# - NPB host, port and credentials
+# - Policy file name
+# - Number of steps to run at the same time
+# - Only print the steps compiled from the policy and their dependencies
+# Returns False if the policy is not valid, or any of its steps failed or was skipped
+def apply_policy(host_ip, port, username, password, policy_file, jobs=policy_jobs_default, plan_only=False):
+    policy = load_policy(policy_file)
+    if policy is None:
+        return False
+    steps = compile_policy(policy)
+    if steps is None:
+        return False
+    print_policy_steps(steps)
+    if plan_only or len(steps) == 0:
+        return True
+
+    # Steps share the session, its port inventory and capabilities, created here before the steps can race for them
+    nto = nto_connect(host_ip, port, username, password)
+    nto_port_inventory(nto)
+    nto_capabilities(nto, host_ip)
+
+    step_output = PolicyStepOutput(sys.stdout)
+    phase_stack = list(nto_metrics.current_phases())
+    policy_start_time = time.time()
+
+    def run_step(step_index):
+        step = steps[step_index]
+        step_output.capture()
+        step_start_time = time.time()
+        step_error = None
+        try:
+            with nto_metrics.inherit_phases(phase_stack):
+                with nto_metrics.phase(step['name']):
+                    if not step['action'](host_ip, port, username, password, **step['kwargs']):
+                        step_error = "the step reported a failure, see its output"
+        except (Exception, SystemExit) as e:
+            step_error = "%s: %s" % (type(e).__name__, e)
+        return (step_index, {'start': step_start_time - policy_start_time, 'seconds': time.time() - step_start_time,
+                             'error': step_error, 'output': step_output.release()})
+
+    step_results = {}
+    step_status = {}    # Step index -> 'done', 'failed' or 'skipped'
+    step_port_ids = {}  # Step index -> IDs of ports the step writes, once it is ready to run
+
+    # Steps listed before a step that write the same ports and have completed, or None if the step has to wait for some of them.
+    # Ports of a step are only known once it is ready to run, since tagging of ports before it changes what its tags match
+    def port_conflicts(step_index):
+        if step_index not in step_port_ids:
+            step_port_ids[step_index] = policy_step_port_ids(nto, steps[step_index])
+        conflict_indexes = []
+        for earlier_index in range(step_index):
+            if steps[earlier_index]['port_tags'] is None or step_status.get(earlier_index) in ['failed', 'skipped']:
+                continue
+            if earlier_index not in step_port_ids:
+                return None
+            if step_port_ids[earlier_index] & step_port_ids[step_index]:
+                if earlier_index not in step_status:
+                    return None
+                conflict_indexes.append(earlier_index)
+        return conflict_indexes
+
+    pending_steps = list(range(len(steps)))
+    completed_steps = queue.Queue()
+    running_count = 0
+    pool = ThreadPool(max(1, min(jobs, len(steps))))
+    sys.stdout = step_output
+    try:
+        while len(pending_steps) > 0 or running_count > 0:
+            # Start every step whose dependencies have completed. A step depending on a failed or skipped one is skipped,
+            # which may in turn settle other steps, so the pending steps are checked again until nothing changes
+            settled = True
+            while settled:
+                settled = False
+                for step_index in list(pending_steps):
+                    if not all(depend_index in step_status for depend_index in steps[step_index]['depends']):
+                        continue
+                    if all(step_status[depend_index] == 'done' for depend_index in steps[step_index]['depends']):
+                        if steps[step_index]['port_tags'] is not None:
+                            conflict_indexes = port_conflicts(step_index)
+                            if conflict_indexes is None:
+                                continue
+                            steps[step_index]['after'] = [earlier_index for earlier_index in conflict_indexes
+                                                          if earlier_index not in policy_step_ancestors(steps, step_index)]
+                        pending_steps.remove(step_index)
+                        pool.apply_async(run_step, (step_index,), callback=completed_steps.put)
+                        running_count += 1
+                    else:
+                        pending_steps.remove(step_index)
+                        step_status[step_index] = 'skipped'
+                        step_results[step_index] = {'start': time.time() - policy_start_time, 'seconds': 0.0, 'error': None, 'output': ''}
+                        print("")
+                        print("Skipping step %s, a step it depends on has not completed" % steps[step_index]['name'])
+                        settled = True
+            if running_count == 0:
+                break
+            step_index, step_result = completed_steps.get()
+            running_count -= 1
+            step_results[step_index] = step_result
+            step_status[step_index] = 'done' if step_result['error'] is None else 'failed'
+            print("")
+            print("Step %s completed in %.1fs:" % (steps[step_index]['name'], step_result['seconds']))
+            sys.stdout.write(step_result['output'])
+            if step_result['error'] is not None:
+                print("Error in step %s: %s" % (steps[step_index]['name'], step_result['error']))
+    finally:
+        sys.stdout = step_output.stream
+        pool.close()
+        pool.join()
+
+    policy_seconds = time.time() - policy_start_time
+    critical_path, critical_seconds = policy_critical_path(steps, step_results)
+    print("")
+    print("%-40s %-8s %8s %8s" % ('Step', 'Status', 'Start', 'Seconds'))
+    for step_index, step in enumerate(steps):
+        print("%-40s %-8s %8.1f %8.1f" % (step['name'], step_status[step_index], step_results[step_index]['start'], step_results[step_index]['seconds']))
+    print("Policy applied in %.1fs, steps took %.1fs in total. Critical path, %.1fs: %s" % \
+          (policy_seconds, sum(step_results[step_index]['seconds'] for step_index in step_results), critical_seconds,
+           " -> ".join([steps[step_index]['name'] for step_index in critical_path])))
+
+    policy_report.clear()
+    policy_report.update({'file': policy_file, 'seconds': round(policy_seconds, 6), 'critical_path': [steps[step_index]['name'] for step_index in critical_path],
+                          'critical_path_seconds': round(critical_seconds, 6),
+                          'steps': [{'name': step['name'], 'status': step_status[step_index], 'depends': [steps[depend_index]['name'] for depend_index in step['depends']],
+                                     'after': [steps[earlier_index]['name'] for earlier_index in step['after']],
+                                     'start': round(step_results[step_index]['start'], 6), 'seconds': round(step_results[step_index]['seconds'], 6)}
+                                    for step_index, step in enumerate(steps)]})
+    nto_metrics.add_report_section('policy', lambda: policy_report)
+    return all(step_status[step_index] == 'done' for step_index in step_status)
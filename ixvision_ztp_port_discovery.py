@@ -7,8 +7,13 @@
 #
 # Description: Perform initial NPB port discovery.
 # End goal is to have a system with LLDP neighbours being observed for further ZTP configuration steps
-# 1. Perform port discovery - cycle through all supported port speeds to brning all possible links up
+# 1. Perform port discovery - cycle through all supported port speeds to brning all possible links up.
+#    Each port goes through its own list of candidate link configurations and moves on to the next candidate
+#    as soon as its own link result is known, independently of other ports
 # 2. Disable all the ports that stayed down, tag the ports that came up as configured by ZTP
+# Settings of the ports in scope are saved in a snapshot before any changes, see ixvision_ztp_snapshot.py
+# Progress of every port is saved in a journal after each step. An interrupted discovery can be resumed from the journal,
+# with the same ports in scope, even though some of them were already enabled
 #
 # COPYRIGHT 2018 - 2019 Keysight Technologies.
 #
@@ -17,13 +22,103 @@
 #
 ###############################################################################
 
+import os
+
 from ksvisionlib import *
 
-def discover_ports(host_ip, port, username, password, keyword=''):
+from ixvision_ztp_ntolib import *
+
+from ixvision_ztp_snapshot import snapshot_save
+
+# DEFINE VARs HERE
+
+# Link configurations to try during port discovery, in order. A port only tries candidates listed for its current media type,
+# skipping those not supported by its board type. Settings are applied on top of NETWORK mode, only if they differ from the current ones
+port_discovery_candidates = [
+    {'name': '100G, FEC ON',  'media_types': ['QSFP28'],                 'settings': {'forward_error_correction_settings': {'enabled': True, 'fec_type': 'RS_FEC'}}},
+    {'name': '100G, FEC OFF', 'media_types': ['QSFP28'],                 'settings': {'forward_error_correction_settings': {'enabled': False}}},
+    {'name': '40G',           'media_types': ['QSFP_PLUS_40G'],          'settings': {}},
+    {'name': '10G',           'media_types': ['SFP_PLUS_10G', 'SFP_1G'], 'settings': {'media_type': 'SFP_PLUS_10G', 'link_settings': '10G_FULL'}},
+    {'name': '1G/Auto',       'media_types': ['SFP_PLUS_10G', 'SFP_1G'], 'settings': {'media_type': 'SFP_1G', 'link_settings': 'AUTO'},
+     'unsupported_board_types': ['EPIPHONE_100_MAIN']}, # 1G is not supported on E100
+]
+
+# Journal of port discovery progress, left by the last run of discover_ports() for an NPB
+portup_journal_file_suffix = '_portup_journal.json'
+
+# DEFINE FUNCTIONS HERE
+
+# Run a task for each port in parallel, then print task output in the order of port IDs, so it doesn't depend on timing
+# A task takes a port ID and returns a tuple of a list of output lines and a result. Errors are collected per port
+# Returns a dict of port ID -> result for the ports that didn't fail
+def run_port_tasks(task, port_id_list, workers, port_errors):
+    port_results = {}
+    port_id_list = sorted(port_id_list)
+    for port_id, (task_result, task_error) in zip(port_id_list, nto_parallel_map(task, port_id_list, workers)):
+        if task_error is not None:
+            print("Error on port ID %s: %s" % (port_id, task_error))
+            port_errors.setdefault(port_id, []).append(task_error)
+        else:
+            output, result = task_result
+            for line in output:
+                print(line)
+            port_results[port_id] = result
+    return port_results
+
+# List discovery candidates applicable to a port, based on its original details and capabilities of the NPB
+def port_discovery_candidate_list(port_details, capabilities):
+    candidate_list = []
+    for candidate in port_discovery_candidates:
+        if port_details['media_type'] not in candidate['media_types']:
+            continue
+        if capabilities.port_board_type(port_details) in candidate.get('unsupported_board_types', []):
+            continue
+        candidate_list.append(candidate)
+    return candidate_list
+
+# Load the port discovery journal saved for an NPB, or None if there is no usable one
+def load_portup_journal(journal_file):
+    try:
+        with open(journal_file) as f:
+            journal = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(journal, dict) or not isinstance(journal.get('ports'), dict):
+        return None
+    return journal
+
+# Save the port discovery journal, replacing the previous one only after the new one is completely written
+def save_portup_journal(journal_file, journal):
+    with open(journal_file + '.tmp', 'w') as f:
+        json.dump(journal, f, indent=1, sort_keys=True)
+    os.rename(journal_file + '.tmp', journal_file)
+
+# Discover link settings of disabled ports. Returns False if discovery failed on any port
+def discover_ports(host_ip, port, username, password, keyword='', workers=nto_workers_default, link_timeout=link_wait_timeout_default, resume=False):
+
+    journal_file = host_ip + portup_journal_file_suffix
+    journal = None
+    if resume:
+        journal = load_portup_journal(journal_file)
+        if journal is None:
+            print("Error: no port discovery journal to resume in %s" % journal_file)
+            return False
+        if journal['phase'] == 'done':
+            print("Port discovery journaled in %s has already completed, nothing to resume" % journal_file)
+            return True
+        # The original scope is kept, regardless of the keyword given this time
+        keyword = journal['keyword']
+        print("Resuming port discovery started at %s, %d ports in scope" % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(journal['started'])), len(journal['ports'])))
+    else:
+        previous_journal = load_portup_journal(journal_file)
+        if previous_journal is not None and previous_journal['phase'] != 'done':
+            print("Starting a new port discovery, the interrupted one journaled in %s won't be possible to resume" % journal_file)
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
 
     discoveredPortList = {}
+    port_errors = {}    # Port ID -> list of errors, collected instead of aborting the discovery
+    unread_ports = {}   # Port ID -> journal entry of a port in scope that couldn't be read, see save_journal()
 
     # Enumerate disabled ports - we are not touching anything that can already carry traffic
     searchTerms = {'enabled':False}
@@ -31,275 +126,250 @@ def discover_ports(host_ip, port, username, password, keyword=''):
         # Limit ZTP scope by a keyword if provided
         searchTerms = {"keywords":[keyword],'enabled':False}
         
-    for ntoPort in nto.searchPorts(searchTerms):
-        ntoPortDetails = nto.getPort(str(ntoPort['id']))
-        discoveredPortList[ntoPort['id']] = {'name': ntoPortDetails['default_name'], 'type': 'port', 'ZTPSucceeded': False, 'details': ntoPortDetails}
+    with nto_metrics.phase('read'):
+        if journal is None:
+            port_id_list = sorted([ntoPort['id'] for ntoPort in nto.searchPorts(searchTerms)])
+        else:
+            port_id_list = sorted([int(port_id) for port_id in journal['ports']])
+        for port_id, (ntoPortDetails, port_error) in zip(port_id_list, nto_get_ports(nto, port_id_list, workers)):
+            if port_error is not None:
+                print("Error on port ID %s: %s" % (port_id, port_error))
+                port_errors.setdefault(port_id, []).append(port_error)
+                # The port stays in scope, to be read again by a resumed discovery. A port with a known outcome keeps it
+                unread_ports[port_id] = dict(journal['ports'][str(port_id)]) if journal is not None else {'name': None, 'finalized': False}
+                if unread_ports[port_id].get('state') not in ('up', 'down'):
+                    unread_ports[port_id]['state'] = 'retry'
+                unread_ports[port_id]['errors'] = list(port_errors[port_id])
+                continue
+            discoveredPortList[port_id] = {'name': ntoPortDetails['default_name'], 'type': 'port', 'ZTPSucceeded': False, 'details': ntoPortDetails}
         
+    # Save progress of every port, if it has changed since the last save. Ports that couldn't be read are saved in retry state,
+    # unless their outcome was already known
+    port_states = {}
+    journal_started = time.time() if journal is None else journal['started']
+    saved_journal = [journal]
+    def save_journal(phase):
+        current_journal = {'host': host_ip, 'keyword': keyword, 'started': journal_started, 'phase': phase, 'ports': {}}
+        for port_id in port_states:
+            port_state = port_states[port_id]
+            current_journal['ports'][str(port_id)] = {'name': discoveredPortList[port_id]['name'], 'state': port_state['state'],
+                'candidates': [candidate['name'] for candidate in port_state['candidates']], 'candidate_index': port_state['candidate_index'],
+                'finalized': port_state['finalized'], 'first_attempt': port_state['first_attempt'], 'errors': port_errors.get(port_id, [])}
+        for port_id in unread_ports:
+            current_journal['ports'][str(port_id)] = unread_ports[port_id]
+        if current_journal != saved_journal[0]:
+            save_portup_journal(journal_file, current_journal)
+            saved_journal[0] = current_journal
+    
     if len(discoveredPortList) == 0:
-        return
+        if len(unread_ports) > 0:
+            save_journal('discovery')
+        return len(port_errors) == 0
     
-    f = open(host_ip + '_pre_ztp_config.txt', 'w')
-    f.write(json.dumps(discoveredPortList))
-    f.close()
+    capabilities = nto_capabilities(nto, host_ip)
+    capabilities.learn_ports([discoveredPortList[port_id]['details'] for port_id in discoveredPortList])
+    
+    # Ports in scope as they were before discovery, to roll back to if needed. A resumed discovery keeps the snapshot of the original run
+    if journal is None:
+        snapshot_save(host_ip, {'port': [discoveredPortList[port_id]['details'] for port_id in discoveredPortList]}, 'portup')
 
     # TODO Disconnect all the filters from the ports in scope
     
-    # Start with 100G and FEC ON
-    print('')
-    print("Initiating 100G port discovery for QSFP28+ media type, with Forward Error Correction set to ON")
-    print('')
-    enabled_some_ports = False
-    media_type = 'QSFP28'
-    fec_type = 'RS_FEC'
+    # Discovery state of every port in scope. A port is either configuring its next candidate, waiting for its link
+    # to come up with the current candidate until a deadline, or done - with the link up or with all candidates exhausted
+    discovery_start_time = time.time()
     for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type:
-            if port['details']['mode'] == 'NETWORK' and port['details']['forward_error_correction_settings']['enabled']:
-                # Enable such ports
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-            else:
-                if port['details']['mode'] != 'NETWORK':
-                    # Convert such ports to NETWORK
-                    nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                    print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-                if not port['details']['forward_error_correction_settings']['enabled']:
-                    # Enable FEC
-                    nto.modifyPort(str(port_id), {'forward_error_correction_settings': {'enabled': True, 'fec_type': fec_type}})
-                    print("Enabled FEC on %s:%s" % (host_ip, port['details']['default_name']))
-                # Validate new settings took effect
-                portDetails = nto.getPort(str(port_id))
-                if portDetails['mode'] == 'NETWORK' and portDetails['forward_error_correction_settings']['enabled']:
-                    # Enable the port
-                    if 'enabled' in port['details']:
-                        nto.modifyPort(str(port_id), {'enabled': True})
-                        print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                        enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
+        port_states[port_id] = {'state': 'configure', 'candidates': port_discovery_candidate_list(discoveredPortList[port_id]['details'], capabilities),
+                                'candidate_index': 0, 'deadline': None, 'next_poll': None, 'poll_interval': None, 'attempt_start': None,
+                                'first_attempt': None, 'output': [], 'finalized': False}
     
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
-
-    # Stay on 100G, try FEC OFF for ports that didn't come up
-    print('')
-    print("Continuing 100G port discovery for QSFP28+ media type, now trying with Forward Error Correction set to OFF")
-    print('')
-    enabled_some_ports = False
-    media_type = 'QSFP28'
-    for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type and not port['details']['link_status']['link_up']:
-            if port['details']['mode'] == 'NETWORK' and not port['details']['forward_error_correction_settings']['enabled']:
-                # Enable such ports
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-            else:
-                if port['details']['mode'] != 'NETWORK':
-                    # Convert such ports to NETWORK
-                    nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                    print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-                if port['details']['forward_error_correction_settings']['enabled']:
-                    # Disable FEC
-                    nto.modifyPort(str(port_id), {'forward_error_correction_settings': {'enabled': False}})
-                    print("Disabled FEC on %s:%s" % (host_ip, port['details']['default_name']))
-                # Validate new settings took effect
-                portDetails = nto.getPort(str(port_id))
-                if portDetails['mode'] == 'NETWORK' and not portDetails['forward_error_correction_settings']['enabled']:
-                    # Enable the port
-                    if 'enabled' in port['details']:
-                        nto.modifyPort(str(port_id), {'enabled': True})
-                        print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                        enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
+    # Continue from the journaled progress: ports with a known outcome keep it, a port interrupted while configuring
+    # or waiting for its link starts over with the same candidate. Candidates are restored by name, since media type
+    # of a port might have been changed by a candidate already
+    if journal is not None:
+        candidates_by_name = dict([(candidate['name'], candidate) for candidate in port_discovery_candidates])
+        for port_id in port_states:
+            port_journal = journal['ports'].get(str(port_id), {})
+            port_state = port_states[port_id]
+            if 'candidates' in port_journal:
+                port_state['candidates'] = [candidates_by_name[candidate_name] for candidate_name in port_journal['candidates'] if candidate_name in candidates_by_name]
+            port_state['candidate_index'] = port_journal.get('candidate_index', 0)
+            port_state['first_attempt'] = port_journal.get('first_attempt')
+            port_state['finalized'] = port_journal.get('finalized', False)
+            if len(port_journal.get('errors', [])) > 0:
+                port_errors[port_id] = list(port_journal['errors'])
+            if port_journal.get('state') in ('up', 'down'):
+                port_state['state'] = port_journal['state']
+                discoveredPortList[port_id]['ZTPSucceeded'] = port_journal['state'] == 'up'
+                port_state['output'].append("Port %s:%s status: %s, as found before the discovery was interrupted" % (host_ip, discoveredPortList[port_id]['name'], port_journal['state'].upper()))
     
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
-
-    # Now try 40G
-    print('')
-    print("Initiating 40G port discovery for QSFP+ media type")
-    print('')
-    enabled_some_ports = False
-    media_type = 'QSFP_PLUS_40G'
-    for port_id in discoveredPortList:
+    # Move a port to its next candidate. A port without any more candidates to try is marked as down when configured
+    def next_candidate(port_id):
+        port_state = port_states[port_id]
+        port_state['candidate_index'] += 1
+        port_state['state'] = 'configure'
+    
+    # Settings needed to apply the current candidate configuration to a port and enable it: mode, candidate settings and enabled state,
+    # those that differ from the current ones. Returns None and marks the port as down if there are no more candidates to try
+    def candidate_settings(port_id):
         port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type and not port['details']['link_status']['link_up']:
-            if port['details']['mode'] == 'NETWORK':
-                # Enable such ports
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-            else:
-                if port['details']['mode'] != 'NETWORK':
-                    # Convert such ports to NETWORK
-                    nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                    print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-                # Validate new settings took effect
-                portDetails = nto.getPort(str(port_id))
-                if portDetails['mode'] == 'NETWORK':
-                    # Enable the port
-                    if 'enabled' in port['details']:
-                        nto.modifyPort(str(port_id), {'enabled': True})
-                        print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                        enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
+        port_state = port_states[port_id]
+        if port_state['candidate_index'] >= len(port_state['candidates']):
+            port_state['state'] = 'down'
+            return None
+        candidate = port_state['candidates'][port_state['candidate_index']]
+        port_state['output'].append("Trying %s on port %s:%s" % (candidate['name'], host_ip, port['name']))
+        settings = {}
+        nto_properties_merge(settings, nto_properties_diff(port['details'], {'mode': 'NETWORK'}))
+        nto_properties_merge(settings, nto_properties_diff(port['details'], candidate['settings']))
+        if 'enabled' in port['details']:
+            nto_properties_merge(settings, nto_properties_diff(port['details'], {'enabled': True}))
+        return settings
     
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
+    # Start waiting for the link of a port to come up with the current candidate. Time to link up is counted from the first attempt
+    # of the port, which is kept across candidates and in the journal
+    def wait_for_link(port_id):
+        now = time.time()
+        if port_states[port_id]['first_attempt'] is None:
+            port_states[port_id]['first_attempt'] = now
+        port_states[port_id].update({'state': 'wait', 'attempt_start': now, 'deadline': now + link_timeout,
+                                     'poll_interval': link_poll_interval_initial, 'next_poll': now + link_poll_interval_initial})
 
-    # Proceed to 10G
-    print('')
-    print("Initiating 10G port discovery for SFP+ media type")
-    print('')
-    enabled_some_ports = False
-    media_type = 'SFP_PLUS_10G'
-    link_settings = '10G_FULL'
-    for port_id in discoveredPortList:
+    # Check link status of a port waiting for its link to come up, using port details just polled
+    def check_link(port_id, port_details):
         port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type and port['details']['mode'] == 'NETWORK':
-            # Enable such ports
-            if 'enabled' in port['details']:
-                nto.modifyPort(str(port_id), {'enabled': True})
-                print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                enabled_some_ports = True
+        port_state = port_states[port_id]
+        candidate = port_state['candidates'][port_state['candidate_index']]
+        port['details'] = port_details
+        now = time.time()
+        if port['details']['link_status']['link_up']:
+            port['ZTPSucceeded'] = True
+            port_state['state'] = 'up'
+            port_state['output'].append("Collected port %s:%s status: UP with %s in %.1f seconds since the first attempt" % (host_ip, port['name'], candidate['name'], now - port_state['first_attempt']))
+        elif now >= port_state['deadline']:
+            port_state['output'].append("Collected port %s:%s status: DOWN with %s" % (host_ip, port['name'], candidate['name']))
+            next_candidate(port_id)
         else:
-            if port['details']['media_type'] == 'SFP_1G':
-                # Convert such ports to 10G
-                nto.modifyPort(str(port_id), {'media_type': media_type,'link_settings': link_settings})
-                print("Converted port %s:%s to 10G" % (host_ip, port['details']['default_name']))
-            if port['details']['mode'] != 'NETWORK':
-                # Convert such ports to NETWORK
-                nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-            # Validate new settings took effect
-            portDetails = nto.getPort(str(port_id))
-            if portDetails['media_type'] == media_type and portDetails['mode'] == 'NETWORK':
-                # Enable the port
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
+            port_state['poll_interval'] = min(port_state['poll_interval'] * link_poll_backoff, link_poll_interval_max)
+            port_state['next_poll'] = min(now + port_state['poll_interval'], port_state['deadline'])
+    
+    # Record a failure of a port request. The caller moves the port on: a failed configuration skips the candidate,
+    # a failed poll is retried until the deadline
+    def record_port_error(port_id, port_error):
+        port_errors.setdefault(port_id, []).append(port_error)
+        port_states[port_id]['output'].append("Error on port %s:%s: %s" % (host_ip, discoveredPortList[port_id]['name'], port_error))
+    
+    def retry_poll_until_deadline(port_id):
+        port_state = port_states[port_id]
+        if time.time() >= port_state['deadline']:
+            next_candidate(port_id)
+        else:
+            port_state['next_poll'] = min(time.time() + port_state['poll_interval'], port_state['deadline'])
     
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
-
-    # Now go through the ports that are still down and change the media to 1G/AUTO
     print('')
-    print("Initiating 1G/Auto port discovery for SFP+ media type")
+    print("Initiating port discovery for %d ports, waiting up to %d seconds for a link with each candidate configuration" % (len(discoveredPortList), link_timeout))
     print('')
-    enabled_some_ports = False
-    for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        portDetails = port['details']
-        if not portDetails['link_status']['link_up'] and portDetails['enabled'] and portDetails['media_type'] == 'SFP_PLUS_10G' \
-            and portDetails['misc']['board_type'] != "EPIPHONE_100_MAIN": # 1G is not supported on E100
-            nto.modifyPort(str(port_id), {'media_type': 'SFP_1G','link_settings': 'AUTO','mode': 'NETWORK'})
-            print("Converted port %s:%s to 1G/Auto, NETWORK" % (host_ip, port['details']['default_name']))
-            enabled_some_ports = True
+    if journal is None or journal['phase'] == 'discovery':
+        save_journal('discovery')
+    while True:
+        configure_id_list = sorted([port_id for port_id in port_states if port_states[port_id]['state'] == 'configure'])
+        if len(configure_id_list) > 0:
+            with nto_metrics.phase('configure'):
+                # Settings of all ports go to the NPB at once, a single update followed by a single read to verify it per port
+                port_batch = NtoWriteBatch(nto, 'port')
+                port_settings = {}
+                for port_id in configure_id_list:
+                    settings = candidate_settings(port_id)
+                    if settings is None:
+                        continue
+                    if len(settings) > 0:
+                        port_settings[port_id] = settings
+                        port_batch.stage(port_id, settings)
+                    else:
+                        wait_for_link(port_id)
+                batch_results = port_batch.flush(workers)
+                for port_id in sorted(batch_results.keys()):
+                    port = discoveredPortList[port_id]
+                    candidate = port_states[port_id]['candidates'][port_states[port_id]['candidate_index']]
+                    if batch_results[port_id]['error'] is not None:
+                        record_port_error(port_id, batch_results[port_id]['error'])
+                        next_candidate(port_id)
+                        continue
+                    if batch_results[port_id]['details'] is not None:
+                        port['details'].update(batch_results[port_id]['details'])
+                    if not batch_results[port_id]['verified']:
+                        port_states[port_id]['output'].append("Port %s:%s settings update failed, skipping %s" % (host_ip, port['name'], candidate['name']))
+                        next_candidate(port_id)
+                        continue
+                    port_states[port_id]['output'].append("Changed port %s:%s settings to %s" % (host_ip, port['name'], json.dumps(port_settings[port_id], sort_keys=True)))
+                    wait_for_link(port_id)
+            save_journal('discovery')
+            continue
         
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
+        waiting_id_list = [port_id for port_id in port_states if port_states[port_id]['state'] == 'wait']
+        if len(waiting_id_list) == 0:
+            break
+        now = time.time()
+        poll_id_list = sorted([port_id for port_id in waiting_id_list if port_states[port_id]['next_poll'] <= now])
+        if len(poll_id_list) == 0:
+            # Sleep until the next port is due for a poll
+            with nto_metrics.phase('wait'):
+                time.sleep(max(0, min([port_states[port_id]['next_poll'] for port_id in waiting_id_list]) - now))
+            continue
+        with nto_metrics.phase('poll'):
+            for port_id, (port_details, poll_error) in zip(poll_id_list, nto_get_ports(nto, poll_id_list, workers)):
+                if poll_error is not None:
+                    record_port_error(port_id, poll_error)
+                    retry_poll_until_deadline(port_id)
+                else:
+                    check_link(port_id, port_details)
+        save_journal('discovery')
     
-        # Collect link status for ports in scope
-        # TODO DRY
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
+    # Report discovery progress of every port, in the order of port IDs
+    for port_id in sorted(port_states.keys()):
+        port_state = port_states[port_id]
+        if len(port_state['candidates']) == 0:
+            print("Port %s:%s media type %s has no discovery candidates, skipping" % (host_ip, discoveredPortList[port_id]['name'], discoveredPortList[port_id]['details']['media_type']))
+        for line in port_state['output']:
+            print(line)
+    print('')
+    print("Port discovery completed in %.1f seconds: %d ports UP, %d ports DOWN" % (time.time() - discovery_start_time, \
+        len([port_id for port_id in port_states if port_states[port_id]['state'] == 'up']), \
+        len([port_id for port_id in port_states if port_states[port_id]['state'] != 'up'])))
 
     # Enable LLDP TX on all enabled ports in scope
     # For all ports where ZTP failed by this point, set them as network, 10G and disable
     print('')
     print("Finalizing port discovery...")
     print('')
-    for port_id in discoveredPortList:
+    # Ports in scope are about to change, don't let later actions in this session use cached port properties
+    nto_port_inventory(nto).invalidate()
+    save_journal('finalize')
+    def finalize_port(port_id):
+        output = []
         port = discoveredPortList[port_id]
         portDetails = port['details']
         if port['ZTPSucceeded']:
             if 'lldp_receive_enabled' in portDetails: # check if this port has LLDP support before enabling it
                 nto.modifyPort(str(port_id), {'lldp_receive_enabled': True, 'keywords': ['ZTP']})
-                print("Enabled LLDP on port %s:%s" % (host_ip, port['details']['default_name']))
+                output.append("Enabled LLDP on port %s:%s" % (host_ip, port['details']['default_name']))
             else:
-                print("Port %s:%s doesn't have LLDP RX capabilities" % (host_ip, port['details']['default_name']))
+                output.append("Port %s:%s doesn't have LLDP RX capabilities" % (host_ip, port['details']['default_name']))
         else:
             nto.modifyPort(str(port_id), {'enabled': False, 'mode': 'NETWORK'})
-            print("Converted port %s:%s to NETWORK and DISABLED" % (host_ip, port['details']['default_name']))
-
-
+            output.append("Converted port %s:%s to NETWORK and DISABLED" % (host_ip, port['details']['default_name']))
+        return (output, True)
+    with nto_metrics.phase('finalize'):
+        finalize_id_list = [port_id for port_id in discoveredPortList if not port_states[port_id]['finalized']]
+        for port_id in run_port_tasks(finalize_port, finalize_id_list, workers, port_errors):
+            port_states[port_id]['finalized'] = True
+    save_journal('done' if all(port_states[port_id]['finalized'] for port_id in port_states) and len(unread_ports) == 0 else 'finalize')
 
+    # Report errors collected along the way
+    if len(port_errors) > 0:
+        print('')
+        print("Port discovery completed with errors on %d ports:" % len(port_errors))
+        for port_id in sorted(port_errors.keys()):
+            for port_error in port_errors[port_id]:
+                print("Port %s:%s - %s" % (host_ip, discoveredPortList.get(port_id, {}).get('details', {}).get('default_name', port_id), port_error))
+    return len(port_errors) == 0
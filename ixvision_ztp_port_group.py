@@ -11,7 +11,8 @@
 #  - Search for an existing port group with the same name. If found with the matching type, continue by referencing that group. If the type doesn't match, stop. 
 #  - If not found, create a new group
 # 4. Search for enabled ports with matching keywords that are not yet members of any group and don't have any connections to/from them. Add all such ports to the group, change port mode if nessesary
-# 5. For all exising port group members, check keywords and if any have no match, remove them from the port group and set to a default configuration (Network Port, no connections)
+# 5. All the changes are planned first, and only those that differ from the current configuration are sent to the NPB. With a dry run, the plan is printed without changing anything
+# 6. For all exising port group members, check keywords and if any have no match, remove them from the port group and set to a default configuration (Network Port, no connections)
 #
 # COPYRIGHT 2018 - 2019 Keysight Technologies.
 #
@@ -22,17 +23,22 @@
 
 from ksvisionlib import *
 
+from ixvision_ztp_ntolib import *
+
+from ixvision_ztp_plan import *
+
 # DEFINE VARs HERE
-pg_modes_supported = {'net': 'INTERCONNECT', 'lb': 'LOAD_BALANCE'}
+# Supported port group modes are listed in ixvision_ztp_constants.py
 
 
 # DEFINE FUNCTIONS HERE
 
 # Input 
 # - Connection to an NPB
-# - Keywords to use for matching ports
+# - Keywords to use for matching ports, tags within one keyword can be combined with + to require all of them
 # - Port group name
 # - Port group type: "net" for network (interconnect), "lb" for load balanced tool group
+# Returns False if the port group could not be formed
 
 # Model to operate
 # NPB
@@ -40,17 +46,12 @@ pg_modes_supported = {'net': 'INTERCONNECT', 'lb': 'LOAD_BALANCE'}
 # |_Type
 # |_Keywords[Names]
 
-def form_port_groups(host_ip, port, username, password, tags, pg_name, pg_mode_key):
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_port_group_debug.log")
+def form_port_groups(host_ip, port, username, password, tags, pg_name, pg_mode_key, dry_run=False):
+    nto = nto_connect(host_ip, port, username, password)
+    plan = NtoPlan(nto)
     
-    # Check s/w version to use proper API syntax (ixia_nto.py doesn't support API versioning)
-    nto_system_properties = nto.getSystem()
-    nto_major_version = int(nto_system_properties['software_version'][0])
-    
-    if nto_major_version == 4:
-        pg_type_key = 'port_group_type'
-    else:
-        pg_type_key = 'type'
+    # Use proper API syntax for the s/w version of the NPB (ixia_nto.py doesn't support API versioning)
+    pg_type_key = nto_capabilities(nto, host_ip).attribute_name('port_group_type')
 
     if pg_mode_key == 'lb' or pg_mode_key == 'LB':
         pg_params = {'mode': 'TOOL', pg_type_key: 'LOAD_BALANCE'}
@@ -58,19 +59,19 @@ def form_port_groups(host_ip, port, username, password, tags, pg_name, pg_mode_k
         pg_params = {'mode': 'NETWORK', pg_type_key: 'INTERCONNECT'}
         
 
+    # Port group keywords are individual tags from the tag expression
+    pg_keywords = []
+    for term_tags in parse_tag_expression(tags):
+        for keyword in term_tags:
+            if keyword not in pg_keywords:
+                pg_keywords.append(keyword)
+
     port_group_list = nto.searchPortGroups({'name': pg_name})
-    ztp_port_group = None
+    port_group_details = None
     ztp_port_group_port_list = []
     if len(port_group_list) == 0:
-        # No existing group with such name, create new one
-        pg_params.update({'name': pg_name, 'keywords': ['ZTP'] + tags})
-        new_port_group = nto.createPortGroup(pg_params)
-        if new_port_group is not None and len(new_port_group) > 0:
-            print("No group found, created a new one with id %s" % (str(new_port_group['id'])))
-            ztp_port_group = new_port_group
-        else:
-            print("No group found, failed to created a new one!")
-            return
+        # No existing group with such name, will create a new one
+        print("No group found, will create a new one")
     elif len(port_group_list) == 1:
         # An existing port group found
         port_group = port_group_list[0]
@@ -81,22 +82,14 @@ def form_port_groups(host_ip, port, username, password, tags, pg_name, pg_mode_k
             if port_group_details['type'] == pg_params[pg_type_key] and port_group_details['mode'] == pg_params['mode']:
                 # PG types match, will update the existing group
                 print("-- type and mode match, will update")
-                ztp_port_group = port_group
                 ztp_port_group_port_list = port_group_details['port_list']
-                # Update keywords
-                updated_keywords = []
-                updated_keywords.extend(port_group_details['keywords'])
-                for keyword in tags:
-                    if keyword not in updated_keywords:
-                        updated_keywords.append(keyword)
-                if len(updated_keywords) > len(port_group_details['keywords']):
-                    nto.modifyPortGroup(str(port_group['id']),{'keywords': updated_keywords})
             else:
                 # Mismatch, return
                 print("-- type or mode mismatch with requested %s, %s, skipping..." % (pg_params[pg_type_key], pg_params['mode']))
-                return
+                return False
         else:
-            print("Failed to retrieve details for port %s, skipping..." % (port_group['name']))
+            print("Failed to retrieve details for port group %s, skipping..." % (port_group['name']))
+            return False
     else:
         # This should never happen, but just in case, provide details to look into
         print("Found more than one port group named %s, can't continue:" % (pg_name)),
@@ -105,39 +98,47 @@ def form_port_groups(host_ip, port, username, password, tags, pg_name, pg_mode_k
             if port_group_details is not None:
                 print (" %s," % (port_group_details['default_name'])),
         print("")
-        return
+        return False
 
     # Now search for ports to be added to the port group
-    port_list = nto.searchPorts({'enabled': True, 'port_group_id': None, 'dest_filter_list': [], 'source_filter_list': []})
-    matching_port_id_list = []
-    for port in port_list:
-        port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-        if port_details is not None:
-            for keyword in tags:
-                if keyword in port_details['keywords'] and port['id'] not in matching_port_id_list:
-                        print("Found port %s with matching keyword %s" % (port['name'], keyword))
-                        # Check and update port mode, if needed
-                        if port_details['mode'] == pg_params['mode']:
-                                matching_port_id_list.append(port['id'])
-                        else:
-                            print("Convering port %s into %s mode" % (port['name'], pg_params['mode']))
-                            nto.modifyPort(str(port['id']), {'mode': pg_params['mode']})
-                            # Check if the modification was successful and only add the port to the list of matching ports if yes
-                            port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-                            if port_details is not None and port_details['mode'] == pg_params['mode']:
-                                matching_port_id_list.append(port['id'])
-                            else:
-                                # Note, if the same port has several keywords that match, there will be several attempts to change the mode
-                                print("Changing port mode failed, skipping...")
+    port_inventory = nto_port_inventory(nto)
+    port_index = port_inventory.index()
+    candidate_ids = port_index.enabled_ids & port_index.in_group(None) & port_index.unconnected_ids
+    matching_ports = port_index.match(tags, candidate_ids)
+    matching_port_id_list = sorted(matching_ports.keys())
+    for port_id in matching_port_id_list:
+        port = port_inventory.get_port(port_id)
+        print("Found port %s with matching keyword %s" % (port['name'], matching_ports[port_id]))
+        # Plan a port mode update, if needed. The group is only updated after all such updates succeed
+        if plan.modify('port', port_id, port['name'], port, {'mode': pg_params['mode']}):
+            print("Convering port %s into %s mode" % (port['name'], pg_params['mode']))
                 
     if len(matching_port_id_list) == 0:
         print("No matching ports found")
-        return
     else:
         print("Found %d matching ports" % (len(matching_port_id_list)))
-        
-        
-    nto.modifyPortGroup(str(ztp_port_group['id']), {'port_list': matching_port_id_list + ztp_port_group_port_list})
-    print("Added %d ports to port group %s" % (len(matching_port_id_list), pg_name))
-
-
+    
+    # Group keywords and members go to the NPB as a single write, and only if they differ from the current ones
+    if port_group_details is None:
+        pg_params.update({'name': pg_name, 'keywords': ['ZTP'] + pg_keywords, 'port_list': matching_port_id_list})
+        plan.create('port_group', pg_name, pg_params)
+    else:
+        updated_keywords = []
+        updated_keywords.extend(port_group_details['keywords'])
+        for keyword in pg_keywords:
+            if keyword not in updated_keywords:
+                updated_keywords.append(keyword)
+        plan.modify('port_group', port_group_details['id'], port_group_details['default_name'], port_group_details, \
+                    {'keywords': updated_keywords, 'port_list': matching_port_id_list + ztp_port_group_port_list})
+    
+    plan.show()
+    if dry_run or len(plan) == 0:
+        return True
+    if plan.apply() is None:
+        return False
+    # Group members now have a port group ID assigned
+    for port_id in matching_port_id_list:
+        port_inventory.invalidate(port_id)
+    if len(matching_port_id_list) > 0:
+        print("Added %d ports to port group %s" % (len(matching_port_id_list), pg_name))
+    return True
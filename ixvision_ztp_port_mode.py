@@ -18,41 +18,41 @@ from ksvisionlib import *
 
 from ixvision_ztp_ntolib import *
 
+from ixvision_ztp_plan import *
+
 # DEFINE VARs HERE
 
 # DEFINE FUNCTIONS HERE
 
 # Input 
 # - Connection to an NPB
-# - Keywords to use for matching ports
+# - Keywords to use for matching ports, tags within one keyword can be combined with + to require all of them
 # - Port type: "net" for network, "tool" for tool ports
+# Returns False if the ports could not be updated
 
-def set_port_mode(host_ip, port, username, password, tags, mode):
+def set_port_mode(host_ip, port, username, password, tags, mode, dry_run=False):
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_port_mode_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
+    plan = NtoPlan(nto)
 
     # Search for ports to be updated - can't be a part of a port group, can't have any existing connections
-    port_list = nto.searchPorts({'enabled': True, 'port_group_id': None, 'dest_filter_list': [], 'source_filter_list': []})
-    matching_port_id_list = []
-    for port in port_list:
-        port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-        if port_details is not None:
-            for keyword in tags:
-                if keyword.upper() in port_details['keywords'] and port['id'] not in matching_port_id_list and port_details['mode'] != port_modes_supported[mode]:
-                    matching_port_id_list.append(port['id'])
-                    print("Found port %s with matching keyword %s in mode %s" % (port['name'], keyword.upper(), port_details['mode']))
+    port_inventory = nto_port_inventory(nto)
+    port_index = port_inventory.index()
+    candidate_ids = (port_index.enabled_ids & port_index.in_group(None) & port_index.unconnected_ids) - port_index.with_mode(port_modes_supported[mode])
+    matching_ports = port_index.match(tags, candidate_ids)
+    matching_port_id_list = sorted(matching_ports.keys())
+    for port_id in matching_port_id_list:
+        port = port_inventory.get_port(port_id)
+        print("Found port %s with matching keyword %s in mode %s" % (port['name'], matching_ports[port_id], port['mode']))
+        plan.modify('port', port_id, port['name'], port, {'mode': port_modes_supported[mode]})
                 
     if len(matching_port_id_list) == 0:
         print("No mode update requied for ports with keywords %s" % ", ".join(tags))
-        return
+        return True
     
-    # Update port mode
+    # Update port mode, with one update and one verification read per port
     print("Convering ports into %s mode" % (port_modes_supported[mode]))
-    for port_id in matching_port_id_list:
-        nto.modifyPort(str(port_id), {'mode': port_modes_supported[mode]})
-        # Check if the modification was successful and only add the port to the list of matching ports if yes
-        port_details = nto.getPortProperties(str(port_id), 'id,name,mode')
-        if port_details is not None and port_details['mode'] == port_modes_supported[mode]:
-            print("Port %s mode update succeeded" % port_details['name'])
-        else:
-            print("Port %s mode update failed!" % port_details['name'])
+    plan.show()
+    if dry_run:
+        return True
+    return plan.apply() is not None
@@ -0,0 +1,257 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_snapshot.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Configuration snapshots of an NPB, and rollback to a snapshot
+# 1. A snapshot keeps writable properties of ports, port groups and filters of an NPB, as a gzip-compressed JSON file
+#    in <host>_snapshots directory, named by the time it was taken. Snapshots are never overwritten
+# 2. portup takes a snapshot of the ports in its scope before changing them. The snapshot action takes a snapshot
+#    of all ports, port groups and filters
+# 3. Rollback reads current state of all objects listed in a snapshot, plans writes for the properties that differ,
+#    and applies them in parallel: filters first, then port groups, then ports - in reverse of the order ZTP actions make changes
+# 4. Port groups and filters created by ZTP actions after a snapshot of all objects was taken, tagged with ZTP keyword,
+#    are deleted, before the objects of the same type are restored. Rollback refuses to make any changes if other objects
+#    were created since then, or if ports of a snapshot that doesn't cover port groups and filters, like the one taken by portup,
+#    have been added to port groups or connected to filters. Objects deleted since the snapshot are reported, but not recreated
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import gzip
+import json
+import os
+import time
+
+from ksvisionlib import *
+
+from ixvision_ztp_ntolib import *
+
+from ixvision_ztp_plan import *
+
+# DEFINE VARs HERE
+
+# Snapshots of an NPB are kept in a directory named by the NPB host with this suffix
+snapshot_dir_suffix = '_snapshots'
+snapshot_file_suffix = '.json.gz'
+
+# Properties saved in a snapshot, per object type. Read-only properties, like link status or port group membership
+# of a port, are not saved. Object ID and default name are saved to find the object and to refer to it in messages
+snapshot_writable_properties = {
+    'port':       ['name', 'description', 'keywords', 'enabled', 'mode', 'media_type', 'link_settings',
+                   'forward_error_correction_settings', 'filter_mode', 'filter_criteria'],
+    'port_group': ['name', 'description', 'keywords', 'port_list'],
+    'filter':     ['name', 'description', 'keywords', 'mode', 'criteria',
+                   'source_port_list', 'dest_port_list', 'source_port_group_list', 'dest_port_group_list'],
+}
+
+# Read-only properties saved in a snapshot, that show which port groups and filters an object belonged to. They are never
+# written back, rollback uses them to find objects that were added to port groups and filters after the snapshot
+snapshot_membership_properties = {
+    'port':       ['port_group_id', 'source_filter_list', 'dest_filter_list'],
+    'port_group': [],
+    'filter':     [],
+}
+
+# Object types in a snapshot, in the order rollback restores them
+snapshot_object_types = ['filter', 'port_group', 'port']
+
+# Keyword of port groups and filters created by ZTP actions. Rollback deletes such objects if they were created after the snapshot
+snapshot_ztp_keyword = 'ZTP'
+
+# DEFINE FUNCTIONS HERE
+
+def snapshot_directory(host_ip):
+    return host_ip + snapshot_dir_suffix
+
+# Keep only the properties of an object that are saved in a snapshot
+def snapshot_object(object_type, object_details):
+    saved_details = {'id': object_details['id'], 'default_name': object_details.get('default_name', object_details.get('name'))}
+    for property_name in snapshot_writable_properties[object_type] + snapshot_membership_properties[object_type]:
+        if property_name in object_details:
+            saved_details[property_name] = object_details[property_name]
+    return saved_details
+
+# Save a snapshot of NPB objects
+# Input
+# - NPB host, to name the snapshot directory
+# - Dict of object type -> list of object details. Only the object types present are covered by the snapshot
+# - Label, describing why the snapshot was taken, like the action name
+# Returns the snapshot file path
+def snapshot_save(host_ip, snapshot_objects, label):
+    snapshot_dir = snapshot_directory(host_ip)
+    if not os.path.isdir(snapshot_dir):
+        os.makedirs(snapshot_dir)
+    snapshot_time = time.time()
+    snapshot_name = time.strftime('%Y%m%d-%H%M%S', time.localtime(snapshot_time)) + '-' + label
+    snapshot_file = os.path.join(snapshot_dir, snapshot_name + snapshot_file_suffix)
+    name_index = 1
+    while os.path.exists(snapshot_file):
+        name_index += 1
+        snapshot_file = os.path.join(snapshot_dir, '%s-%d%s' % (snapshot_name, name_index, snapshot_file_suffix))
+
+    snapshot = {'host': host_ip, 'time': snapshot_time, 'label': label, 'objects': {}}
+    for object_type in snapshot_objects:
+        snapshot['objects'][object_type] = sorted([snapshot_object(object_type, object_details) for object_details in snapshot_objects[object_type]],
+                                                  key=lambda object_details: object_details['id'])
+
+    # The snapshot only appears under its name once it is completely written
+    with gzip.open(snapshot_file + '.tmp', 'wb') as f:
+        f.write(json.dumps(snapshot, sort_keys=True).encode('utf-8'))
+    os.rename(snapshot_file + '.tmp', snapshot_file)
+    print("Saved a snapshot of %s to %s" % (", ".join(["%d %ss" % (len(snapshot['objects'][object_type]), plan_object_type_names[object_type])
+                                                         for object_type in snapshot_object_types if object_type in snapshot['objects']]), snapshot_file))
+    return snapshot_file
+
+def snapshot_load(snapshot_file):
+    try:
+        with gzip.open(snapshot_file, 'rb') as f:
+            snapshot = json.loads(f.read().decode('utf-8'))
+    except Exception as e:
+        print("Error: can't read snapshot %s: %s" % (snapshot_file, e))
+        return None
+    if not isinstance(snapshot, dict) or not isinstance(snapshot.get('objects'), dict):
+        print("Error: %s is not a snapshot" % snapshot_file)
+        return None
+    return snapshot
+
+# List snapshot files of an NPB, oldest first
+def snapshot_list(host_ip):
+    snapshot_dir = snapshot_directory(host_ip)
+    if not os.path.isdir(snapshot_dir):
+        return []
+    return [os.path.join(snapshot_dir, file_name) for file_name in sorted(os.listdir(snapshot_dir)) if file_name.endswith(snapshot_file_suffix)]
+
+# Find a snapshot of an NPB by a path, a file name or the beginning of it, like 20190315-1420. Without a name, the latest snapshot is used
+# Returns the snapshot file path, or None if there is no such snapshot or more than one snapshot matches the name
+def snapshot_find(host_ip, snapshot_name=None):
+    if snapshot_name is not None and os.path.isfile(snapshot_name):
+        return snapshot_name
+    snapshot_files = snapshot_list(host_ip)
+    if snapshot_name is not None:
+        snapshot_files = [snapshot_file for snapshot_file in snapshot_files if os.path.basename(snapshot_file).startswith(snapshot_name)]
+    if len(snapshot_files) == 0:
+        print("Error: no snapshots%s found in %s" % ('' if snapshot_name is None else ' matching ' + snapshot_name, snapshot_directory(host_ip)))
+        return None
+    if snapshot_name is not None and len(snapshot_files) > 1:
+        print("Error: more than one snapshot matches %s: %s" % (snapshot_name, ", ".join([os.path.basename(snapshot_file) for snapshot_file in snapshot_files])))
+        return None
+    return snapshot_files[-1]
+
+# Read details of NPB objects of one type in parallel
+# Returns a list of (object details, error) tuples in the same order as object IDs, like nto_parallel_map()
+def snapshot_read_objects(nto, object_type, object_id_list, workers=nto_workers_default):
+    if object_type == 'port':
+        return nto_get_ports(nto, object_id_list, workers)
+    elif object_type == 'port_group':
+        return nto_parallel_map(lambda pg_id: nto.getPortGroup(str(pg_id)), object_id_list, workers)
+    return nto_parallel_map(lambda df_id: nto.getFilter(str(df_id)), object_id_list, workers)
+
+# Port groups and filters a port has been added to since a snapshot, that the snapshot doesn't cover, so rollback can't remove the port from them.
+# Snapshots taken before memberships were saved aren't checked
+# Returns a list of descriptions of such memberships
+def snapshot_new_memberships(snapshot, saved_details, port_details):
+    new_memberships = []
+    if 'port_group_id' in saved_details and 'port_group' not in snapshot['objects']:
+        if port_details.get('port_group_id') is not None and port_details['port_group_id'] != saved_details['port_group_id']:
+            new_memberships.append("port %s was added to port group ID %s after the snapshot" % (saved_details['default_name'], port_details['port_group_id']))
+    if 'filter' not in snapshot['objects']:
+        for filter_list in ['source_filter_list', 'dest_filter_list']:
+            if filter_list in saved_details:
+                for df_id in sorted(set(port_details.get(filter_list) or []) - set(saved_details[filter_list] or [])):
+                    new_memberships.append("port %s was connected to filter ID %s after the snapshot" % (saved_details['default_name'], df_id))
+    return new_memberships
+
+# Take a snapshot of all ports, port groups and filters of an NPB. Returns False if it could not be taken
+def take_snapshot(host_ip, port, username, password, workers=nto_workers_default):
+    nto = nto_connect(host_ip, port, username, password)
+
+    snapshot_objects = {}
+    with nto_metrics.phase('read'):
+        for object_type, search_objects in [('port', nto.searchPorts), ('port_group', nto.searchPortGroups), ('filter', nto.searchFilters)]:
+            object_id_list = sorted([found_object['id'] for found_object in search_objects({})])
+            snapshot_objects[object_type] = []
+            for object_id, (object_details, read_error) in zip(object_id_list, snapshot_read_objects(nto, object_type, object_id_list, workers)):
+                if read_error is not None:
+                    print("Error: can't read %s ID %s: %s" % (plan_object_type_names[object_type], object_id, read_error))
+                    return False
+                snapshot_objects[object_type].append(object_details)
+    snapshot_save(host_ip, snapshot_objects, 'snapshot')
+    return True
+
+# Restore NPB configuration from a snapshot, changing only the properties that differ from the snapshot
+# Input
+# - Snapshot path, file name or the beginning of it, None for the latest snapshot of the NPB
+# - Only list snapshots of the NPB
+# - Only print the changes that would be made
+# Returns False if the rollback could not be made
+def rollback_to_snapshot(host_ip, port, username, password, snapshot_name=None, list_only=False, dry_run=False, workers=nto_workers_default):
+    if list_only:
+        for snapshot_file in snapshot_list(host_ip):
+            print(snapshot_file)
+        return True
+
+    snapshot_file = snapshot_find(host_ip, snapshot_name)
+    if snapshot_file is None:
+        return False
+    snapshot = snapshot_load(snapshot_file)
+    if snapshot is None:
+        return False
+    print("Rolling back to %s, taken at %s" % (snapshot_file, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.get('time', 0)))))
+
+    nto = nto_connect(host_ip, port, username, password)
+    plan = NtoPlan(nto)
+    blocking_changes = []   # Changes since the snapshot that rollback can't undo
+
+    with nto_metrics.phase('read'):
+        for object_type in snapshot_object_types:
+            if object_type not in snapshot['objects']:
+                continue
+            saved_objects = snapshot['objects'][object_type]
+            object_id_list = [saved_details['id'] for saved_details in saved_objects]
+            
+            # Port groups and filters created since the snapshot: those made by ZTP actions are deleted before the others of the same type are restored
+            if object_type != 'port':
+                search_objects = nto.searchPortGroups if object_type == 'port_group' else nto.searchFilters
+                new_object_id_list = sorted(set(found_object['id'] for found_object in search_objects({})) - set(object_id_list))
+                for object_id, (object_details, read_error) in zip(new_object_id_list, snapshot_read_objects(nto, object_type, new_object_id_list, workers)):
+                    if read_error is not None or object_details is None:
+                        blocking_changes.append("%s ID %s was created after the snapshot and can't be read: %s" % (plan_object_type_names[object_type], object_id, read_error))
+                    elif snapshot_ztp_keyword in [keyword.upper() for keyword in object_details.get('keywords') or []]:
+                        plan.delete(object_type, object_id, object_details.get('default_name', object_details.get('name')))
+                    else:
+                        blocking_changes.append("%s %s (ID %s) was created after the snapshot, not by ZTP" % \
+                                                (plan_object_type_names[object_type], object_details.get('default_name', object_details.get('name')), object_id))
+            
+            for saved_details, (object_details, read_error) in zip(saved_objects, snapshot_read_objects(nto, object_type, object_id_list, workers)):
+                if read_error is not None or object_details is None:
+                    print("Can't restore %s %s (ID %s), it no longer exists or can't be read: %s" % \
+                          (plan_object_type_names[object_type], saved_details['default_name'], saved_details['id'], read_error))
+                    continue
+                saved_properties = dict([(property_name, saved_details[property_name]) for property_name in snapshot_writable_properties[object_type] \
+                                         if property_name in saved_details])
+                plan.modify(object_type, saved_details['id'], saved_details['default_name'], object_details, saved_properties)
+                if object_type == 'port':
+                    blocking_changes.extend(snapshot_new_memberships(snapshot, saved_details, object_details))
+
+    plan.show()
+    if len(blocking_changes) > 0:
+        print("Error: can't roll back to %s, the NPB has changes the snapshot doesn't cover:" % snapshot_file)
+        for blocking_change in blocking_changes:
+            print("  %s" % blocking_change)
+        print("Remove them, or roll back to a snapshot taken by the snapshot action after they were made")
+        return False
+    if dry_run or len(plan) == 0:
+        return True
+    rolled_back = plan.apply(workers) is not None
+    if rolled_back:
+        print("Rolled back to %s" % snapshot_file)
+    # Port properties cached by earlier actions of a playbook might have been changed
+    nto_port_inventory(nto).invalidate()
+    return rolled_back
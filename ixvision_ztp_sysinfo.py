@@ -17,6 +17,8 @@
 
 from ksvisionlib import *
 
+from ixvision_ztp_ntolib import *
+
 # DEFINE FUNCTIONS HERE
 
 # Input 
@@ -43,12 +45,18 @@ def nto_get_sysinfo(host_ip, port, username, password):
         'serial_num': 'Serial number:'
     }
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=False, logFile="ixvision_status_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
 
     nto_system_properties = nto.getSystem()
     nto_system_info = nto_system_properties['system_info']
     nto_ip_info = nto_system_properties['ip_config']
-    nto_hardware_info = nto.getLoginInfo()['hardware_info']
+    nto_login_info = nto.getLoginInfo()
+    nto_hardware_info = nto_login_info['hardware_info']
+    
+    # Keep what was read as capabilities of the NPB, so the following actions don't have to probe them
+    capabilities = nto_capabilities(nto, host_ip)
+    capabilities.learn_system(nto_system_properties)
+    capabilities.learn_hardware(nto_login_info)
     
     print_sysinfo(sysinfo_strings['name'], nto_system_info['name'])
     print_sysinfo(sysinfo_strings['location'], nto_system_info['location'])
@@ -0,0 +1,140 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_watch.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Keep an NPB in line with a playbook by re-running its actions when the NPB state changes
+# 1. Starting point is a playbook of actions that keep ports tags, port groups and filters up to date
+# 2. Connect to an NPB once and keep the session open
+# 3. On every cycle, poll ports, LLDP neighbors, port groups and filters, and compare them with the previous cycle
+# 4. Re-run only the playbook actions that depend on the changed parts of the NPB state. An action that runs marks what
+#    it modifies as changed, so the actions after it in the playbook that depend on that run too
+# 5. Report what was changed and how long the cycle took
+# 6. A cycle that fails, like on a timeout or an expired session, is reported and counted, and the next cycle logs in again
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.  
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import sys
+import json
+import time
+import hashlib
+import random
+
+from ksvisionlib import *
+
+from ixvision_ztp_ntolib import *
+
+# DEFINE VARs HERE
+# Default interval, jitter and dependencies of actions on the NPB state are listed in ixvision_ztp_constants.py
+
+# Properties that define the NPB state for the watch mode. Link status and counters are deliberately left out
+watch_port_group_properties = 'id,name,mode,type,keywords,port_list'
+watch_filter_properties = 'id,name,mode,keywords,criteria,source_port_list,dest_port_list,source_port_group_list,dest_port_group_list'
+
+# Cycles run and failed, included in the run report. A failed cycle doesn't stop the watch, the next one runs after the interval
+watch_report = {'cycles': 0, 'failed_cycles': 0, 'last_error': None}
+nto_metrics.add_report_section('watch', lambda: watch_report)
+
+# DEFINE FUNCTIONS HERE
+
+def watch_fingerprint(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+# Poll the NPB state and return a dict of state part -> fingerprint
+def watch_poll_state(nto):
+    port_inventory = nto_port_inventory(nto)
+    port_inventory.invalidate()
+    return {'ports':       watch_fingerprint(port_inventory.get_ports()),
+            'neighbors':   watch_fingerprint(nto.getAllNeighbors()),
+            'port_groups': watch_fingerprint(sorted(nto_get_all_properties(nto, 'port_groups', watch_port_group_properties), key=lambda pg: pg['id'])),
+            'filters':     watch_fingerprint(sorted(nto_get_all_properties(nto, 'filters', watch_filter_properties), key=lambda df: df['id']))}
+
+# Check that all playbook steps can be used in watch mode
+def watch_steps_supported(steps):
+    for step_line, step_args in steps:
+        if step_args.subparser_name not in watch_action_dependencies:
+            print("Error: action %s can't be used in watch mode, use one of: %s" % (step_args.subparser_name, ", ".join(sorted(watch_action_dependencies.keys()))))
+            return False
+    return True
+
+# Run playbook steps whenever the parts of the NPB state they depend on change
+# Input
+# - NPB host, port and credentials
+# - List of playbook steps, as (line, parsed arguments) tuples
+# - Function to run a step: run_step(host, port, username, password, parsed arguments)
+# - Interval between cycles and a random jitter added to it, in seconds
+# - Number of cycles to run, 0 to run until interrupted
+def watch_npb(host_ip, port, username, password, steps, run_step, interval=watch_interval_default, jitter=watch_jitter_default, cycles=0):
+    if not watch_steps_supported(steps):
+        return
+    nto = None
+    
+    previous_state = None
+    cycle = 0
+    try:
+        while cycles == 0 or cycle < cycles:
+            cycle += 1
+            cycle_start_time = time.time()
+            cycle_start_calls = nto_metrics.call_count
+            try:
+                if nto is None:
+                    nto = nto_connect(host_ip, port, username, password)
+                with nto_metrics.phase('poll'):
+                    current_state = watch_poll_state(nto)
+                poll_time = time.time() - cycle_start_time
+                if previous_state is None:
+                    changed = set(current_state.keys())
+                else:
+                    changed = set([part for part in current_state if current_state[part] != previous_state[part]])
+                detected_changes = sorted(changed)
+                
+                steps_run = 0
+                for step_line, step_args in steps:
+                    step_dependencies = watch_action_dependencies[step_args.subparser_name]
+                    if len(changed.intersection(step_dependencies['reads'])) == 0:
+                        continue
+                    print('')
+                    print("Watch cycle %d: %s" % (cycle, step_line))
+                    run_step(host_ip, port, username, password, step_args)
+                    changed.update(step_dependencies['modifies'])
+                    steps_run += 1
+                
+                # Changes made by the steps themselves shouldn't trigger the next cycle
+                if steps_run > 0:
+                    with nto_metrics.phase('poll'):
+                        current_state = watch_poll_state(nto)
+                previous_state = current_state
+                watch_report['cycles'] += 1
+                
+                print('')
+                print("Watch cycle %d completed in %.1f seconds, polling took %.1f seconds, %d of %d actions run. Changes detected: %s" % \
+                    (cycle, time.time() - cycle_start_time, poll_time, steps_run, len(steps), ", ".join(detected_changes) if len(detected_changes) > 0 else 'none'))
+            except Exception as e:
+                # The state of the previous completed cycle is kept, so changes that this cycle hasn't handled are picked up by the next one.
+                # The session may have expired or broken, the next cycle logs in again
+                watch_report['cycles'] += 1
+                watch_report['failed_cycles'] += 1
+                watch_report['last_error'] = "%s: %s" % (type(e).__name__, e)
+                nto_logger.exception("Watch cycle %d failed", cycle)
+                print('')
+                print("Watch cycle %d failed after %.1f seconds: %s" % (cycle, time.time() - cycle_start_time, watch_report['last_error']))
+                nto_reset_sessions()
+                nto = None
+            if nto_metrics.enabled:
+                print("Watch cycle %d made %d API calls" % (cycle, nto_metrics.call_count - cycle_start_calls))
+                # Keep the run report current for collectors that read it while the watch is running
+                nto_metrics.write_reports()
+            sys.stdout.flush()
+            
+            if cycles == 0 or cycle < cycles:
+                time.sleep(max(0, interval + random.uniform(-jitter, jitter)))
+    except KeyboardInterrupt:
+        print('')
+        print("Watch stopped after %d cycles" % cycle)
@@ -0,0 +1,144 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_aio.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of the asyncio NPB client against a local HTTP/1.1 server. Require python 3.5 or later
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import json
+import sys
+import threading
+import time
+import unittest
+
+aio_supported = sys.version_info >= (3, 5)
+if aio_supported:
+    import socketserver
+    from ixvision_ztp_aio import NtoAioClient, NtoAioError
+
+# Responses of the test server by request path: status line, headers and body. A body given as a list is sent in chunks
+aio_test_responses = {
+    '/api/auth':            ('200 OK', {'X-Auth-Token': 'token-1'}, b''),
+    '/api/system':          ('200 OK', {}, json.dumps({'software_version': '5.3.0'}).encode('utf-8')),
+    '/api/ports/search':    ('200 OK', {}, [b'[{"id": 1, ', b'"name": "P01"}, ', b'{"id": 2, "name": "P02"}]']),
+    '/api/ports/99':        ('404 Not Found', {}, b'{"message": "port 99 not found"}'),
+    '/api/port_groups/5':   ('503 Service Unavailable', {}, b'busy'),
+    '/api/filters/7':       ('200 OK', {'Connection': 'close'}, b'{"id": 7, "name": "F7"}'),
+}
+
+if aio_supported:
+    # Keep-alive HTTP/1.1 server answering with aio_test_responses. Counts connections and requests, and checks authentication
+    class AioTestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.server.connections += 1
+            while True:
+                request_line = self.rfile.readline()
+                if len(request_line) == 0:
+                    return
+                method, url = request_line.decode('latin-1').split(' ')[:2]
+                headers = {}
+                while True:
+                    header_line = self.rfile.readline().decode('latin-1')
+                    if header_line in ('\r\n', '\n', ''):
+                        break
+                    name, value = header_line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                self.rfile.read(int(headers.get('content-length', 0)))
+                self.server.requests.append((method, url, headers))
+                path = url.split('?', 1)[0]
+                if path == '/api/system':
+                    time.sleep(0.02)
+                status, response_headers, body = aio_test_responses.get(path, ('404 Not Found', {}, b''))
+                if path != '/api/auth' and headers.get('authentication') != 'token-1':
+                    status, response_headers, body = ('401 Unauthorized', {}, b'')
+                response_lines = ['HTTP/1.1 ' + status] + ['%s: %s' % (name, response_headers[name]) for name in response_headers]
+                if isinstance(body, list):
+                    response_lines.append('Transfer-Encoding: chunked')
+                    payload = b''.join([('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n' for chunk in body]) + b'0\r\n\r\n'
+                elif response_headers.get('Connection') == 'close':
+                    # No length, the body ends when the connection is closed
+                    payload = body
+                else:
+                    response_lines.append('Content-Length: %d' % len(body))
+                    payload = body
+                self.wfile.write(('\r\n'.join(response_lines) + '\r\n\r\n').encode('latin-1') + payload)
+                self.wfile.flush()
+                if response_headers.get('Connection') == 'close':
+                    return
+
+    class AioTestServer(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+        def __init__(self):
+            socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), AioTestHandler)
+            self.connections = 0
+            self.requests = []
+
+@unittest.skipUnless(aio_supported, "the asyncio client requires python 3.5 or later")
+class AioClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = AioTestServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.client = NtoAioClient('127.0.0.1', 'admin', 'admin', port=self.server.server_address[1], use_ssl=False)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for i in range(3):
+            self.assertEqual(self.client.run(self.client.getSystem()), {'software_version': '5.3.0'})
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual([url for method, url, headers in self.server.requests], ['/api/auth', '/api/system', '/api/system', '/api/system'])
+
+    def test_content_length_and_chunked_bodies(self):
+        results = self.client.run_all([self.client.getSystem(), self.client.searchPorts({'enabled': True})])
+        self.assertEqual(results, [({'software_version': '5.3.0'}, None), ([{'id': 1, 'name': 'P01'}, {'id': 2, 'name': 'P02'}], None)])
+
+    def test_body_until_connection_closed(self):
+        self.assertEqual(self.client.run(self.client.getFilter(7)), {'id': 7, 'name': 'F7'})
+        self.assertEqual(self.client.run(self.client.getSystem()), {'software_version': '5.3.0'})
+        self.assertEqual(self.server.connections, 2)
+
+    def test_error_statuses(self):
+        with self.assertRaises(NtoAioError) as error:
+            self.client.run(self.client.getPort(99))
+        self.assertEqual(error.exception.status, 404)
+        self.assertIn('port 99 not found', str(error.exception))
+        # Error responses with a length leave the connection open
+        self.assertEqual(self.client.run(self.client.getSystem()), {'software_version': '5.3.0'})
+        self.assertEqual(self.server.connections, 1)
+        results = self.client.run_all([self.client.getPortGroup(5), self.client.getSystem()])
+        self.assertIsNone(results[0][0])
+        self.assertIn('503', results[0][1])
+        self.assertEqual(results[1], ({'software_version': '5.3.0'}, None))
+
+    def test_run_all_from_threads(self):
+        thread_results = []
+        def run_requests():
+            try:
+                thread_results.append(self.client.run_all([self.client.getSystem() for i in range(4)]))
+            except Exception as e:
+                thread_results.append(e)
+        threads = [threading.Thread(target=run_requests) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(thread_results, [[({'software_version': '5.3.0'}, None)] * 4] * 4)
+
+if __name__ == '__main__':
+    unittest.main()
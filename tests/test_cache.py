@@ -0,0 +1,83 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_cache.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of the on-disk cache of NPB API read responses against a mock NPB
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import atexit
+import os
+import shutil
+import tempfile
+import unittest
+
+from ixvision_ztp_cache import NtoCachingClient, NtoResponseCache
+from ixvision_ztp_mock import MockVisionWebApi, mock_device, mock_reset_devices
+
+class CachingClientTest(unittest.TestCase):
+    def setUp(self):
+        # Caches are saved at exit, the directory is removed after that
+        self.work_dir = tempfile.mkdtemp(prefix='ixvztp_test_')
+        atexit.register(shutil.rmtree, self.work_dir, True)
+        mock_reset_devices()
+        self.device = mock_device('mock-cache', {'port_count': 8})
+        self.pg_id = [pg_id for pg_id in self.device.port_groups if self.device.port_groups[pg_id]['name'] == 'Legacy'][0]
+    
+    def client(self, refresh=False):
+        return NtoCachingClient(MockVisionWebApi('mock-cache', 'admin', 'admin'), NtoResponseCache(os.path.join(self.work_dir, 'mock-cache'), refresh=refresh))
+    
+    def test_reads_served_from_cache(self):
+        nto = self.client()
+        nto.getPortProperties('1', 'id,keywords')
+        nto.getPortProperties('1', 'id,keywords')
+        nto.getPortGroup(str(self.pg_id))
+        nto.getPortGroup(str(self.pg_id))
+        self.assertEqual(self.device.api_calls.get('getPortProperties'), 1)
+        self.assertEqual(self.device.api_calls.get('getPortGroup'), 1)
+    
+    def test_responses_kept_between_runs_and_refreshed(self):
+        nto = self.client()
+        nto.getPortGroup(str(self.pg_id))
+        nto.response_cache.save()
+        self.client().getPortGroup(str(self.pg_id))
+        self.assertEqual(self.device.api_calls.get('getPortGroup'), 1)
+        self.client(refresh=True).getPortGroup(str(self.pg_id))
+        self.assertEqual(self.device.api_calls.get('getPortGroup'), 2)
+    
+    def test_port_write_drops_port_groups_and_filters(self):
+        nto = self.client()
+        df_id = list(self.device.filters.keys())[0]
+        nto.getPortGroup(str(self.pg_id))
+        nto.getFilter(str(df_id))
+        nto.modifyPort('1', {'mode': 'TOOL'})
+        nto.getPortGroup(str(self.pg_id))
+        nto.getFilter(str(df_id))
+        self.assertEqual(self.device.api_calls.get('getPortGroup'), 2)
+        self.assertEqual(self.device.api_calls.get('getFilter'), 2)
+    
+    def test_port_group_write_drops_ports(self):
+        nto = self.client()
+        nto.getPortProperties('1', 'id,port_group_id')
+        nto.modifyPortGroup(str(self.pg_id), {'port_list': [1]})
+        self.assertEqual(nto.getPortProperties('1', 'id,port_group_id'), {'id': 1, 'port_group_id': self.pg_id})
+        self.assertEqual(self.device.api_calls.get('getPortProperties'), 2)
+    
+    def test_port_write_updates_bulk_property_lists(self):
+        nto = self.client()
+        nto._sendRequest('GET', '/api/ports?properties=id,keywords')
+        nto.modifyPort('2', {'keywords': ['TAP']})
+        ports = nto._sendRequest('GET', '/api/ports?properties=id,keywords')
+        self.assertEqual([port['keywords'] for port in ports if port['id'] == 2], [['TAP']])
+        self.assertEqual(self.device.api_calls.get('_sendRequest'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
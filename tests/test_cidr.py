@@ -0,0 +1,61 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_cidr.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of compaction of IPv4 addresses into CIDR prefixes
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import unittest
+
+from ixvision_ztp_cidr import cidr_compact, cidr_merge_ranges, cidr_parse, cidr_range_prefixes, cidr_subtract_ranges
+
+class CidrParseTest(unittest.TestCase):
+    def test_addresses_and_prefixes(self):
+        self.assertEqual(cidr_parse('10.0.0.1'), (0x0a000001, 0x0a000001))
+        self.assertEqual(cidr_parse('10.0.0.0/24'), (0x0a000000, 0x0a0000ff))
+        self.assertEqual(cidr_parse(' 10.0.0.77/24 '), (0x0a000000, 0x0a0000ff))
+        self.assertEqual(cidr_parse('10.0.0.0/255.255.255.0'), (0x0a000000, 0x0a0000ff))
+        self.assertEqual(cidr_parse('0.0.0.0/0'), (0, 0xffffffff))
+    
+    def test_invalid_values(self):
+        for value in ['10.0.0', '10.0.0.256', '10.0.0.0/33', '10.0.0.0/255.0.255.0', '2001:db8::1', 'host', None, {'addr': '10.0.0.1'}]:
+            self.assertIsNone(cidr_parse(value), value)
+
+class CidrRangesTest(unittest.TestCase):
+    def test_merge_overlapping_and_adjacent(self):
+        self.assertEqual(cidr_merge_ranges([(10, 20), (0, 4), (5, 7), (15, 30), (40, 50)]), [(0, 7), (10, 30), (40, 50)])
+    
+    def test_subtract(self):
+        self.assertEqual(cidr_subtract_ranges([(0, 100)], [(10, 19), (50, 50)]), [(0, 9), (20, 49), (51, 100)])
+        self.assertEqual(cidr_subtract_ranges([(0, 9), (20, 29)], [(5, 24)]), [(0, 4), (25, 29)])
+        self.assertEqual(cidr_subtract_ranges([(0, 9)], [(0, 9)]), [])
+    
+    def test_range_prefixes(self):
+        self.assertEqual(cidr_range_prefixes(0x0a000000, 0x0a0000ff), ['10.0.0.0/24'])
+        self.assertEqual(cidr_range_prefixes(0x0a000001, 0x0a000006), ['10.0.0.1', '10.0.0.2/31', '10.0.0.4/31', '10.0.0.6'])
+        self.assertEqual(cidr_range_prefixes(0, 0xffffffff), ['0.0.0.0/0'])
+
+class CidrCompactTest(unittest.TestCase):
+    def test_adjacent_addresses_become_prefixes(self):
+        addresses = ['10.0.0.%d' % host for host in range(256)]
+        self.assertEqual(cidr_compact(addresses), ['10.0.0.0/24'])
+        self.assertEqual(cidr_compact(['10.0.1.0/25', '10.0.0.0/24', '10.0.1.128/25', '10.0.0.5']), ['10.0.0.0/23'])
+    
+    def test_remove_cuts_prefixes(self):
+        self.assertEqual(cidr_compact(['10.0.0.0/30'], ['10.0.0.1']), ['10.0.0.0', '10.0.0.2/31'])
+        self.assertEqual(cidr_compact(['10.0.0.0/24'], ['10.0.0.0/24']), [])
+    
+    def test_other_values_kept_after_prefixes(self):
+        self.assertEqual(cidr_compact(['2001:db8::1', '10.0.0.1', 'host', '10.0.0.0', '2001:db8::1'], ['host']), ['10.0.0.0/31', '2001:db8::1'])
+
+if __name__ == '__main__':
+    unittest.main()
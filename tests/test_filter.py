@@ -0,0 +1,86 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_filter.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of updates of dynamic filter criteria
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import ixvision_ztp_ntolib
+from ixvision_ztp_filter import criteria_value_changes, update_dynamic_filter
+from ixvision_ztp_mock import MockVisionWebApi, mock_device, mock_reset_devices
+from ixvision_ztp_ntolib import nto_reset_sessions
+
+connection = ('mock-filter', '8000', 'admin', 'admin')
+
+class CriteriaValueChangesTest(unittest.TestCase):
+    def test_changes(self):
+        self.assertEqual(criteria_value_changes({'addr': ['10.0.0.1', '10.0.0.2']}, {'addr': ['10.0.0.1', '10.0.0.2/31']}), (1, 1))
+        self.assertEqual(criteria_value_changes({'addr': ['10.0.0.1']}, {'addr': ['10.0.0.1'], 'flow_type': 'UNI'}), (0, 0))
+        self.assertEqual(criteria_value_changes({}, {'addr': [{'port': 80}]}), (1, 0))
+
+class UpdateDynamicFilterTest(unittest.TestCase):
+    def setUp(self):
+        mock_reset_devices()
+        nto_reset_sessions()
+        self.client_factory = ixvision_ztp_ntolib.nto_client_factory
+        ixvision_ztp_ntolib.nto_client_factory = MockVisionWebApi
+        self.device = mock_device(connection[0], {'port_count': 8})
+        self.df_id = self.device.add_filter({'name': 'Servers', 'mode': 'PASS_BY_CRITERIA', 'criteria': {'ipv4_src_or_dst': {'addr': ['10.0.0.1', '10.0.0.2']}}})
+        self.modify_filter = MockVisionWebApi.modifyFilter
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        MockVisionWebApi.modifyFilter = self.modify_filter
+        nto_reset_sessions()
+        ixvision_ztp_ntolib.nto_client_factory = self.client_factory
+
+    def update(self, append_values, remove_values={}, compact=False):
+        return update_dynamic_filter(*connection, df_name='Servers', df_criteria_field='ip', df_append_values=append_values, df_remove_values=remove_values, compact=compact)
+
+    def test_counts_of_compacted_criteria(self):
+        self.assertTrue(self.update({'addr': ['10.0.0.3']}, compact=True))
+        self.assertEqual(self.device.filters[self.df_id]['criteria']['ipv4_src_or_dst']['addr'], ['10.0.0.1', '10.0.0.2/31'])
+        # 10.0.0.2 and 10.0.0.3 were written as a single prefix
+        self.assertIn('1 added, 1 removed', sys.stdout.getvalue())
+
+    def test_counts_without_compaction(self):
+        self.assertTrue(self.update({'addr': ['10.0.0.3']}, {'addr': ['10.0.0.1']}))
+        self.assertEqual(self.device.filters[self.df_id]['criteria']['ipv4_src_or_dst']['addr'], ['10.0.0.2', '10.0.0.3'])
+        self.assertIn('1 added, 1 removed', sys.stdout.getvalue())
+
+    def test_no_update_needed(self):
+        self.assertTrue(self.update({'addr': ['10.0.0.2']}))
+        self.assertIn('no update needed', sys.stdout.getvalue())
+
+    def test_failed_update(self):
+        def modify_filter(self, df_key, args, allowTemporaryDataLoss=False):
+            raise Exception('Request failed with status 409')
+        MockVisionWebApi.modifyFilter = modify_filter
+        self.assertFalse(self.update({'addr': ['10.0.0.3']}))
+        self.assertIn('Updating filter Servers failed', sys.stdout.getvalue())
+        self.assertEqual(self.device.filters[self.df_id]['criteria']['ipv4_src_or_dst']['addr'], ['10.0.0.1', '10.0.0.2'])
+
+    def test_missing_filter(self):
+        self.assertFalse(update_dynamic_filter(*connection, df_name='Clients', df_criteria_field='ip', df_append_values={'addr': ['10.0.0.3']}, df_remove_values={}))
+
+if __name__ == '__main__':
+    unittest.main()
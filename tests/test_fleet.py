@@ -0,0 +1,60 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_fleet.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of fleet mode runs, with a stand-in launcher that reports what it was started with
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ixvision_ztp_constants import password_environment_variable
+from ixvision_ztp_fleet import fleet_hosts_from_inventory, fleet_result_status, fleet_run_host, run_fleet
+
+# Prints its command line and the password it got in the environment, and fails for hosts named 'failing'
+fleet_test_launcher = """
+import os
+import sys
+print('argv %s' % ' '.join(sys.argv[1:]))
+print('password %s' % os.environ.get('{variable}'))
+sys.exit(1 if 'failing' in sys.argv else 0)
+"""
+
+class FleetTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='ixvztp_test_')
+        self.launcher = os.path.join(self.work_dir, 'launcher.py')
+        with open(self.launcher, 'w') as f:
+            f.write(fleet_test_launcher.replace('{variable}', password_environment_variable))
+        self.fleet_hosts = fleet_hosts_from_inventory([{'hostname': 'npb1', 'password': 'secret1'}, {'hostname': 'failing'}], '8000', 'admin', 'secret2')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_password_in_environment(self):
+        result = fleet_run_host(self.launcher, self.fleet_hosts[0], ['lldptag', '-t', 'TAP'])
+        self.assertEqual(result['returncode'], 0)
+        self.assertIn('argv -u admin -d npb1 -r 8000 lldptag -t TAP', result['output'])
+        self.assertIn('password secret1', result['output'])
+        self.assertNotIn('secret1', result['output'].split('\n')[0])
+
+    def test_failed_hosts(self):
+        result = fleet_run_host(self.launcher, self.fleet_hosts[1], ['lldptag', '-t', 'TAP'])
+        self.assertEqual(fleet_result_status(result), 'FAILED')
+        self.assertIn('password secret2', result['output'])
+        self.assertFalse(run_fleet(self.launcher, self.fleet_hosts, ['sysinfo'], 2))
+        self.assertTrue(run_fleet(self.launcher, self.fleet_hosts[:1], ['sysinfo'], 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_limiter.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of the adaptive limit of NPB API requests in flight
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import socket
+import unittest
+
+from ixvision_ztp_limiter import NtoConcurrencyLimit, limiter_endpoint, limiter_error_outcome, limiter_request_kind, limiter_url_endpoint
+
+# Send a request within the limit and complete it
+def limit_request(limit, latency, outcome='ok', endpoint='getPort'):
+    limit.acquire()
+    limit.release(latency, outcome, endpoint)
+
+# Fill the limit with requests in flight, then complete them
+def limit_requests_in_flight(limit, latency, outcome='ok', endpoint='getPort'):
+    in_flight = int(limit.limit)
+    for i in range(in_flight):
+        limit.acquire()
+    for i in range(in_flight):
+        limit.release(latency, outcome, endpoint)
+
+class LimiterRequestTest(unittest.TestCase):
+    def test_request_kind(self):
+        self.assertEqual(limiter_request_kind('getPort', ('P01',)), 'read')
+        self.assertEqual(limiter_request_kind('searchPorts', ({},)), 'read')
+        self.assertEqual(limiter_request_kind('modifyPort', ('P01', {})), 'write')
+        self.assertEqual(limiter_request_kind('_sendRequest', ('GET', '/api/ports')), 'read')
+        self.assertEqual(limiter_request_kind('_sendRequest', ('PUT', '/api/ports/5')), 'write')
+
+    def test_endpoint(self):
+        self.assertEqual(limiter_endpoint('getPort', ('P01',)), 'getPort')
+        self.assertEqual(limiter_endpoint('_sendRequest', ('PUT', '/api/ports/5', {})), 'PUT /api/ports/{id}')
+        self.assertEqual(limiter_url_endpoint('GET', '/api/ports?properties=id,name'), 'GET /api/ports')
+        self.assertEqual(limiter_url_endpoint('POST', '/api/filters/search'), 'POST /api/filters/search')
+
+    def test_error_outcome(self):
+        self.assertEqual(limiter_error_outcome(Exception('Request failed with status 429')), 'overload')
+        self.assertEqual(limiter_error_outcome(Exception('503 Service Unavailable')), 'overload')
+        self.assertEqual(limiter_error_outcome(socket.timeout('timed out')), 'overload')
+        self.assertEqual(limiter_error_outcome(Exception('404 Not Found')), 'failed')
+        self.assertEqual(limiter_error_outcome(Exception('409 Conflict')), 'failed')
+        # Local errors, like a bad argument or a refused connection, say nothing about the load of the NPB
+        self.assertEqual(limiter_error_outcome(KeyError('id')), 'failed')
+        self.assertEqual(limiter_error_outcome(ValueError('No JSON object could be decoded')), 'failed')
+
+class LimiterAimdTest(unittest.TestCase):
+    def test_additive_increase_when_limit_reached(self):
+        limit = NtoConcurrencyLimit(4, 1, 8)
+        limit_requests_in_flight(limit, 0.01)
+        self.assertGreater(limit.limit, 4.0)
+        self.assertLess(limit.limit, 5.0)
+        for i in range(4):
+            limit_requests_in_flight(limit, 0.01)
+        self.assertEqual(int(limit.limit), 5)
+
+    def test_no_increase_below_limit(self):
+        limit = NtoConcurrencyLimit(4, 1, 8)
+        for i in range(20):
+            limit_request(limit, 0.01)
+        self.assertEqual(limit.limit, 4.0)
+
+    def test_maximum(self):
+        limit = NtoConcurrencyLimit(4, 1, 6)
+        for i in range(50):
+            limit_requests_in_flight(limit, 0.01)
+        self.assertEqual(limit.limit, 6.0)
+
+    def test_multiplicative_decrease_on_overload(self):
+        limit = NtoConcurrencyLimit(8, 1, 16)
+        limit_request(limit, 0.01, 'overload')
+        self.assertEqual(limit.limit, 4.0)
+        self.assertEqual(limit.state()['overloads'], 1)
+        self.assertEqual(limit.state()['decreases'], 1)
+
+    def test_decrease_once_per_round_trip(self):
+        limit = NtoConcurrencyLimit(8, 1, 16)
+        limit_request(limit, 60.0)
+        limit_requests_in_flight(limit, 60.0, 'overload')
+        self.assertEqual(limit.limit, 4.0)
+        self.assertEqual(limit.state()['overloads'], 8)
+        self.assertEqual(limit.state()['decreases'], 1)
+
+    def test_minimum(self):
+        limit = NtoConcurrencyLimit(4, 1, 8)
+        for i in range(5):
+            limit.last_decrease = 0.0
+            limit_request(limit, 0.01, 'overload')
+        self.assertEqual(limit.limit, 1.0)
+
+    def test_failed_requests_keep_limit(self):
+        limit = NtoConcurrencyLimit(4, 1, 8)
+        limit_requests_in_flight(limit, 0.01, 'failed')
+        self.assertEqual(limit.limit, 4.0)
+        self.assertEqual(limit.state()['overloads'], 0)
+
+    def test_latency_overload(self):
+        limit = NtoConcurrencyLimit(8, 1, 16)
+        for i in range(5):
+            limit_request(limit, 0.01)
+        for i in range(5):
+            limit_request(limit, 1.0)
+        self.assertEqual(limit.limit, 4.0)
+        self.assertEqual(limit.state()['decreases'], 1)
+
+    def test_slow_endpoint_is_not_overload(self):
+        # Bulk reads are slower than reads of a single port, even on an idle NPB
+        limit = NtoConcurrencyLimit(8, 1, 16)
+        for i in range(20):
+            limit_request(limit, 0.01, endpoint='getPort')
+            limit_request(limit, 2.0, endpoint='GET /api/ports')
+        self.assertEqual(limit.limit, 8.0)
+        self.assertEqual(limit.state()['overloads'], 0)
+        self.assertEqual(sorted(limit.state()['endpoints']), ['GET /api/ports', 'getPort'])
+
+if __name__ == '__main__':
+    unittest.main()
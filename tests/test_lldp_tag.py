@@ -0,0 +1,120 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_lldp_tag.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of matching tags in LLDP port descriptions, and of tagging ports of a mock NPB with them
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import ixvision_ztp_ntolib
+from ixvision_ztp_lldp_tag import LldpTagMatcher, merge_port_keywords, tag_ports
+from ixvision_ztp_mock import MockVisionWebApi, mock_device, mock_reset_devices
+from ixvision_ztp_ntolib import nto_reset_sessions
+
+connection = ('mock-lldptag', '8000', 'admin', 'admin')
+
+class LldpTagMatcherTest(unittest.TestCase):
+    def test_matches_in_supplied_order(self):
+        matcher = LldpTagMatcher(['SPAN', 'TAP', 'probe'])
+        self.assertEqual(matcher.match('TAP core-sw1 SPAN'), ['SPAN', 'TAP'])
+        self.assertEqual(matcher.match('uplink mgmt-sw1'), [])
+        self.assertEqual(matcher.match(None), [])
+    
+    def test_overlapping_tags(self):
+        # Tags that are suffixes or parts of other tags are found through fallback links
+        matcher = LldpTagMatcher(['he', 'she', 'his', 'hers'])
+        self.assertEqual(matcher.match('ushers'), ['he', 'she', 'hers'])
+        self.assertEqual(LldpTagMatcher(['abcd', 'bc']).match('abce'), ['bc'])
+    
+    def test_ignore_case(self):
+        self.assertEqual(LldpTagMatcher(['probe']).match('PROBE analyzer1'), [])
+        self.assertEqual(LldpTagMatcher(['probe'], ignore_case=True).match('PROBE analyzer1'), ['probe'])
+    
+    def test_whole_word(self):
+        matcher = LldpTagMatcher(['TAP'], whole_word=True)
+        self.assertEqual(matcher.match('TAPE drive'), [])
+        self.assertEqual(matcher.match('SPANTAP'), [])
+        self.assertEqual(matcher.match('core TAP-1'), ['TAP'])
+        self.assertEqual(matcher.match('TAP'), ['TAP'])
+    
+    def test_empty_and_duplicate_tags_ignored(self):
+        matcher = LldpTagMatcher(['', 'TAP', 'TAP'])
+        self.assertEqual(matcher.tags, ['TAP'])
+        self.assertEqual(matcher.match('TAP TAP'), ['TAP'])
+
+class MergePortKeywordsTest(unittest.TestCase):
+    def test_merge_keeps_order_and_skips_duplicates_regardless_of_case(self):
+        self.assertEqual(merge_port_keywords(['ZTP', 'TAP'], ['tap', 'probe', 'PROBE']), ['ZTP', 'TAP', 'probe'])
+        self.assertEqual(merge_port_keywords(None, ['TAP']), ['TAP'])
+
+class TagPortsTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='ixvztp_test_')
+        self.start_dir = os.getcwd()
+        os.chdir(self.work_dir)
+        mock_reset_devices()
+        nto_reset_sessions()
+        self.client_factory = ixvision_ztp_ntolib.nto_client_factory
+        ixvision_ztp_ntolib.nto_client_factory = MockVisionWebApi
+        self.device = mock_device(connection[0], {'port_count': 8})
+        # Bring up every cabled port with the settings its link partner expects, so that its LLDP neighbor shows up
+        for port_id in self.device.ports:
+            partner = self.device.port_partners[port_id]['partner']
+            if partner is None or port_id == 7:
+                continue
+            self.device.ports[port_id].update({'enabled': True, 'lldp_receive_enabled': True})
+            for key in partner:
+                if isinstance(partner[key], dict):
+                    self.device.ports[port_id][key].update(partner[key])
+                else:
+                    self.device.ports[port_id][key] = partner[key]
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        nto_reset_sessions()
+        ixvision_ztp_ntolib.nto_client_factory = self.client_factory
+        os.chdir(self.start_dir)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def keywords(self):
+        return dict([(self.device.ports[port_id]['name'], self.device.ports[port_id]['keywords']) for port_id in self.device.ports if len(self.device.ports[port_id]['keywords']) > 0])
+
+    def test_stale_tags_with_different_tag_settings(self):
+        self.assertTrue(tag_ports(*connection, tags=['TAP', 'SPAN']))
+        self.assertEqual(self.keywords(), {'P01': ['TAP'], 'P02': ['SPAN'], 'P04': ['TAP']})
+        # Only tags in the new tag list can be stale, SPAN was asked for by the previous run only
+        self.device.port_partners[4]['description'] = 'uplink edge-sw1 Te1/4'
+        self.assertTrue(tag_ports(*connection, tags=['TAP']))
+        self.assertEqual(self.keywords(), {'P01': ['TAP'], 'P02': ['SPAN']})
+        self.assertTrue(tag_ports(*connection, tags=['probe'], ignore_case=True))
+        self.assertEqual(self.keywords(), {'P01': ['TAP'], 'P02': ['SPAN'], 'P03': ['PROBE'], 'P05': ['PROBE']})
+
+    def test_stale_tags_with_same_tag_settings(self):
+        self.assertTrue(tag_ports(*connection, tags=['TAP', 'SPAN']))
+        self.device.port_partners[2]['description'] = 'uplink dist-sw1 Eth1/2'
+        self.assertTrue(tag_ports(*connection, tags=['TAP', 'SPAN']))
+        self.assertEqual(self.keywords(), {'P01': ['TAP'], 'P04': ['TAP']})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_ntolib.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of the common library of methods for interacting with Vision NPBs
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import unittest
+
+from ixvision_ztp_ntolib import nto_properties_diff
+
+class PropertiesDiffTest(unittest.TestCase):
+    def test_id_lists_compared_as_sets(self):
+        port_group = {'id': 5, 'port_list': [3, 1, 2], 'mode': 'NETWORK'}
+        self.assertEqual(nto_properties_diff(port_group, {'port_list': [1, 2, 3]}), {})
+        self.assertEqual(nto_properties_diff(port_group, {'port_list': [1, 2]}), {'port_list': [1, 2]})
+    
+    def test_keywords_compared_as_sets_regardless_of_case(self):
+        port = {'id': 1, 'keywords': ['ZTP', 'TAP']}
+        self.assertEqual(nto_properties_diff(port, {'keywords': ['tap', 'ztp']}), {})
+        self.assertEqual(nto_properties_diff(port, {'keywords': ['tap']}), {'keywords': ['tap']})
+    
+    def test_nested_and_plain_properties(self):
+        port = {'id': 1, 'mode': 'NETWORK', 'forward_error_correction_settings': {'enabled': False, 'fec_type': 'RS_FEC'}}
+        self.assertEqual(nto_properties_diff(port, {'forward_error_correction_settings': {'enabled': False}}), {})
+        self.assertEqual(nto_properties_diff(port, {'mode': 'TOOL'}), {'mode': 'TOOL'})
+        # Other lists, like filter criteria values, keep their order
+        self.assertEqual(nto_properties_diff({'addr': ['b', 'a']}, {'addr': ['a', 'b']}), {'addr': ['a', 'b']})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_policy.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of compilation of a policy into steps and their dependencies
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import ixvision_ztp_ntolib
+from ixvision_ztp_mock import MockVisionWebApi, mock_device, mock_reset_devices
+from ixvision_ztp_ntolib import nto_reset_sessions
+from ixvision_ztp_policy import apply_policy, compile_policy, policy_report
+
+connection = ('mock-policy', '8000', 'admin', 'admin')
+
+# Names of the steps each step depends on, by step name
+def policy_depends(steps):
+    return dict([(step['name'], [steps[depend_index]['name'] for depend_index in step['depends']]) for step in steps])
+
+class CompilePolicyTest(unittest.TestCase):
+    def test_dependencies(self):
+        steps = compile_policy({
+            'tags': ['TAP', 'TOOL'],
+            'port_modes': [{'tags': 'TAP', 'mode': 'net'}, {'tags': 'TOOL', 'mode': 'tool'}],
+            'port_groups': [{'name': 'TAP', 'tags': 'TAP', 'mode': 'net'}, {'name': 'TOOL', 'tags': 'TOOL', 'mode': 'lb'}],
+            'filters': [{'name': 'TAP-TOOL', 'input': 'TAP', 'output': 'TOOL', 'mode': 'all'}]})
+        self.assertEqual(policy_depends(steps), {
+            'tag_ports': [],
+            'set_port_mode:net:TAP': ['tag_ports'],
+            'set_port_mode:tool:TOOL': ['tag_ports'],
+            'form_port_groups:TAP': ['tag_ports'],
+            'form_port_groups:TOOL': ['tag_ports'],
+            'form_dynamic_filter:TAP-TOOL': ['form_port_groups:TAP', 'form_port_groups:TOOL']})
+        self.assertEqual([step['port_tags'] for step in steps], [None, ['TAP'], ['TOOL'], ['TAP'], ['TOOL'], None])
+
+    def test_unrelated_port_groups_are_independent(self):
+        steps = compile_policy({'port_groups': [{'name': 'TAP', 'tags': 'TAP', 'mode': 'net'}, {'name': 'TOOL', 'tags': 'TOOL', 'mode': 'lb'}]})
+        self.assertEqual(policy_depends(steps), {'form_port_groups:TAP': [], 'form_port_groups:TOOL': []})
+
+    def test_filters_over_different_groups_are_independent(self):
+        steps = compile_policy({'filters': [{'name': 'A', 'input': 'TAP1', 'output': 'TOOL1', 'mode': 'all'},
+                                            {'name': 'B', 'input': 'TAP2', 'output': 'TOOL2', 'mode': 'all'},
+                                            {'name': 'C', 'input': 'TAP3', 'output': 'TOOL3', 'mode': 'all', 'tag_mode': True}]})
+        self.assertEqual(policy_depends(steps), {'form_dynamic_filter:A': [], 'form_dynamic_filter:B': [], 'form_dynamic_filter:C': []})
+        self.assertEqual(steps[2]['port_tags'], ['TAP3', 'TOOL3'])
+
+    def test_invalid_policies(self):
+        self.assertIsNone(compile_policy({'rules': []}))
+        self.assertIsNone(compile_policy({'tags': []}))
+        self.assertIsNone(compile_policy({'port_modes': [{'tags': 'TAP', 'mode': 'bypass'}]}))
+        self.assertIsNone(compile_policy({'port_groups': [{'tags': 'TAP', 'mode': 'net'}]}))
+        self.assertIsNone(compile_policy({'filters': [{'name': 'A', 'input': 'TAP', 'output': 'TOOL', 'mode': 'pbc'}]}))
+        self.assertIsNone(compile_policy({'port_modes': [{'tags': 'TAP', 'mode': 'net'}, {'tags': 'TAP', 'mode': 'net'}]}))
+
+class ApplyPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='ixvztp_test_')
+        self.start_dir = os.getcwd()
+        os.chdir(self.work_dir)
+        mock_reset_devices()
+        nto_reset_sessions()
+        self.client_factory = ixvision_ztp_ntolib.nto_client_factory
+        ixvision_ztp_ntolib.nto_client_factory = MockVisionWebApi
+        self.device = mock_device(connection[0], {'port_count': 8})
+        for port_id, keyword in [(1, 'PROBE'), (2, 'PROBE'), (4, 'TOOL'), (5, 'TOOL')]:
+            self.device.ports[port_id].update({'enabled': True, 'keywords': [keyword]})
+    
+    def tearDown(self):
+        nto_reset_sessions()
+        ixvision_ztp_ntolib.nto_client_factory = self.client_factory
+        os.chdir(self.start_dir)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+    
+    def apply(self, policy):
+        with open('policy.json', 'w') as f:
+            json.dump(policy, f)
+        apply_policy(*connection, policy_file='policy.json')
+        return dict([(step['name'], step['status']) for step in policy_report['steps']])
+    
+    def report_step(self, name):
+        return [step for step in policy_report['steps'] if step['name'] == name][0]
+    
+    def test_unrelated_port_groups_run_in_parallel(self):
+        self.device.fixtures['latency'] = 0.01
+        step_status = self.apply({'port_groups': [{'name': 'PROBES', 'tags': 'PROBE', 'mode': 'net'}, {'name': 'TOOLS', 'tags': 'TOOL', 'mode': 'lb'}]})
+        self.assertEqual(step_status, {'form_port_groups:PROBES': 'done', 'form_port_groups:TOOLS': 'done'})
+        probes_step, tools_step = self.report_step('form_port_groups:PROBES'), self.report_step('form_port_groups:TOOLS')
+        self.assertEqual(tools_step['after'], [])
+        self.assertLess(tools_step['start'], probes_step['start'] + probes_step['seconds'])
+    
+    def test_steps_writing_same_ports_run_in_order(self):
+        # Port 1 is selected by both steps, through different tags
+        self.device.ports[1]['keywords'] = ['PROBE', 'TAP']
+        step_status = self.apply({'port_modes': [{'tags': 'TAP', 'mode': 'tool'}],
+                                  'port_groups': [{'name': 'PROBES', 'tags': 'PROBE', 'mode': 'lb'}, {'name': 'TOOLS', 'tags': 'TOOL', 'mode': 'lb'}]})
+        self.assertEqual(set(step_status.values()), set(['done']))
+        mode_step, probes_step = self.report_step('set_port_mode:tool:TAP'), self.report_step('form_port_groups:PROBES')
+        self.assertEqual(probes_step['after'], ['set_port_mode:tool:TAP'])
+        self.assertGreaterEqual(probes_step['start'], mode_step['start'] + mode_step['seconds'])
+        self.assertEqual(self.report_step('form_port_groups:TOOLS')['after'], [])
+        self.assertEqual(self.device.ports[1]['port_group_id'], self.device.ports[2]['port_group_id'])
+    
+    def test_failed_step_without_error_skips_dependents(self):
+        # The existing Legacy group is a network group, so it can't be formed as a load balanced one. The action only reports it
+        step_status = self.apply({'port_groups': [{'name': 'TOOLS', 'tags': 'TOOL', 'mode': 'lb'}, {'name': 'Legacy', 'tags': 'PROBE', 'mode': 'lb'}],
+                                  'filters': [{'name': 'PROBE-TOOLS', 'input': 'Legacy', 'output': 'TOOLS', 'mode': 'all'}]})
+        self.assertEqual(step_status, {'form_port_groups:Legacy': 'failed', 'form_port_groups:TOOLS': 'done', 'form_dynamic_filter:PROBE-TOOLS': 'skipped'})
+        self.assertNotIn('PROBE-TOOLS', [df['name'] for df in self.device.filters.values()])
+    
+    def test_filter_fails_without_its_port_group(self):
+        step_status = self.apply({'filters': [{'name': 'PROBE-TOOLS', 'input': 'PROBES', 'output': 'Legacy', 'mode': 'all'}]})
+        self.assertEqual(step_status, {'form_dynamic_filter:PROBE-TOOLS': 'failed'})
+    
+    def test_steps_done(self):
+        step_status = self.apply({'port_groups': [{'name': 'PROBES', 'tags': 'PROBE', 'mode': 'net'}, {'name': 'TOOLS', 'tags': 'TOOL', 'mode': 'lb'}],
+                                  'filters': [{'name': 'PROBE-TOOLS', 'input': 'PROBES', 'output': 'TOOLS', 'mode': 'all'}]})
+        self.assertEqual(set(step_status.values()), set(['done']))
+        self.assertIn('PROBE-TOOLS', [df['name'] for df in self.device.filters.values()])
+
+if __name__ == '__main__':
+    unittest.main()
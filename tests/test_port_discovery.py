@@ -0,0 +1,91 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_port_discovery.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of the port discovery journal, and of resuming a discovery from it
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import ixvision_ztp_ntolib
+from ixvision_ztp_mock import MockVisionWebApi, mock_device, mock_reset_devices
+from ixvision_ztp_ntolib import nto_reset_sessions
+from ixvision_ztp_port_discovery import discover_ports, load_portup_journal, portup_journal_file_suffix
+
+connection = ('mock-portup', '8000', 'admin', 'admin')
+
+class PortDiscoveryJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='ixvztp_test_')
+        self.start_dir = os.getcwd()
+        os.chdir(self.work_dir)
+        mock_reset_devices()
+        nto_reset_sessions()
+        self.client_factory = ixvision_ztp_ntolib.nto_client_factory
+        ixvision_ztp_ntolib.nto_client_factory = MockVisionWebApi
+        self.device = mock_device(connection[0], {'port_count': 8})
+        self.get_port = MockVisionWebApi.getPort
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        MockVisionWebApi.getPort = self.get_port
+        nto_reset_sessions()
+        ixvision_ztp_ntolib.nto_client_factory = self.client_factory
+        os.chdir(self.start_dir)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def journal(self):
+        return load_portup_journal(connection[0] + portup_journal_file_suffix)
+
+    def test_unread_port_is_retried_on_resume(self):
+        get_port = self.get_port
+        def get_port_failing(self, port_key):
+            if str(port_key) == '3':
+                raise Exception('Request failed with status 503')
+            return get_port(self, port_key)
+        MockVisionWebApi.getPort = get_port_failing
+        self.assertFalse(discover_ports(*connection, link_timeout=0))
+        journal = self.journal()
+        self.assertEqual(journal['phase'], 'finalize')
+        self.assertEqual(journal['ports']['3']['state'], 'retry')
+        self.assertFalse(self.device.ports[3]['enabled'])
+
+        MockVisionWebApi.getPort = self.get_port
+        discover_ports(*connection, link_timeout=0, resume=True)
+        journal = self.journal()
+        self.assertEqual(journal['phase'], 'done')
+        self.assertIn(journal['ports']['3']['state'], ('up', 'down'))
+        self.assertTrue(journal['ports']['3']['finalized'])
+
+    def test_time_to_link_up_from_first_attempt(self):
+        self.assertTrue(discover_ports(*connection, link_timeout=0))
+        journal = self.journal()
+        self.assertEqual(journal['phase'], 'done')
+        up_ports = [port_id for port_id in journal['ports'] if journal['ports'][port_id]['state'] == 'up']
+        self.assertGreater(len(up_ports), 0)
+        for port_id in up_ports:
+            self.assertIsNotNone(journal['ports'][port_id]['first_attempt'])
+        self.assertIn('seconds since the first attempt', sys.stdout.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
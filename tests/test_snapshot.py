@@ -0,0 +1,89 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_snapshot.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of configuration snapshots and rollback against a mock NPB
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ixvision_ztp_ntolib
+from ixvision_ztp_mock import MockVisionWebApi, mock_device, mock_reset_devices
+from ixvision_ztp_ntolib import nto_connect, nto_reset_sessions
+from ixvision_ztp_port_group import form_port_groups
+from ixvision_ztp_snapshot import rollback_to_snapshot, snapshot_save, take_snapshot
+
+connection = ('mock-snapshot', '8000', 'admin', 'admin')
+
+class RollbackTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='ixvztp_test_')
+        self.start_dir = os.getcwd()
+        os.chdir(self.work_dir)
+        mock_reset_devices()
+        nto_reset_sessions()
+        self.client_factory = ixvision_ztp_ntolib.nto_client_factory
+        ixvision_ztp_ntolib.nto_client_factory = MockVisionWebApi
+        self.device = mock_device(connection[0], {'port_count': 8})
+        for port_id in [1, 2, 3]:
+            self.device.ports[port_id].update({'enabled': True, 'keywords': ['PROBE']})
+    
+    def tearDown(self):
+        nto_reset_sessions()
+        ixvision_ztp_ntolib.nto_client_factory = self.client_factory
+        os.chdir(self.start_dir)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+    
+    def rollback(self, dry_run=False):
+        nto_reset_sessions()
+        rollback_to_snapshot(*connection, dry_run=dry_run)
+    
+    def port_modes(self):
+        return [self.device.ports[port_id]['mode'] for port_id in [1, 2, 3]]
+    
+    def test_rollback_deletes_ztp_port_group(self):
+        take_snapshot(*connection)
+        form_port_groups(*connection, tags=['PROBE'], pg_name='PROBES', pg_mode_key='lb')
+        self.assertEqual(self.port_modes(), ['TOOL', 'TOOL', 'TOOL'])
+        
+        self.rollback(dry_run=True)
+        self.assertIn('PROBES', [port_group['name'] for port_group in self.device.port_groups.values()])
+        
+        self.rollback()
+        self.assertNotIn('PROBES', [port_group['name'] for port_group in self.device.port_groups.values()])
+        self.assertIn('Legacy', [port_group['name'] for port_group in self.device.port_groups.values()])
+        self.assertEqual(self.port_modes(), ['NETWORK', 'NETWORK', 'NETWORK'])
+        self.assertEqual([self.device.ports[port_id]['port_group_id'] for port_id in [1, 2, 3]], [None, None, None])
+    
+    def test_rollback_refuses_with_objects_not_created_by_ztp(self):
+        take_snapshot(*connection)
+        form_port_groups(*connection, tags=['PROBE'], pg_name='PROBES', pg_mode_key='lb')
+        nto_connect(*connection).createFilter({'name': 'Manual', 'keywords': ['OPS'], 'mode': 'PASS_ALL'})
+        
+        self.rollback()
+        self.assertEqual(sorted(df['name'] for df in self.device.filters.values()), ['Legacy', 'Manual'])
+        self.assertIn('PROBES', [port_group['name'] for port_group in self.device.port_groups.values()])
+        self.assertEqual(self.port_modes(), ['TOOL', 'TOOL', 'TOOL'])
+    
+    def test_rollback_of_ports_refuses_with_new_port_group_memberships(self):
+        snapshot_save(connection[0], {'port': [self.device.port_details(port_id) for port_id in [1, 2, 3]]}, 'portup')
+        form_port_groups(*connection, tags=['PROBE'], pg_name='PROBES', pg_mode_key='lb')
+        
+        self.rollback()
+        self.assertIn('PROBES', [port_group['name'] for port_group in self.device.port_groups.values()])
+        self.assertEqual(self.port_modes(), ['TOOL', 'TOOL', 'TOOL'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_watch.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of the watch mode against a mock NPB
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import argparse
+import unittest
+
+import ixvision_ztp_ntolib
+import ixvision_ztp_watch
+from ixvision_ztp_mock import MockVisionWebApi, mock_reset_devices
+from ixvision_ztp_ntolib import nto_reset_sessions, nto_sessions
+from ixvision_ztp_watch import watch_npb, watch_report
+
+class WatchTest(unittest.TestCase):
+    def setUp(self):
+        mock_reset_devices()
+        nto_reset_sessions()
+        self.client_factory = ixvision_ztp_ntolib.nto_client_factory
+        ixvision_ztp_ntolib.nto_client_factory = MockVisionWebApi
+        watch_report.update({'cycles': 0, 'failed_cycles': 0, 'last_error': None})
+    
+    def tearDown(self):
+        nto_reset_sessions()
+        ixvision_ztp_ntolib.nto_client_factory = self.client_factory
+    
+    def test_failed_cycle_does_not_stop_watch(self):
+        step_sessions = []
+        def run_step(host_ip, port, username, password, step_args):
+            step_sessions.append(list(nto_sessions.values()))
+            if len(step_sessions) == 1:
+                raise Exception("408 Request Timeout")
+        steps = [('lldptag -t TAP', argparse.Namespace(subparser_name='lldptag'))]
+        watch_npb('mock-watch', '8000', 'admin', 'admin', steps, run_step, interval=0, jitter=0, cycles=3)
+        
+        # The failed cycle left no state behind, so the next cycle sees all the state as changed and runs the step again, over a new session
+        self.assertEqual(len(step_sessions), 2)
+        self.assertNotEqual(step_sessions[0], step_sessions[1])
+        self.assertEqual(watch_report['cycles'], 3)
+        self.assertEqual(watch_report['failed_cycles'], 1)
+        self.assertIn('408 Request Timeout', watch_report['last_error'])
+    
+    def test_failed_poll_does_not_stop_watch(self):
+        poll_state = ixvision_ztp_watch.watch_poll_state
+        poll_count = []
+        def failing_poll_state(nto):
+            poll_count.append(nto)
+            if len(poll_count) == 1:
+                raise Exception("401 Unauthorized")
+            return poll_state(nto)
+        ixvision_ztp_watch.watch_poll_state = failing_poll_state
+        try:
+            watch_npb('mock-watch', '8000', 'admin', 'admin', [], lambda *args: None, interval=0, jitter=0, cycles=2)
+        finally:
+            ixvision_ztp_watch.watch_poll_state = poll_state
+        self.assertEqual(len(poll_count), 2)
+        self.assertEqual(watch_report['failed_cycles'], 1)
+
+if __name__ == '__main__':
+    unittest.main()